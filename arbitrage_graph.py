@@ -0,0 +1,251 @@
+"""
+arbitrage_graph.py
+
+This module finds arbitrage cycles across assets and exchanges. Every (exchange, asset) pair is a node and every
+market adds two edges: selling the base asset at the best bid and buying it at the best ask, both after the taker
+fee. An edge weighs -log(rate), so a cycle is profitable when its weights add up to less than zero. Cycles can stay
+on one exchange (triangular arbitrage) or move an asset between exchanges.
+
+When a market changes only its two edges are updated, and only the cycles through changed edges are searched again.
+"""
+import math
+
+import pandas as pd
+
+from orderbook_preparation import taker_fee_rates
+
+
+class Edge:
+    """
+    Conversion of one asset into another: 'amount' of the source asset becomes 'amount * rate' of the target asset.
+    """
+    __slots__ = ('source', 'target', 'rate', 'weight', 'capacity', 'market', 'transfer')
+
+    def __init__(self, source, target, rate, capacity, market=None):
+        """
+        Parameters:
+        - source (tuple): Source node (exchange, asset).
+        - target (tuple): Target node (exchange, asset).
+        - rate (float): Units of the target asset received per unit of the source asset, after fees.
+        - capacity (float): Largest amount of the source asset the edge can convert, inf if not limited.
+        - market (tuple): Market of the edge as (exchange, symbol, 'Bid' or 'Ask'), None for transfers.
+        """
+        self.source = source
+        self.target = target
+        self.market = market
+        self.transfer = market is None
+        self.set_rate(rate, capacity)
+
+    def set_rate(self, rate, capacity):
+        """
+        Updates the rate and capacity of the edge.
+        """
+        self.rate = rate
+        self.weight = -math.log(rate)
+        self.capacity = capacity
+
+
+class ArbitrageGraph:
+    """
+    Graph of (exchange, asset) nodes with fee-adjusted log-price edges, updated one market at a time.
+    """
+
+    def __init__(self, fee_table, transfer_costs=None, default_transfer_cost=0.0):
+        """
+        Parameters:
+        - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+        - transfer_costs (dict): Cost rate of moving an asset between exchanges, by asset (e.g., {'BTC': 0.0005}).
+        - default_transfer_cost (float): Cost rate of the assets not in 'transfer_costs'. Use None to not move
+          assets between exchanges, e.g. to only find triangular cycles.
+        """
+        self.fee_table = fee_table
+        self.transfer_costs = transfer_costs or {}
+        self.default_transfer_cost = default_transfer_cost
+        self.edges = {}
+        self.markets = {}
+        self.exchanges_by_asset = {}
+        self.changed_edges = set()
+        self.updates = 0
+
+    def __len__(self):
+        return len(self.markets)
+
+    def nodes(self):
+        """
+        Returns:
+        - list: All (exchange, asset) nodes.
+        """
+        return list(self.edges)
+
+    def update_market(self, exchange, symbol, best_bid=None, best_ask=None):
+        """
+        Updates the two edges of a market from its best bid and ask. A missing side removes its edge.
+
+        Parameters:
+        - exchange (str): Name of the exchange.
+        - symbol (str): Unified trading symbol (e.g., 'ETH/BTC').
+        - best_bid (tuple): Best bid as (price, quantity), quantity in the base asset.
+        - best_ask (tuple): Best ask as (price, quantity), quantity in the base asset.
+        """
+        self.updates += 1
+        base, quote = symbol.split('/')
+        base_node = (exchange, base)
+        quote_node = (exchange, quote)
+        self._add_node(base_node)
+        self._add_node(quote_node)
+        taker_fee = taker_fee_rates([exchange], self.fee_table)[0]
+
+        # Selling the base asset at the bid, the bid quantity limits how much base can be sold
+        if best_bid is not None and best_bid[0] > 0 and best_bid[1] > 0:
+            price, quantity = best_bid
+            self._set_edge(base_node, quote_node, price * (1 - taker_fee), quantity, (exchange, symbol, 'Bid'))
+        else:
+            self._remove_edge(base_node, quote_node)
+
+        # Buying the base asset at the ask, paid in the quote asset including the fee
+        if best_ask is not None and best_ask[0] > 0 and best_ask[1] > 0:
+            price, quantity = best_ask
+            self._set_edge(quote_node, base_node, 1 / (price * (1 + taker_fee)), quantity * price * (1 + taker_fee), (exchange, symbol, 'Ask'))
+        else:
+            self._remove_edge(quote_node, base_node)
+        self.markets[(exchange, symbol)] = (best_bid, best_ask)
+
+    def update_from_orders(self, symbol, orders):
+        """
+        Updates the markets of a symbol on every exchange from an order list returned by data_fetch.
+
+        Parameters:
+        - symbol (str): Unified trading symbol of the orders.
+        - orders (list): Orders as tuples (price, quantity, ask/bid, exchange).
+        """
+        best_bids = {}
+        best_asks = {}
+        for price, quantity, ask_bid, exchange in orders:
+            price, quantity = float(price), float(quantity)
+            if ask_bid == 'Bid':
+                if exchange not in best_bids or price > best_bids[exchange][0]:
+                    best_bids[exchange] = (price, quantity)
+            elif exchange not in best_asks or price < best_asks[exchange][0]:
+                best_asks[exchange] = (price, quantity)
+        for exchange in dict.fromkeys(list(best_bids) + list(best_asks)):
+            self.update_market(exchange, symbol, best_bids.get(exchange), best_asks.get(exchange))
+
+    def remove_market(self, exchange, symbol):
+        """
+        Removes the edges of a market, e.g. when its book is out of sync.
+        """
+        self.update_market(exchange, symbol)
+        self.markets.pop((exchange, symbol), None)
+
+    def profitable_cycles(self, max_hops=4, min_profit=0.0, full=False):
+        """
+        Finds the profitable cycles through the edges changed since the last search.
+
+        Parameters:
+        - max_hops (int): Maximum number of edges of a cycle.
+        - min_profit (float): Minimum profit rate of a cycle (e.g., 0.001 for 0.1%).
+        - full (bool): Search through all edges instead of the changed ones.
+
+        Returns:
+        - list: Cycles as dictionaries with the 'path' of (exchange, asset) nodes from and back to the first node,
+          the 'markets' traded, the 'rate' and 'profit_rate' of the cycle and the largest 'amount' of the first asset
+          the best levels allow. Sorted by profit rate, the most profitable first.
+        """
+        if full:
+            start_edges = [edge for targets in self.edges.values() for edge in targets.values()]
+        else:
+            start_edges = [edge for edge in self.changed_edges if self.edges.get(edge.source, {}).get(edge.target) is edge]
+        self.changed_edges = set()
+
+        max_weight = -math.log1p(min_profit)
+        cycles = {}
+        for edge in start_edges:
+            if edge.transfer:
+                # Every profitable cycle has a market edge, searching from those finds it
+                continue
+            for cycle_edges in self._cycles_through(edge, max_hops, max_weight):
+                key = self._canonical(cycle_edges)
+                if key not in cycles:
+                    cycles[key] = self._describe(cycle_edges)
+        return sorted(cycles.values(), key=lambda cycle: cycle['profit_rate'], reverse=True)
+
+    def _add_node(self, node):
+        if node in self.edges:
+            return
+        self.edges[node] = {}
+        exchange, asset = node
+        others = self.exchanges_by_asset.setdefault(asset, [])
+        transfer_cost = self.transfer_costs.get(asset, self.default_transfer_cost)
+        if transfer_cost is not None:
+            # Moving the asset to and from the other exchanges that have it
+            for other_exchange in others:
+                other = (other_exchange, asset)
+                self._set_edge(node, other, 1 - transfer_cost, math.inf)
+                self._set_edge(other, node, 1 - transfer_cost, math.inf)
+        others.append(exchange)
+
+    def _set_edge(self, source, target, rate, capacity, market=None):
+        edge = self.edges[source].get(target)
+        if edge is None:
+            edge = Edge(source, target, rate, capacity, market)
+            self.edges[source][target] = edge
+        else:
+            edge.set_rate(rate, capacity)
+        self.changed_edges.add(edge)
+
+    def _remove_edge(self, source, target):
+        edge = self.edges[source].get(target)
+        if edge is not None and not edge.transfer:
+            del self.edges[source][target]
+
+    def _cycles_through(self, first_edge, max_hops, max_weight):
+        # Depth-first search of the paths back from the target of the edge to its source
+        start = first_edge.source
+        path = [first_edge]
+        visited = {start, first_edge.target}
+        found = []
+
+        def extend(node, weight):
+            for target, edge in self.edges[node].items():
+                # Two transfers in a row are one transfer
+                if edge.transfer and path[-1].transfer:
+                    continue
+                if target == start:
+                    if weight + edge.weight < max_weight and not (edge.transfer and path[0].transfer):
+                        found.append(path + [edge])
+                    continue
+                if target in visited or len(path) + 1 >= max_hops:
+                    continue
+                visited.add(target)
+                path.append(edge)
+                extend(target, weight + edge.weight)
+                path.pop()
+                visited.discard(target)
+
+        extend(first_edge.target, first_edge.weight)
+        return found
+
+    def _canonical(self, cycle_edges):
+        # The same cycle found from another edge is a rotation of it
+        nodes = [edge.source for edge in cycle_edges]
+        first = nodes.index(min(nodes))
+        return tuple(nodes[first:] + nodes[:first])
+
+    def _describe(self, cycle_edges):
+        # Start the cycle with a trade, at the same node however the cycle was found
+        first = min((edge.source, position) for position, edge in enumerate(cycle_edges) if not edge.transfer)[1]
+        cycle_edges = cycle_edges[first:] + cycle_edges[:first]
+        rate = 1.0
+        amount = math.inf
+        for edge in cycle_edges:
+            # Capacity of the edge in units of the first asset of the cycle
+            amount = min(amount, edge.capacity / rate)
+            rate *= edge.rate
+        return {
+            'path': [edge.source for edge in cycle_edges] + [cycle_edges[0].source],
+            'markets': [edge.market for edge in cycle_edges if not edge.transfer],
+            'rate': rate,
+            'profit_rate': rate - 1,
+            'amount': amount,
+            'timestamp': pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
@@ -0,0 +1,261 @@
+"""
+batch_matching.py
+
+This module matches many order book snapshots at once, e.g. a recorded day for a replay, a fee sweep or a scan of
+many symbols. The snapshots are stacked into padded arrays, one row per snapshot, and the greedy sweep of
+matching_engine runs on all rows together, so the Python overhead is paid per sweep step instead of per snapshot.
+
+Every snapshot is matched on its own, like a pipeline with an empty ledger: the fills of one snapshot do not lower
+the quantities of the next.
+"""
+import numpy as np
+
+from order_book import OrderBook, ASK, BID
+from orderbook_preparation import taker_fee_rates
+from snapshot_recorder import LEVEL_DTYPE, read_snapshot_levels
+
+
+class BookBatch:
+    """
+    Order book snapshots stacked per side into padded arrays of shape (snapshots, levels).
+
+    Every row holds the levels of one snapshot that can be matched: the asks below its best bid and the bids above
+    its best ask, the levels the crossing book of VenueBooks keeps. Both sides are sorted by net price in ascending
+    order, the padding has net prices that never cross and no quantity.
+    """
+    __slots__ = ('ask_net_price', 'ask_remaining', 'ask_venue', 'ask_count', 'bid_net_price', 'bid_remaining', 'bid_venue', 'bid_count',
+                 'venues', 'timestamps')
+
+    def __init__(self, ask_net_price, ask_remaining, ask_venue, ask_count, bid_net_price, bid_remaining, bid_venue, bid_count, venues, timestamps=None):
+        self.ask_net_price = ask_net_price
+        self.ask_remaining = ask_remaining
+        self.ask_venue = ask_venue
+        self.ask_count = ask_count
+        self.bid_net_price = bid_net_price
+        self.bid_remaining = bid_remaining
+        self.bid_venue = bid_venue
+        self.bid_count = bid_count
+        self.venues = tuple(venues)
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.ask_count)
+
+    @classmethod
+    def from_books(cls, books):
+        """
+        Stacks order books, e.g. the crossing books of many snapshots or symbols.
+
+        Parameters:
+        - books (list): Order books with net prices and remaining quantities, see calculate_fees and
+          update_filled_orders.
+
+        Returns:
+        - BookBatch: One row per book.
+        """
+        book = OrderBook.concatenate(books)
+        snapshot = np.repeat(np.arange(len(books)), [len(book) for book in books])
+        return cls._stack(snapshot, book.side, book.net_price, book.remaining, book.venue, len(books), book.venues)
+
+    @classmethod
+    def from_recording(cls, file_path, fee_table):
+        """
+        Stacks every snapshot of a recording, with the taker fees of the fee table.
+
+        Parameters:
+        - file_path (str or Path): Path of the recording, see SnapshotRecorder.
+        - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+
+        Returns:
+        - BookBatch: One row per snapshot, with the timestamps of the snapshots.
+
+        Raises:
+        - ValueError: If the recording has an exchange that is not in the fee table.
+        """
+        timestamps = []
+        parts = []
+        venues = []
+        for timestamp, levels, venues in read_snapshot_levels(file_path):
+            timestamps.append(timestamp)
+            parts.append(levels)
+        # Joined as bytes, concatenating many small structured arrays is slow
+        levels = np.concatenate([part.view(np.uint8) for part in parts]).view(LEVEL_DTYPE) if parts else np.empty(0, dtype=LEVEL_DTYPE)
+        snapshot = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+        return cls.from_levels(levels, snapshot, len(parts), venues, fee_table, np.array(timestamps, dtype=np.float64))
+
+    @classmethod
+    def from_levels(cls, levels, snapshot, count, venues, fee_table, timestamps=None):
+        """
+        Stacks snapshots given as one array of levels, with the taker fees of the fee table.
+
+        Parameters:
+        - levels (np.ndarray): Levels of all snapshots, with the 'price', 'quantity', 'side' and 'venue' fields of
+          LEVEL_DTYPE.
+        - snapshot (np.ndarray): Number of the snapshot of every level, from 0 to 'count' - 1.
+        - count (int): Number of snapshots.
+        - venues (list): Exchange names by venue code.
+        - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+        - timestamps (np.ndarray): Timestamp of every snapshot.
+
+        Returns:
+        - BookBatch: One row per snapshot.
+
+        Raises:
+        - ValueError: If an exchange of 'venues' is not in the fee table.
+        """
+        # Same arithmetic as calculate_fees, so both agree on every net price
+        price = levels['price']
+        side = levels['side'].astype(np.int8)
+        venue = levels['venue'].astype(np.int16)
+        fee = taker_fee_rates(venues, fee_table)[venue] * price
+        net_price = np.where(side == BID, price - fee, price + fee)
+        return cls._stack(snapshot, side, net_price, levels['quantity'], venue, count, venues, timestamps)
+
+    @classmethod
+    def _stack(cls, snapshot, side, net_price, remaining, venue, count, venues, timestamps=None):
+        # Group the levels by snapshot and side, in net price order. The sort is stable, so equal net prices keep the
+        # order of the exchanges like the crossing book.
+        group = snapshot * 2 + (side == BID)
+        order = _group_order(group, net_price, 2 * count)
+        group, snapshot, side, net_price, remaining, venue = group[order], snapshot[order], side[order], net_price[order], remaining[order], venue[order]
+        sizes = np.bincount(group, minlength=2 * count)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        ask_sizes, bid_sizes = sizes[0::2], sizes[1::2]
+        # The best ask is the first of its group and the best bid the last, groups without levels have none
+        padded = np.append(net_price, np.nan)
+        best_ask = np.where(ask_sizes > 0, padded[starts[0::2]], np.inf)
+        best_bid = np.where(bid_sizes > 0, padded[starts[1::2] + bid_sizes - 1], -np.inf)
+
+        # Only the asks below the best bid and the bids above the best ask can be matched: the first asks and the
+        # last bids of their group
+        ask = side == ASK
+        keep = np.where(ask, net_price < best_bid[snapshot], net_price > best_ask[snapshot])
+        ask_count = np.bincount(snapshot[keep & ask], minlength=count)
+        bid_count = np.bincount(snapshot[keep & ~ask], minlength=count)
+        column = np.arange(len(net_price)) - starts[group]
+        column = np.where(ask, column, column - (bid_sizes - bid_count)[snapshot])
+
+        sides = []
+        for side_rows, side_count, padding in ((keep & ask, ask_count, np.inf), (keep & ~ask, bid_count, -np.inf)):
+            width = int(side_count.max(initial=0))
+            side_net_price = np.full((count, width), padding)
+            side_remaining = np.zeros((count, width))
+            side_venue = np.zeros((count, width), dtype=np.int16)
+            rows, columns = snapshot[side_rows], column[side_rows]
+            side_net_price[rows, columns] = net_price[side_rows]
+            side_remaining[rows, columns] = remaining[side_rows]
+            side_venue[rows, columns] = venue[side_rows]
+            sides += [side_net_price, side_remaining, side_venue, side_count]
+        return cls(*sides, venues, timestamps)
+
+
+def _group_order(group, net_price, count):
+    # Same order as np.lexsort((net_price, group)), which is slow on millions of levels. The groups are small, so the
+    # levels are sorted by group and then every group on its own, as the rows of a padded array.
+    order = np.argsort(group, kind='stable')
+    group = group[order]
+    sizes = np.bincount(group, minlength=count)
+    column = np.arange(len(group)) - (np.cumsum(sizes) - sizes)[group]
+    padded_net_price = np.full((count, sizes.max(initial=0)), np.inf)
+    padded_net_price[group, column] = net_price[order]
+    positions = np.full(padded_net_price.shape, -1)
+    positions[group, column] = order
+    # The padding comes after every level of its row, also after net prices of +inf, as the sort is stable
+    positions = np.take_along_axis(positions, np.argsort(padded_net_price, axis=1, kind='stable'), axis=1)
+    return positions[positions >= 0]
+
+
+def match_batch(batch):
+    """
+    Matches every snapshot of a batch with the greedy sweep of sweep_sorted_sides, all snapshots in step.
+
+    Parameters:
+    - batch (BookBatch): Stacked snapshots. Its remaining quantities are not changed.
+
+    Returns:
+    - tuple: Matching profit of every snapshot, the BTC and the EUR quantities traded on every exchange as arrays
+      of shape (snapshots, exchanges) in the order of 'batch.venues', and the number of fills of every snapshot.
+    """
+    count = len(batch)
+    ask_net, bid_net = batch.ask_net_price, batch.bid_net_price
+    ask_rem, bid_rem = batch.ask_remaining.copy(), batch.bid_remaining.copy()
+    candidates = np.flatnonzero((batch.ask_count > 0) & (batch.bid_count > 0))
+    fills = []
+
+    # First pass: cheapest asks against the most expensive bids, see sweep_sorted_sides
+    rows = candidates
+    ask_pos = np.zeros(len(rows), dtype=np.intp)
+    bid_pos = batch.bid_count[rows] - 1
+    while len(rows):
+        # The pass ends at the last ask or at an ask that is used up
+        live = ask_pos < batch.ask_count[rows]
+        live[live] = ask_rem[rows[live], ask_pos[live]] > 0
+        rows, ask_pos, bid_pos = rows[live], ask_pos[live], bid_pos[live]
+        # Skip the bids that are used up
+        while True:
+            used = bid_pos >= 0
+            used[used] = bid_rem[rows[used], bid_pos[used]] <= 0
+            if not used.any():
+                break
+            bid_pos[used] -= 1
+        live = bid_pos >= 0
+        live[live] = bid_net[rows[live], bid_pos[live]] > ask_net[rows[live], ask_pos[live]]
+        rows, ask_pos, bid_pos = rows[live], ask_pos[live], bid_pos[live]
+        if not len(rows):
+            break
+
+        quantity = np.minimum(ask_rem[rows, ask_pos], bid_rem[rows, bid_pos])
+        ask_rem[rows, ask_pos] -= quantity
+        bid_rem[rows, bid_pos] -= quantity
+        fills.append((rows, ask_pos, bid_pos, quantity))
+        # Every ask takes at most one fill, the pass ends when an ask is used up
+        live = ask_rem[rows, ask_pos] != 0
+        rows, ask_pos, bid_pos = rows[live], ask_pos[live] + 1, bid_pos[live]
+
+    # Second pass: cheapest bids against the cheapest asks
+    rows = candidates
+    ask_pos = np.zeros(len(rows), dtype=np.intp)
+    bid_pos = np.zeros(len(rows), dtype=np.intp)
+    while len(rows):
+        # The pass ends at the last bid or at a bid that is used up
+        live = bid_pos < batch.bid_count[rows]
+        live[live] = bid_rem[rows[live], bid_pos[live]] > 0
+        rows, ask_pos, bid_pos = rows[live], ask_pos[live], bid_pos[live]
+        # Skip the asks that are used up, the pass ends when none are left
+        while True:
+            used = ask_pos < batch.ask_count[rows]
+            used[used] = ask_rem[rows[used], ask_pos[used]] <= 0
+            if not used.any():
+                break
+            ask_pos[used] += 1
+        live = ask_pos < batch.ask_count[rows]
+        rows, ask_pos, bid_pos = rows[live], ask_pos[live], bid_pos[live]
+        if not len(rows):
+            break
+
+        # A bid that does not cross moves on to the next, more expensive bid
+        crossing = ask_net[rows, ask_pos] < bid_net[rows, bid_pos]
+        filled_rows, filled_asks, filled_bids = rows[crossing], ask_pos[crossing], bid_pos[crossing]
+        quantity = np.minimum(ask_rem[filled_rows, filled_asks], bid_rem[filled_rows, filled_bids])
+        ask_rem[filled_rows, filled_asks] -= quantity
+        bid_rem[filled_rows, filled_bids] -= quantity
+        fills.append((filled_rows, filled_asks, filled_bids, quantity))
+        # Every bid takes at most one fill, the pass ends when a bid is used up
+        live = np.ones(len(rows), dtype=bool)
+        live[crossing] = bid_rem[filled_rows, filled_bids] != 0
+        rows, ask_pos, bid_pos = rows[live], ask_pos[live], bid_pos[live] + 1
+
+    venue_count = len(batch.venues)
+    if not fills:
+        return np.zeros(count), np.zeros((count, venue_count)), np.zeros((count, venue_count)), np.zeros(count, dtype=np.intp)
+    rows, ask_pos, bid_pos, quantity = (np.concatenate(parts) for parts in zip(*fills))
+    ask_prices, bid_prices = ask_net[rows, ask_pos], bid_net[rows, bid_pos]
+    ask_cells = rows * venue_count + batch.ask_venue[rows, ask_pos]
+    bid_cells = rows * venue_count + batch.bid_venue[rows, bid_pos]
+    cells = count * venue_count
+
+    # BTC is bought on the ask exchange and sold on the bid exchange
+    profit = np.bincount(rows, weights=quantity * (bid_prices - ask_prices), minlength=count)
+    base_deltas = np.bincount(ask_cells, weights=quantity, minlength=cells) - np.bincount(bid_cells, weights=quantity, minlength=cells)
+    quote_deltas = np.bincount(bid_cells, weights=bid_prices * quantity, minlength=cells) - np.bincount(ask_cells, weights=ask_prices * quantity, minlength=cells)
+    return profit, base_deltas.reshape(count, venue_count), quote_deltas.reshape(count, venue_count), np.bincount(rows, minlength=count)
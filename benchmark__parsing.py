@@ -0,0 +1,86 @@
+# benchmark__parsing.py
+#
+# Micro-benchmark of parsing exchange order books, per 1,000 levels per side: the order tuples the pipeline used to
+# build its books from, against the float64 arrays of coinmetro_order_book_arrays and ccxt_order_book_arrays.
+# Not collected by the normal test run.
+#
+#     python benchmark__parsing.py
+# or  python -m pytest benchmark__parsing.py --benchmark-json=parsing.json
+
+import json
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from coinmetro_client import decode_json
+from data_fetch import transform_coinmetro_order_book, transform_ccxt_exchange_order_book, coinmetro_order_book_arrays, ccxt_order_book_arrays
+from order_book import OrderBook
+
+LEVELS = 1000
+
+
+def coinmetro_body(levels=LEVELS, seed=0):
+    # Coinmetro sends prices as string keys and quantities as numbers
+    rng = np.random.default_rng(seed)
+    book = {
+        'bid': {f"{40000 - 0.5 * level:.2f}": round(rng.uniform(0.001, 2.0), 8) for level in range(levels)},
+        'ask': {f"{40001 + 0.5 * level:.2f}": round(rng.uniform(0.001, 2.0), 8) for level in range(levels)},
+    }
+    return json.dumps({'book': book}).encode('utf-8')
+
+
+def kraken_order_book(levels=LEVELS, seed=0):
+    # CCXT returns numbers, Kraken levels have a timestamp as their third item
+    rng = np.random.default_rng(seed)
+    return {
+        'bids': [[40000 - 0.5 * level, round(rng.uniform(0.001, 2.0), 8), 1702375200] for level in range(levels)],
+        'asks': [[40001 + 0.5 * level, round(rng.uniform(0.001, 2.0), 8), 1702375200] for level in range(levels)],
+        'timestamp': None,
+    }
+
+
+def test__coinmetro__json_order_tuples(benchmark):
+    benchmark.group = "Coinmetro body to OrderBook, 1,000 levels per side"
+    body = coinmetro_body()
+    book = benchmark(lambda: OrderBook.from_orders(transform_coinmetro_order_book(json.loads(body)['book'])))
+    assert len(book) == 2 * LEVELS
+
+
+def test__coinmetro__decode_json_arrays(benchmark):
+    benchmark.group = "Coinmetro body to OrderBook, 1,000 levels per side"
+    body = coinmetro_body()
+    book = benchmark(lambda: coinmetro_order_book_arrays(decode_json(body)['book']))
+    assert len(book) == 2 * LEVELS
+
+
+def test__coinmetro__json_only(benchmark):
+    benchmark.group = "Coinmetro body decoding, 1,000 levels per side"
+    body = coinmetro_body()
+    benchmark(json.loads, body)
+
+
+def test__coinmetro__decode_json_only(benchmark):
+    benchmark.group = "Coinmetro body decoding, 1,000 levels per side"
+    body = coinmetro_body()
+    benchmark(decode_json, body)
+
+
+def test__ccxt__order_tuples(benchmark):
+    benchmark.group = "CCXT order book to OrderBook, 1,000 levels per side"
+    order_book = kraken_order_book()
+    book = benchmark(lambda: OrderBook.from_orders(transform_ccxt_exchange_order_book(order_book, 'kraken')))
+    assert len(book) == 2 * LEVELS
+
+
+def test__ccxt__arrays(benchmark):
+    benchmark.group = "CCXT order book to OrderBook, 1,000 levels per side"
+    order_book = kraken_order_book()
+    book = benchmark(ccxt_order_book_arrays, order_book, 'kraken')
+    assert len(book) == 2 * LEVELS
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q', '--benchmark-columns=min,median,mean,rounds'] + sys.argv[1:]))
@@ -0,0 +1,242 @@
+# benchmark__pipeline.py
+#
+# Benchmarks of every pipeline stage on synthetic order books of 10 to 10,000 levels per side and filled orders
+# ledgers of 0 to 100,000 rows, i.e. from the start to the end of a busy day, and of matching a recording snapshot
+# by snapshot against batch_matching. Not collected by the normal test run.
+#
+# Run and save the results as JSON under .benchmarks/, numbered and tagged with the commit:
+#     python benchmark__pipeline.py
+# Compare with the last saved run and fail on a regression:
+#     python benchmark__pipeline.py --benchmark-compare --benchmark-compare-fail=mean:20%
+# Or write one JSON file:
+#     python -m pytest benchmark__pipeline.py --benchmark-json=benchmark.json
+
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from batch_matching import BookBatch, match_batch
+from filled_orders_ledger import FilledOrdersLedger
+from matching_engine import match_orders
+from order_book import OrderBook
+from orderbook_preparation import combine_and_sort_order_book, calculate_fees, clean_order_book, update_filled_orders
+from pipeline import ArbitragePipeline
+from streaming import L2Book
+from venue_books import VenueBooks
+from snapshot_recorder import SnapshotRecorder, read_snapshots
+from save_results import append_filled_orders, append_daily_profit_entry, daily_profit_entry, venue_delta_entries
+from trade_journal import matched_orders_journal, trades_journal, venue_deltas_journal
+
+DEPTHS = [10, 100, 1000, 10000]
+LEDGER_SIZES = [0, 1000, 10000, 100000]
+SNAPSHOTS = 1000
+fee_table = {'coinmetro': (0.001, 0.001), 'kraken': (0.0024, 0.0024)}
+
+
+def synthetic_order_lists(levels, seed=0):
+    # Kraken is priced above Coinmetro by more than the fees, so that about a fifth of the levels of every depth cross
+    rng = np.random.default_rng(seed)
+    order_lists = []
+    for exchange, mid in (('coinmetro', 40000.0), ('kraken', 40140.0 + 0.2 * levels)):
+        bid_prices = np.round(mid - np.cumsum(rng.uniform(0.01, 2.0, levels)), 2)
+        ask_prices = np.round(mid + np.cumsum(rng.uniform(0.01, 2.0, levels)), 2)
+        quantities = np.round(rng.uniform(0.001, 2.0, 2 * levels), 8)
+        order_lists.append([(price, quantity, 'Bid', exchange) for price, quantity in zip(bid_prices.tolist(), quantities[:levels].tolist())]
+                           + [(price, quantity, 'Ask', exchange) for price, quantity in zip(ask_prices.tolist(), quantities[levels:].tolist())])
+    return order_lists
+
+
+def synthetic_ledger(rows, order_lists, seed=0):
+    # Half of the book levels were partly matched earlier today, the other rows are orders that are gone
+    rng = np.random.default_rng(seed)
+    orders = [order for orders in order_lists for order in orders][::2][:rows]
+    exchanges = [order[3] for order in orders] + ['kraken'] * (rows - len(orders))
+    sides = [order[2] for order in orders] + ['Ask'] * (rows - len(orders))
+    prices = [order[0] for order in orders] + np.round(rng.uniform(30000, 50000, rows - len(orders)), 2).tolist()
+    quantities = [order[1] for order in orders] + np.round(rng.uniform(0.001, 2.0, rows - len(orders)), 8).tolist()
+    ledger = FilledOrdersLedger()
+    ledger.record_orders(exchanges, sides, prices, quantities, [quantity / 2 for quantity in quantities])
+    return ledger
+
+
+def prepared_book(levels):
+    book = calculate_fees(OrderBook.from_orders(*synthetic_order_lists(levels)), fee_table=fee_table).sort_by_net_price()
+    return update_filled_orders(clean_order_book(book), FilledOrdersLedger())
+
+
+def matched_trades(levels):
+    return match_orders(prepared_book(levels))[0]
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__combine_and_sort_order_book(benchmark, levels):
+    benchmark.group = "combine_and_sort_order_book"
+    coinmetro_orders, kraken_orders = synthetic_order_lists(levels)
+    book = benchmark(combine_and_sort_order_book, coinmetro_orders, kraken_orders)
+    assert len(book) == 4 * levels
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__build_order_book(benchmark, levels):
+    benchmark.group = "OrderBook.from_orders"
+    order_lists = synthetic_order_lists(levels)
+    book = benchmark(OrderBook.from_orders, *order_lists)
+    assert len(book) == 4 * levels
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__calculate_fees(benchmark, levels):
+    benchmark.group = "calculate_fees"
+    book = OrderBook.from_orders(*synthetic_order_lists(levels))
+    book = benchmark(calculate_fees, book, fee_table=fee_table)
+    assert len(book) == 4 * levels
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__clean_order_book(benchmark, levels, capsys):
+    benchmark.group = "clean_order_book"
+    book = calculate_fees(OrderBook.from_orders(*synthetic_order_lists(levels)), fee_table=fee_table).sort_by_net_price()
+    book = benchmark(clean_order_book, book)
+    assert not book.empty
+
+
+@pytest.mark.parametrize("ledger_rows", LEDGER_SIZES)
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__update_filled_orders(benchmark, levels, ledger_rows):
+    benchmark.group = f"update_filled_orders, {levels} levels"
+    book = prepared_book(levels)
+    ledger = synthetic_ledger(ledger_rows, synthetic_order_lists(levels))
+    book = benchmark(update_filled_orders, book, ledger)
+    assert len(ledger) == ledger_rows
+    assert (book.remaining <= book.quantity).all()
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__match_orders(benchmark, levels):
+    benchmark.group = "match_orders"
+    book = prepared_book(levels)
+
+    def reset_remaining():
+        # Matching lowers the remaining quantities of the book
+        book.remaining = book.quantity.copy()
+        return (book,), {}
+
+    result = benchmark.pedantic(match_orders, setup=reset_remaining, rounds=50)
+    assert result[0]
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__streaming_update(benchmark, levels):
+    benchmark.group = "L2Book update, VenueBooks.load and crossing_book"
+    books = {}
+    for orders in synthetic_order_lists(levels):
+        book = books[orders[0][3]] = L2Book(orders[0][3])
+        book.apply_snapshot([order[:2] for order in orders if order[2] == 'Bid'], [order[:2] for order in orders if order[2] == 'Ask'])
+    venue_books = VenueBooks(fee_table, verbose=False)
+    venue_books.load([book.to_orders() for book in books.values()])
+    best_ask = books['coinmetro'].top[2]
+    updates = iter(range(10 ** 9))
+
+    def stream_update():
+        # One Coinmetro ask level changes, the unchanged Kraken book is not indexed again
+        update = next(updates)
+        books['coinmetro'].apply_update([], [(best_ask + 0.001 * (update % 7 + 1), 0.5 + update % 3)])
+        venue_books.load([book.to_orders() for book in books.values()])
+        return venue_books.crossing_book()
+
+    assert not benchmark(stream_update).empty
+
+
+@pytest.mark.parametrize("ledger_rows", LEDGER_SIZES)
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__pipeline_match(benchmark, levels, ledger_rows):
+    benchmark.group = f"ArbitragePipeline.match, {levels} levels"
+    order_lists = synthetic_order_lists(levels)
+    ledger = synthetic_ledger(ledger_rows, order_lists)
+
+    def new_pipeline():
+        # The pipeline records its matches in the ledger, every round starts from the same ledger
+        pipeline_ledger = FilledOrdersLedger()
+        pipeline_ledger.min_remaining = dict(ledger.min_remaining)
+        return (ArbitragePipeline(fee_table, pipeline_ledger, verbose=False),), {}
+
+    result = benchmark.pedantic(lambda pipeline: pipeline.match(order_lists), setup=new_pipeline, rounds=20)
+    assert result is not None
+
+
+@pytest.mark.parametrize("mode", ['levels', 'buckets', 'buckets and truncation'])
+@pytest.mark.parametrize("levels", [500, 5000])
+def test__pipeline_match_deep_books(benchmark, levels, mode):
+    benchmark.group = f"ArbitragePipeline.match of deep books, {levels} levels"
+    order_lists = [OrderBook.from_orders(orders) for orders in synthetic_order_lists(levels)]
+    price_buckets = {exchange: 5.0 for exchange in fee_table} if mode != 'levels' else None
+
+    def new_pipeline():
+        return (ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, price_buckets=price_buckets, edge_truncation=mode == 'buckets and truncation'),), {}
+
+    result = benchmark.pedantic(lambda pipeline: pipeline.match(order_lists), setup=new_pipeline, rounds=50)
+    assert result is not None
+
+
+@pytest.fixture(scope='module')
+def recording(tmp_path_factory):
+    # Snapshots of 10 levels per side whose exchanges drift apart and back, about half of them cross
+    file_path = tmp_path_factory.mktemp('recording') / 'snapshots.bin'
+    with SnapshotRecorder(file_path) as recorder:
+        for snapshot in range(SNAPSHOTS):
+            order_lists = synthetic_order_lists(10, seed=snapshot)
+            shift = 150.0 * np.sin(snapshot / 20)
+            order_lists[1] = [(round(price + shift, 2), quantity, side, exchange) for price, quantity, side, exchange in order_lists[1]]
+            recorder.record(order_lists, timestamp=1702375200.0 + snapshot)
+    return file_path
+
+
+def test__snapshots_one_by_one(benchmark, recording):
+    benchmark.group = f"Matching {SNAPSHOTS:,} recorded snapshots with an empty ledger each"
+
+    def match_snapshots():
+        return sum(result[1] for timestamp, order_lists in read_snapshots(recording)
+                   if (result := ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False).match(order_lists)) is not None)
+
+    assert benchmark.pedantic(match_snapshots, rounds=5) > 0
+
+
+def test__snapshots_batch(benchmark, recording):
+    benchmark.group = f"Matching {SNAPSHOTS:,} recorded snapshots with an empty ledger each"
+    profit = benchmark.pedantic(lambda: match_batch(BookBatch.from_recording(recording, fee_table))[0], rounds=5)
+    assert profit.sum() > 0
+
+
+@pytest.mark.parametrize("levels", DEPTHS)
+def test__append_filled_orders(benchmark, levels, tmp_path, capsys):
+    benchmark.group = "append_filled_orders"
+    trades = matched_trades(levels)
+    rows = benchmark(append_filled_orders, matched_orders_journal(tmp_path), trades)
+    assert rows == len(trades)
+
+
+def test__append_daily_profit_entry(benchmark, tmp_path):
+    benchmark.group = "save_results entries"
+    entry = benchmark(append_daily_profit_entry, trades_journal(tmp_path), 12.5, -0.1, 4000.0, 0.1, -3990.0)
+    assert entry['Profit'] == 12.5
+
+
+def test__daily_profit_entry(benchmark):
+    benchmark.group = "save_results entries"
+    entry = benchmark(daily_profit_entry, 12.5, -0.1, 4000.0, 0.1, -3990.0)
+    assert entry['Profit'] == 12.5
+
+
+def test__venue_delta_entries(benchmark, tmp_path):
+    benchmark.group = "save_results entries"
+    venue_deltas = {'kraken': (-0.1, 4000.0), 'coinmetro': (0.1, -3990.0)}
+    entries = benchmark(venue_delta_entries, venue_deltas)
+    venue_deltas_journal(tmp_path).append(entries)
+    assert len(entries) == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q', '--benchmark-autosave', '--benchmark-columns=min,median,mean,max,rounds'] + sys.argv[1:]))
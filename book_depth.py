@@ -0,0 +1,220 @@
+"""
+book_depth.py
+
+This module shrinks deep order books before matching. The levels of an exchange can be added up in price buckets,
+and the combined book can be cut at the depth where the fee-adjusted edge between the bids and the asks is gone.
+
+Bucketed levels take the worse price of their bucket, asks the top and bids the bottom of it, so the profit of a
+match is never overestimated. It is underestimated by at most one bucket per matched unit on each side, see
+aggregation_error_bound. Both change the levels the matching sweep sees, so it can make other fills than on the full
+book; edge_depth gives the most profit the book allows either way.
+
+The ledger of the filled orders only knows the levels the exchanges sent. A bucket offers what the ledger leaves of
+its levels, see bucket_remaining, and its fills are split over its levels before they are recorded, see
+unbucket_trades.
+"""
+import numpy as np
+
+from order_book import OrderBook, ASK, BID
+
+
+def aggregate_side(book, positions, bucket_size):
+    """
+    Adds up the levels of one side of an exchange order book in price buckets.
+
+    Parameters:
+    - book (OrderBook): Order book of one exchange.
+    - positions (np.ndarray): Positions of the levels of one side in price order, see venue_books.sorted_positions.
+    - bucket_size (float): Width of the price buckets (e.g., 1.0 for one EUR).
+
+    Returns:
+    - OrderBook: One level per bucket, at the worse price of the bucket and with the total quantity of its levels,
+      in ascending price order.
+    """
+    if not len(positions):
+        return book.take(positions)
+    # The levels of a bucket follow each other
+    edges = bucket_edges(book.price[positions], book.side[positions[0]], bucket_size)
+    starts = np.flatnonzero(np.concatenate(([True], edges[1:] != edges[:-1])))
+    return OrderBook(edges[starts], np.add.reduceat(book.quantity[positions], starts), book.side[positions[starts]],
+                     book.venue[positions[starts]], book.venues)
+
+
+def bucket_edges(price, side, bucket_size):
+    """
+    Parameters:
+    - price (np.ndarray): Prices of levels of one side.
+    - side (int): Side code (ASK or BID).
+    - bucket_size (float): Width of the price buckets.
+
+    Returns:
+    - np.ndarray: Price of the bucket of every level, the top of its bucket for asks and the bottom for bids.
+    """
+    if side == ASK:
+        return np.ceil(price / bucket_size) * bucket_size
+    return np.floor(price / bucket_size) * bucket_size
+
+
+def _ledger_remaining(levels, filled_orders_ledger):
+    # What the ledger leaves of every level
+    side_names = np.where(levels.side == BID, 'Bid', 'Ask').tolist()
+    return np.minimum(levels.quantity, filled_orders_ledger.remaining_quantities(levels.exchange_names(), side_names, levels.price, levels.quantity))
+
+
+def bucket_remaining(book, bucketed_levels, price_buckets, filled_orders_ledger):
+    """
+    Lowers the remaining quantity of every bucketed level of a book to what the ledger leaves of the levels in its
+    bucket. The ledger cannot find the buckets themselves, their prices and quantities are not orders.
+
+    Parameters:
+    - book (OrderBook): Combined order book with remaining quantities, see update_filled_orders. Updated in place.
+    - bucketed_levels (dict): Asks and bids of every bucketed exchange as sent, see VenueBooks.bucketed_levels.
+    - price_buckets (dict): Bucket size by exchange name.
+    - filled_orders_ledger (FilledOrdersLedger): Ledger of the filled orders.
+
+    Returns:
+    - OrderBook: The book.
+    """
+    if not len(filled_orders_ledger) or book.empty:
+        return book
+    for exchange, sides in bucketed_levels.items():
+        if exchange not in book.venues:
+            continue
+        venue = book.venues.index(exchange)
+        for side, levels in zip((ASK, BID), sides):
+            rows = ((book.side == side) & (book.venue == venue)).nonzero()[0]
+            if not len(rows):
+                continue
+            edges = bucket_edges(levels.price, side, price_buckets[exchange])
+            starts = np.flatnonzero(np.concatenate(([True], edges[1:] != edges[:-1])))
+            totals = np.add.reduceat(_ledger_remaining(levels, filled_orders_ledger), starts)
+            buckets = np.searchsorted(edges[starts], book.price[rows])
+            book.remaining[rows] = np.minimum(book.remaining[rows], totals[buckets])
+    return book
+
+
+def unbucket_trades(matched_trades, bucketed_levels, price_buckets, filled_orders_ledger):
+    """
+    Splits the fills of buckets over the levels of their buckets, the best price first, so that the ledger and the
+    journals record the orders the exchanges sent. Call it before recording the trades in the ledger.
+
+    Parameters:
+    - matched_trades (list): Matched trade dictionaries, see match_orders_by_venue.
+    - bucketed_levels (dict): Asks and bids of every bucketed exchange as sent, see VenueBooks.bucketed_levels.
+    - price_buckets (dict): Bucket size by exchange name.
+    - filled_orders_ledger (FilledOrdersLedger): Ledger of the filled orders, before the trades are recorded.
+
+    Returns:
+    - list: Matched trades with one trade per level of a bucket that was filled. The trades of other exchanges are
+      kept as they are, in the same order.
+    """
+    if not bucketed_levels:
+        return matched_trades
+    trades = []
+    level_remaining = {}
+    for trade in matched_trades:
+        exchange = trade['Exchange']
+        if exchange not in bucketed_levels:
+            trades.append(trade)
+            continue
+        side = ASK if trade['Ask/Bid'] == 'Ask' else BID
+        levels = bucketed_levels[exchange][side]
+        if (exchange, side) not in level_remaining:
+            level_remaining[exchange, side] = (_ledger_remaining(levels, filled_orders_ledger).tolist(),
+                                               bucket_edges(levels.price, side, price_buckets[exchange]))
+        remaining, edges = level_remaining[exchange, side]
+        start, stop = np.searchsorted(edges, trade['Price'], side='left'), np.searchsorted(edges, trade['Price'], side='right')
+        # Asks from the lowest and bids from the highest price of the bucket
+        quantity = trade['Matched Quantity']
+        for position in (range(start, stop) if side == ASK else range(stop - 1, start - 1, -1)):
+            if quantity <= 0:
+                break
+            matched_quantity = min(quantity, remaining[position])
+            if matched_quantity <= 0:
+                continue
+            remaining[position] -= matched_quantity
+            quantity -= matched_quantity
+            trades.append({**trade, 'Price': levels.price[position], 'Quantity': levels.quantity[position], 'Fee': levels.fee[position],
+                           'Net Price': levels.net_price[position], 'Matched Quantity': matched_quantity, 'Remaining Quantity': remaining[position]})
+    return trades
+
+
+def _depth_curves(book):
+    # Asks from the lowest and bids from the highest net price, with the depth at the end of every level
+    asks = (book.side == ASK).nonzero()[0]
+    bids = (book.side == BID).nonzero()[0][::-1]
+    return asks, bids, np.cumsum(book.remaining[asks]), np.cumsum(book.remaining[bids])
+
+
+def edge_depth(book):
+    """
+    Finds how deep the bids and the asks of a book cross, taking the best levels first. The profit of trading that
+    deep is the most that any matching of the book can earn.
+
+    Parameters:
+    - book (OrderBook): Order book sorted by net price, with remaining quantities.
+
+    Returns:
+    - tuple: Quantity up to which the bid net price is above the ask net price, and the profit of trading it.
+    """
+    asks, bids, ask_depths, bid_depths = _depth_curves(book)
+    if not len(asks) or not len(bids):
+        return 0.0, 0.0
+    # Both curves are step functions of the depth, compare them between every two steps
+    steps = np.unique(np.concatenate(([0.0], ask_depths, bid_depths)))
+    steps = steps[steps <= min(ask_depths[-1], bid_depths[-1])]
+    ask_levels = np.searchsorted(ask_depths, steps[:-1], side='right')
+    bid_levels = np.searchsorted(bid_depths, steps[:-1], side='right')
+    edges = book.net_price[bids[bid_levels]] - book.net_price[asks[ask_levels]]
+    quantities = np.diff(steps)
+    crossing = edges > 0
+    return float(quantities[crossing].sum()), float((edges * quantities)[crossing].sum())
+
+
+def truncate_at_edge(book):
+    """
+    Drops the levels beyond the depth where the fee-adjusted edge is gone: an ask is kept while the bid at the depth
+    where the ask starts is above it, and a bid while the ask at its depth is below it.
+
+    Parameters:
+    - book (OrderBook): Order book sorted by net price, with remaining quantities.
+
+    Returns:
+    - OrderBook: Copy of the levels that are kept, still sorted by net price.
+    """
+    asks, bids, ask_depths, bid_depths = _depth_curves(book)
+    if not len(asks) or not len(bids):
+        return book.take(np.empty(0, dtype=np.intp))
+    ask_starts = ask_depths - book.remaining[asks]
+    bid_starts = bid_depths - book.remaining[bids]
+    # The level of the other side at the start of every level, past the end of the other side if it has no level there
+    bid_levels = np.searchsorted(bid_depths, ask_starts, side='right')
+    ask_levels = np.searchsorted(ask_depths, bid_starts, side='right')
+    bid_net_prices = np.append(book.net_price[bids], -np.inf)
+    ask_net_prices = np.append(book.net_price[asks], np.inf)
+    keep = np.zeros(len(book), dtype=bool)
+    keep[asks[bid_net_prices[bid_levels] > book.net_price[asks]]] = True
+    keep[bids[book.net_price[bids] > ask_net_prices[ask_levels]]] = True
+    return book.take(keep.nonzero()[0])
+
+
+def aggregation_error_bound(matched_trades, price_buckets, taker_fees):
+    """
+    Bounds how much more the matched trades would earn at the prices of the levels inside their buckets.
+
+    Every matched unit is priced at most one bucket worse than its best level, before the taker fee.
+
+    Parameters:
+    - matched_trades (list): Matched trade dictionaries, see match_orders_by_venue.
+    - price_buckets (dict): Bucket size by exchange name.
+    - taker_fees (dict): Taker fee rate by lowercase exchange name, see taker_fee_lookup.
+
+    Returns:
+    - float: Upper bound of the profit missing from the estimate, in the quote currency.
+    """
+    bound = 0.0
+    for trade in matched_trades:
+        bucket_size = price_buckets.get(trade['Exchange'])
+        if bucket_size is not None:
+            bound += trade['Matched Quantity'] * bucket_size * (1 + taker_fees.get(trade['Exchange'].lower(), 0.0))
+    return bound
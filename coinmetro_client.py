@@ -0,0 +1,117 @@
+"""
+coinmetro_client.py
+
+This module contains the asynchronous Coinmetro client. It keeps a pool of keep-alive connections, so every fetch
+reuses an open TCP/TLS connection instead of opening a new one.
+"""
+import asyncio
+import json
+
+import aiohttp
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    # The standard library parser is used when orjson is not installed
+    orjson = None
+
+COINMETRO_URL = 'https://api.coinmetro.com'
+
+# Request budget of the public order book endpoint, adjust to the limit of the account
+COINMETRO_REQUESTS_PER_SECOND = 1.0
+
+
+def decode_json(body):
+    """
+    Decodes a JSON response body, with orjson when it is installed.
+
+    Parameters:
+    - body (bytes): Response body.
+
+    Returns:
+    - The decoded JSON value.
+
+    Raises:
+    - ValueError: If the body is not valid JSON, e.g. a truncated body or an HTML error page. Both orjson.JSONDecodeError
+      and json.JSONDecodeError are ValueErrors.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class CoinmetroClient:
+    """
+    Coinmetro REST client on a persistent aiohttp session. Use it as an async context manager or call 'close'.
+    """
+
+    def __init__(self, base_url=COINMETRO_URL, timeout=5.0, connection_limit=10, keepalive_timeout=60.0):
+        """
+        Parameters:
+        - base_url (str): Base URL of the Coinmetro API.
+        - timeout (float): Total timeout of a request in seconds.
+        - connection_limit (int): Maximum number of open connections.
+        - keepalive_timeout (float): Seconds an idle connection is kept open.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    def _get_session(self):
+        # The session is created in the running event loop on first use
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=self.keepalive_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def fetch_order_book(self, pair='BTCEUR'):
+        """
+        Fetches the raw order book of a trading pair.
+
+        Parameters:
+        - pair (str): Coinmetro trading pair (e.g., 'BTCEUR').
+
+        Returns:
+        - dict: Raw order book data with 'bid' and 'ask' dictionaries, None if the request failed.
+        """
+        url = f"{self.base_url}/exchange/book/{pair}"
+        try:
+            async with self._get_session().get(url) as response:
+                if response.status != 200:
+                    timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+                    print(f"Error fetching Coinmetro order book data. Status code: {response.status} ", timestamp)
+                    return None
+                coinmetro_order_book_data = decode_json(await response.read())
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"Network error fetching Coinmetro order book data: {e!r}, {timestamp}")
+            return None
+        except ValueError as e:
+            # A truncated body or an error page, see decode_json
+            timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"Invalid JSON in Coinmetro order book data: {e!r}, {timestamp}")
+            return None
+
+        if not isinstance(coinmetro_order_book_data, dict) or 'book' not in coinmetro_order_book_data:
+            timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+            print("Error: 'book' key not found in Coinmetro order book data. ", timestamp)
+            return None
+        return coinmetro_order_book_data['book']
+
+    async def close(self):
+        """
+        Closes the session and its connections.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -5,20 +5,32 @@ This module contains functions for fetching order book data from Coinmetro and K
 """
 
 import asyncio
-import requests
+import time
+from itertools import chain
+from operator import itemgetter
+
 import ccxt
+import numpy as np
 import pandas as pd
 
+from coinmetro_client import CoinmetroClient
+from exchange_registry import ExchangeRegistry
+from order_book import OrderBook, OrderList, ASK, BID
+
+# Exchanges whose CCXT order book levels are [price, quantity, timestamp], other exchanges put counts or ids there
+LEVEL_TIMESTAMP_EXCHANGES = {'kraken'}
 
-def transform_coinmetro_order_book(coinmetro_order_book):
+
+def transform_coinmetro_order_book(coinmetro_order_book, received_at=None):
     """
     Transforms the raw Coinmetro order book data.
 
     Parameters:
     - coinmetro_order_book (dict): Raw order book data from the Coinmetro exchange.
+    - received_at (float): Time the order book was received, in seconds since the epoch.
 
     Returns:
-    - list: Transformed order book containing tuples (price, quantity, ask/bid, exchange).
+    - OrderList: Transformed order book containing tuples (price, quantity, ask/bid, exchange).
     """
     coinmetro_bids = list(coinmetro_order_book.get('bid', {}).items())
     coinmetro_bids = [(float(price), float(quantity), 'Bid') for price, quantity in coinmetro_bids]
@@ -26,69 +38,147 @@ def transform_coinmetro_order_book(coinmetro_order_book):
     coinmetro_asks = [(float(price), float(quantity), 'Ask') for price, quantity in coinmetro_asks]
     coinmetro_orders = coinmetro_bids + coinmetro_asks
     coinmetro_orders = [(price, quantity, ask_bid, 'coinmetro') for price, quantity, ask_bid in coinmetro_orders]
-    return coinmetro_orders
+    return OrderList(coinmetro_orders, received_at)
 
 
-def transform_ccxt_exchange_order_book(exchange_order_book, exchange):
+def transform_ccxt_exchange_order_book(exchange_order_book, exchange, received_at=None):
     """
     Transforms the raw order book data from a CCXT exchange.
 
     Parameters:
     - exchange_order_book (dict): Raw order book data from the CCXT exchange.
     - exchange (str): Name of the exchange.
+    - received_at (float): Time the order book was received, in seconds since the epoch.
 
     Returns:
-    - list: Transformed order book containing tuples (price, quantity, ask/bid, exchange).
+    - OrderList: Transformed order book containing tuples (price, quantity, ask/bid, exchange), with the exchange
+      timestamp of the book if the exchange reports one.
     """
     exchange_bids = exchange_order_book.get('bids', [])
-    exchange_bids = [(price, quantity, 'Bid') for price, quantity, _ in exchange_bids]
     exchange_asks = exchange_order_book.get('asks', [])
-    exchange_asks = [(price, quantity, 'Ask') for price, quantity, _ in exchange_asks]
-    exchange_orders = exchange_bids + exchange_asks
-    exchange_orders = [(price, quantity, ask_bid, exchange) for price, quantity, ask_bid in exchange_orders]
-    return exchange_orders
+    exchange_orders = [(level[0], level[1], 'Bid', exchange) for level in exchange_bids]
+    exchange_orders += [(level[0], level[1], 'Ask', exchange) for level in exchange_asks]
+    return OrderList(exchange_orders, received_at, ccxt_exchange_timestamp(exchange_order_book, exchange))
+
 
-async def fetch_coinmetro_order_book():
+def ccxt_exchange_timestamp(exchange_order_book, exchange):
     """
-    Fetches BTCEUR order book data from Coinmetro.
+    Finds the time the exchange reported for a CCXT order book.
 
     Parameters:
-    - coinmetro_url (str): The API endpoint for the Coinmetro order book.
+    - exchange_order_book (dict): Raw order book data from the CCXT exchange.
+    - exchange (str): Name of the exchange.
 
     Returns:
-    - tuple: A tuple containing bid and ask information as lists.
+    - float: The order book timestamp, or else the latest level timestamp, in seconds since the epoch. None if the
+      exchange reports neither.
     """
-    try:
-        # Coinmetro API endpoint for BTCEUR order book
-        coinmetro_url = 'https://api.coinmetro.com/exchange/book/BTCEUR'
+    if exchange_order_book.get('timestamp'):
+        return exchange_order_book['timestamp'] / 1000
+    if exchange.lower() in LEVEL_TIMESTAMP_EXCHANGES:
+        # Kraken levels carry the second they were last changed, the latest one is when the book was last changed
+        try:
+            return float(max(map(itemgetter(2), chain(exchange_order_book.get('bids', []), exchange_order_book.get('asks', [])))))
+        except (IndexError, ValueError):
+            # Levels without timestamps, or no levels at all
+            return None
+    return None
 
-        # print(f"Started to fetch Coinmetro orderbook at {pd.Timestamp.now()}")
+def coinmetro_order_book_arrays(coinmetro_order_book, received_at=None):
+    """
+    Turns the raw Coinmetro order book data straight into an order book, without order tuples.
 
-        # Fetch Coinmetro order book data
-        # print(f'Started to fetch Coinmetro orderbook at: {pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")}')
-        coinmetro_response = requests.get(coinmetro_url)
-        # print(f'Received Coinmetro orderbook at: {pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")}')
+    Parameters:
+    - coinmetro_order_book (dict): Raw order book data from the Coinmetro exchange, prices as string keys.
+    - received_at (float): Time the order book was received, in seconds since the epoch.
+
+    Returns:
+    - OrderBook: Order book of Coinmetro with the bids before the asks, in the order of the raw data.
+    """
+    bids = coinmetro_order_book.get('bid', {})
+    asks = coinmetro_order_book.get('ask', {})
+    count = len(bids) + len(asks)
+    # Every array is allocated once, at its final size
+    price = np.fromiter(map(float, chain(bids, asks)), dtype=np.float64, count=count)
+    quantity = np.fromiter(chain(bids.values(), asks.values()), dtype=np.float64, count=count)
+    book = OrderBook(price, quantity, _side_codes(len(bids), len(asks)), np.zeros(count, dtype=np.int16), ('coinmetro',))
+    book.received_at = received_at
+    return book
+
+
+def ccxt_order_book_arrays(exchange_order_book, exchange, received_at=None):
+    """
+    Turns the raw order book data from a CCXT exchange straight into an order book, without order tuples.
+
+    Parameters:
+    - exchange_order_book (dict): Raw order book data from the CCXT exchange.
+    - exchange (str): Name of the exchange.
+    - received_at (float): Time the order book was received, in seconds since the epoch.
+
+    Returns:
+    - OrderBook: Order book of the exchange with the bids before the asks, with the exchange timestamp of the book
+      if the exchange reports one.
+    """
+    bids = exchange_order_book.get('bids', [])
+    asks = exchange_order_book.get('asks', [])
+    count = len(bids) + len(asks)
+    price = np.fromiter(map(itemgetter(0), chain(bids, asks)), dtype=np.float64, count=count)
+    quantity = np.fromiter(map(itemgetter(1), chain(bids, asks)), dtype=np.float64, count=count)
+    book = OrderBook(price, quantity, _side_codes(len(bids), len(asks)), np.zeros(count, dtype=np.int16), (exchange,))
+    book.received_at = received_at
+    book.exchange_timestamp = ccxt_exchange_timestamp(exchange_order_book, exchange)
+    return book
+
+
+def _side_codes(bid_count, ask_count):
+    side = np.empty(bid_count + ask_count, dtype=np.int8)
+    side[:bid_count] = BID
+    side[bid_count:] = ASK
+    return side
+
+
+def coinmetro_pair(symbol):
+    """
+    Parameters:
+    - symbol (str): Unified trading symbol (e.g., 'BTC/EUR').
 
-        # Check if the Coinmetro request was successful (HTTP status code 200)
-        if coinmetro_response.status_code == 200:
-            coinmetro_order_book_data = coinmetro_response.json()
+    Returns:
+    - str: Coinmetro trading pair (e.g., 'BTCEUR').
+    """
+    return symbol.replace('/', '')
+
+
+async def fetch_coinmetro_order_book(client=None, pair='BTCEUR', arrays=False):
+    """
+    Fetches order book data of a trading pair from Coinmetro.
 
-            if 'book' in coinmetro_order_book_data:
-                return transform_coinmetro_order_book(coinmetro_order_book_data['book'])
+    Parameters:
+    - client (CoinmetroClient): Client with a persistent connection pool. A temporary client is used if not given.
+    - pair (str): Coinmetro trading pair (e.g., 'BTCEUR').
+    - arrays (bool): Return an OrderBook instead of order tuples.
 
-            else:
-                timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
-                print("Error: 'book' key not found in Coinmetro order book data. ", timestamp)
+    Returns:
+    - list or OrderBook: Transformed order book containing tuples (price, quantity, ask/bid, exchange), None if fetching failed.
+    """
+    try:
+        # Fetch Coinmetro order book data
+        if client is None:
+            async with CoinmetroClient() as temporary_client:
+                coinmetro_order_book = await temporary_client.fetch_order_book(pair)
         else:
-            timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"Error fetching Coinmetro order book data. Status code: {coinmetro_response.status_code} ", timestamp)
+            coinmetro_order_book = await client.fetch_order_book(pair)
+
+        if coinmetro_order_book is not None:
+            if arrays:
+                return coinmetro_order_book_arrays(coinmetro_order_book, time.time())
+            return transform_coinmetro_order_book(coinmetro_order_book, time.time())
 
     except asyncio.CancelledError:
         print(f"Coinmetro orderbook fetching terminated by user.")
         return None, None
 
 
-async def fetch_ccxt_exchange_order_book(exchange_name, symbol, limit=10):
+async def fetch_ccxt_exchange_order_book(exchange_name, symbol, limit=10, registry=None, arrays=False):
     """
     Fetches the order book from the specified exchange and transforms it.
 
@@ -96,23 +186,27 @@ async def fetch_ccxt_exchange_order_book(exchange_name, symbol, limit=10):
     - exchange_name (str): Name of the exchange (e.g., 'kraken', 'binance').
     - symbol (str): Trading symbol for the order book (e.g., 'BTC/USD').
     - limit (int): Number of order book levels to retrieve (default is 10).
+    - registry (ExchangeRegistry): Registry with long-lived exchange clients. A temporary registry is used if not given.
+    - arrays (bool): Return an OrderBook instead of order tuples.
 
     Returns:
-    - list: Transformed order book containing tuples (price, quantity, ask/bid, exchange).
+    - list or OrderBook: Transformed order book containing tuples (price, quantity, ask/bid, exchange).
     """
     try:
-         # Get the CCXT exchange class dynamically
-        exchange_class = getattr(ccxt, exchange_name.lower())  # Assuming exchange names are lowercase
-
-        # Create an instance of the exchange class
-        exchange = exchange_class()
-
-        # Use asyncio.to_thread to run synchronous code (requests) in a separate thread
         # print(f'Started to fetch {exchange_name} orderbook at: {pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")}')
-        order_book = await asyncio.to_thread(exchange.fetch_order_book, symbol, limit)
+        if registry is None:
+            temporary_registry = ExchangeRegistry()
+            try:
+                order_book = await temporary_registry.fetch_order_book(exchange_name, symbol, limit)
+            finally:
+                await temporary_registry.close()
+        else:
+            order_book = await registry.fetch_order_book(exchange_name, symbol, limit)
         # print(f'Received {exchange_name} orderbook at: {pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")}')
         #transform book
-        return transform_ccxt_exchange_order_book(order_book, exchange_name)
+        if arrays:
+            return ccxt_order_book_arrays(order_book, exchange_name, time.time())
+        return transform_ccxt_exchange_order_book(order_book, exchange_name, time.time())
 
     except ccxt.NetworkError as e:
         timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")     
@@ -124,21 +218,25 @@ async def fetch_ccxt_exchange_order_book(exchange_name, symbol, limit=10):
         timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")     
         print(f"An error occurred: {e}, {timestamp}")
     except asyncio.CancelledError:
-        print(f"{exchange} Orderbook fetching terminated by user.")
+        print(f"{exchange_name} Orderbook fetching terminated by user.")
         return None, None
 
 
-async def get_orderbooks():
+async def get_orderbooks(coinmetro_client=None, registry=None):
     """
     Fetches order book data concurrently from Coinmetro and Kraken.
 
+    Parameters:
+    - coinmetro_client (CoinmetroClient): Client with a persistent connection pool for Coinmetro.
+    - registry (ExchangeRegistry): Registry with long-lived CCXT exchange clients for Kraken.
+
     Returns:
     - list: A list containing bid and ask information for Coinmetro and Kraken.
     """
     try:
         # Use asyncio.create_task to start both tasks concurrently
-        kraken_orders_task = asyncio.create_task(fetch_ccxt_exchange_order_book("kraken", "XXBTZEUR"))
-        coinmetro_orders_task = asyncio.create_task(fetch_coinmetro_order_book())
+        kraken_orders_task = asyncio.create_task(fetch_ccxt_exchange_order_book("kraken", "XXBTZEUR", registry=registry))
+        coinmetro_orders_task = asyncio.create_task(fetch_coinmetro_order_book(coinmetro_client))
 
         # Use asyncio.gather to wait for both tasks to complete
         kraken_orders, coinmetro_orders = await asyncio.gather(kraken_orders_task, coinmetro_orders_task)
@@ -146,4 +244,33 @@ async def get_orderbooks():
         
     except asyncio.CancelledError:
         print("Orderbook fetching terminated by user.")
-        return None, None
\ No newline at end of file
+        return None, None
+
+
+async def get_venue_orderbooks(exchange_names, symbol='BTC/EUR', coinmetro_client=None, registry=None, limit=10, latency=None, arrays=False):
+    """
+    Fetches order book data concurrently from Coinmetro and any number of CCXT exchanges.
+
+    Parameters:
+    - exchange_names (list): Names of the CCXT exchanges (e.g., ['kraken', 'bitstamp']).
+    - symbol (str): Unified trading symbol of the CCXT exchanges (e.g., 'BTC/EUR').
+    - coinmetro_client (CoinmetroClient): Client with a persistent connection pool for Coinmetro.
+    - registry (ExchangeRegistry): Registry with long-lived CCXT exchange clients.
+    - limit (int): Number of order book levels to retrieve from the CCXT exchanges.
+    - latency (LatencyTracker): Records the fetch latency of every exchange.
+    - arrays (bool): Return an OrderBook per exchange instead of order lists, see ArbitragePipeline.match.
+
+    Returns:
+    - list: Order lists of Coinmetro and the CCXT exchanges in the given order, None for an exchange that failed.
+    """
+    try:
+        fetches = [('coinmetro', fetch_coinmetro_order_book(coinmetro_client, coinmetro_pair(symbol), arrays))]
+        fetches += [(exchange_name, fetch_ccxt_exchange_order_book(exchange_name, symbol, limit, registry, arrays)) for exchange_name in exchange_names]
+        if latency is not None:
+            fetches = [(venue, latency.fetch(venue, fetch)) for venue, fetch in fetches]
+        tasks = [asyncio.create_task(fetch) for venue, fetch in fetches]
+        return list(await asyncio.gather(*tasks))
+
+    except asyncio.CancelledError:
+        print("Orderbook fetching terminated by user.")
+        return [None] * (len(exchange_names) + 1)
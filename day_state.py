@@ -0,0 +1,108 @@
+"""
+day_state.py
+
+This module rolls the state of the bot over at midnight. The journals are named after their day, so the rows of a
+new day go to new files instead of the files of the day the bot was started, and the ledger of the filled orders
+drops the orders that left the books.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from save_results import export_journals_to_excel
+from trade_journal import matched_orders_journal, trades_journal, venue_deltas_journal
+
+
+class RollingDayState:
+    """
+    Journals of the current day of one symbol and the ledger of the filled orders.
+
+    Checking for a new day compares the clock with the next midnight, so it can run for every snapshot.
+    """
+
+    def __init__(self, path="", symbol=None, filled_orders_ledger=None, export_to_excel=False, clock=time.time):
+        """
+        Parameters:
+        - path (str or Path): Directory of the journals.
+        - symbol (str): Trading symbol of the journals. Defaults to the default symbol of trade_journal.
+        - filled_orders_ledger (FilledOrdersLedger): Ledger of the filled orders, evicted at every new day. None if the
+          ledger is kept elsewhere, e.g. in a worker process.
+        - export_to_excel (bool): Export the journals of a day to Excel files when the day ends.
+        - clock (callable): Function returning the current time in seconds since the epoch.
+        """
+        self.path = path
+        self.symbol = symbol
+        self.filled_orders_ledger = filled_orders_ledger
+        self.export_to_excel = export_to_excel
+        self.clock = clock
+        self.rollovers = 0
+        self.day = None
+        self.journals = None
+        self.next_rollover = 0.0
+        self.export_task = None
+        self._open_day(clock())
+
+    def due(self):
+        """
+        Returns:
+        - bool: True once the day of the journals has ended.
+        """
+        return self.clock() >= self.next_rollover
+
+    def roll(self, writer=None):
+        """
+        Starts the journals of the new day if the day has ended. With 'export_to_excel', the journals of the day that
+        ended are exported in the background once the writer has written their rows, which needs a running event loop.
+
+        Parameters:
+        - writer (JournalWriter): Background writer of the journals.
+
+        Returns:
+        - bool: True if a new day was started.
+        """
+        if not self.due():
+            return False
+        ended_journals = self.journals
+        self._open_day(self.clock())
+        self.rollovers += 1
+        if self.filled_orders_ledger is not None:
+            self.filled_orders_ledger.evict()
+        if self.export_to_excel:
+            self.export_task = asyncio.create_task(self._export(ended_journals, writer))
+        return True
+
+    async def close(self):
+        """
+        Waits for the export of the day that ended last.
+        """
+        if self.export_task is not None:
+            await self.export_task
+            self.export_task = None
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Day of the journals, days rolled over, and the orders in the ledger and dropped from it.
+        """
+        metrics = {'day': self.day, 'rollovers': self.rollovers}
+        if self.filled_orders_ledger is not None:
+            metrics['ledger_orders'] = len(self.filled_orders_ledger)
+            metrics['ledger_evicted'] = self.filled_orders_ledger.evicted
+        return metrics
+
+    async def _export(self, journals, writer):
+        if writer is not None:
+            await writer.flush()
+        await asyncio.to_thread(export_journals_to_excel, *journals)
+
+    def _open_day(self, now):
+        # Journals are named after the local day, like pd.Timestamp.now() names them
+        moment = datetime.fromtimestamp(now)
+        self.day = moment.strftime("%Y-%m-%d")
+        self.next_rollover = datetime.combine(moment.date() + timedelta(days=1), datetime.min.time()).timestamp()
+        self.journals = (matched_orders_journal(self.path, self.day, self.symbol), trades_journal(self.path, self.day, self.symbol),
+                         venue_deltas_journal(self.path, self.day, self.symbol))
+        # Excel files of the day saved before the journals are exported over at the end of the day, their rows are
+        # taken over before the first row is written
+        for journal in self.journals:
+            journal.import_excel()
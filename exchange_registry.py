@@ -0,0 +1,105 @@
+"""
+exchange_registry.py
+
+This module keeps one asynchronous CCXT client per exchange for the lifetime of the bot, with its markets and fees
+loaded once and refreshed after a time to live.
+"""
+import time
+
+import ccxt.async_support as ccxt_async
+
+
+class ExchangeRegistry:
+    """
+    Creates every CCXT exchange client once and caches its markets. Call 'close' when done.
+    """
+
+    def __init__(self, markets_ttl=3600.0, exchange_config=None):
+        """
+        Parameters:
+        - markets_ttl (float): Seconds after which markets and fees are loaded again.
+        - exchange_config (dict): Config passed to every CCXT exchange class.
+        """
+        self.markets_ttl = markets_ttl
+        self.exchange_config = {'enableRateLimit': True} if exchange_config is None else exchange_config
+        self.exchanges = {}
+        self.markets_loaded_at = {}
+
+    def get(self, exchange_name):
+        """
+        Returns the client of an exchange, creating it on first use.
+
+        Parameters:
+        - exchange_name (str): Name of the exchange (e.g., 'kraken', 'binance').
+
+        Returns:
+        - ccxt.async_support.Exchange: The exchange client.
+        """
+        exchange_name = exchange_name.lower()
+        if exchange_name not in self.exchanges:
+            exchange_class = getattr(ccxt_async, exchange_name)
+            self.exchanges[exchange_name] = exchange_class(dict(self.exchange_config))
+        return self.exchanges[exchange_name]
+
+    async def load_markets(self, exchange_name):
+        """
+        Loads the markets of an exchange if they are not loaded yet or older than the time to live.
+
+        Parameters:
+        - exchange_name (str): Name of the exchange.
+
+        Returns:
+        - dict: Markets of the exchange by symbol.
+        """
+        exchange = self.get(exchange_name)
+        loaded_at = self.markets_loaded_at.get(exchange.id)
+        if loaded_at is None or time.monotonic() - loaded_at > self.markets_ttl:
+            await exchange.load_markets(reload=loaded_at is not None)
+            self.markets_loaded_at[exchange.id] = time.monotonic()
+        return exchange.markets
+
+    async def fetch_order_book(self, exchange_name, symbol, limit=10):
+        """
+        Fetches the raw order book of a symbol.
+
+        Parameters:
+        - exchange_name (str): Name of the exchange.
+        - symbol (str): Trading symbol or market id (e.g., 'BTC/EUR').
+        - limit (int): Number of order book levels to retrieve.
+
+        Returns:
+        - dict: Raw CCXT order book.
+        """
+        await self.load_markets(exchange_name)
+        return await self.get(exchange_name).fetch_order_book(symbol, limit)
+
+    def request_rate(self, exchange_name):
+        """
+        Parameters:
+        - exchange_name (str): Name of the exchange.
+
+        Returns:
+        - float: Requests per second allowed by the CCXT rate limit of the exchange.
+        """
+        return 1000.0 / self.get(exchange_name).rateLimit
+
+    async def taker_fee(self, exchange_name, symbol):
+        """
+        Parameters:
+        - exchange_name (str): Name of the exchange.
+        - symbol (str): Trading symbol (e.g., 'BTC/EUR').
+
+        Returns:
+        - float: Taker fee rate of the symbol (e.g., 0.0026 for 0.26%).
+        """
+        markets = await self.load_markets(exchange_name)
+        return float(markets[symbol]['taker'])
+
+    async def close(self):
+        """
+        Closes the connections of all exchange clients.
+        """
+        for exchange in self.exchanges.values():
+            await exchange.close()
+        self.exchanges = {}
+        self.markets_loaded_at = {}
@@ -0,0 +1,223 @@
+"""
+fee_sweep.py
+
+This module sweeps the taker fees of the exchanges over a grid and matches recorded snapshots for every fee table and
+set of exchanges, to see how the profit depends on the fee tiers. The result is a profit surface: one row per fee
+table and set of exchanges with the total profit, the snapshots with matches and the traded volume.
+
+The recordings are read once into a shared memory block. The worker processes map it without copying, so a task
+only sends its fee table. Every snapshot is matched on its own with an empty ledger, see batch_matching.
+
+Usage: python fee_sweep.py <recording> [<recording> ...] --fees coinmetro=0,0.05,0.1 --fees kraken=0.1,0.16,0.24
+       [--venues coinmetro,kraken] [--workers 4] [--output profit_surface.csv]
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from batch_matching import BookBatch, match_batch
+from snapshot_recorder import LEVEL_DTYPE, read_snapshot_levels
+
+# Levels of all recordings, with the number of their snapshot. Exchange codes are shared by all recordings.
+SWEEP_LEVEL_DTYPE = np.dtype([('snapshot', '<i8'), ('price', '<f8'), ('quantity', '<f8'), ('side', 'i1'), ('venue', '<u2')])
+
+# Levels mapped by a worker process, see _attach_levels
+_worker_levels = {}
+
+
+def read_recordings(file_paths):
+    """
+    Reads the snapshots of recordings into one array of levels.
+
+    Parameters:
+    - file_paths (list): Paths of the recordings, see SnapshotRecorder.
+
+    Returns:
+    - tuple: Levels as a SWEEP_LEVEL_DTYPE array, the number of snapshots and the exchange names by venue code.
+    """
+    venue_codes = {}
+    parts = []
+    snapshot_count = 0
+    for file_path in file_paths:
+        snapshots = [(levels, file_venues) for timestamp, levels, file_venues in read_snapshot_levels(file_path)]
+        if not snapshots:
+            continue
+        # Every recording numbers its exchanges on its own, the names of the last snapshot cover all of its codes
+        codes = np.array([venue_codes.setdefault(exchange, len(venue_codes)) for exchange in snapshots[-1][1]], dtype=np.uint16)
+        levels = np.concatenate([levels.view(np.uint8) for levels, file_venues in snapshots]).view(LEVEL_DTYPE)
+        part = np.empty(len(levels), dtype=SWEEP_LEVEL_DTYPE)
+        part['snapshot'] = np.repeat(np.arange(snapshot_count, snapshot_count + len(snapshots)), [len(levels) for levels, file_venues in snapshots])
+        part['price'] = levels['price']
+        part['quantity'] = levels['quantity']
+        part['side'] = levels['side']
+        part['venue'] = codes[levels['venue']]
+        parts.append(part)
+        snapshot_count += len(snapshots)
+    levels = np.concatenate(parts) if parts else np.empty(0, dtype=SWEEP_LEVEL_DTYPE)
+    return levels, snapshot_count, list(venue_codes)
+
+
+def fee_tables(fee_grid):
+    """
+    Lists every combination of the fees of a grid.
+
+    Parameters:
+    - fee_grid (dict): Taker fee rates to try by exchange name (e.g., {'kraken': [0.0016, 0.0024]}).
+
+    Returns:
+    - list: Fee tables mapping the exchange name to a (maker fee, taker fee) tuple.
+    """
+    exchanges = list(fee_grid)
+    return [{exchange: (fee, fee) for exchange, fee in zip(exchanges, fees)} for fees in itertools.product(*fee_grid.values())]
+
+
+def match_levels(levels, snapshot_count, venues, fee_table, exchanges=None):
+    """
+    Matches every snapshot with the fees of one fee table.
+
+    Parameters:
+    - levels (np.ndarray): Levels as a SWEEP_LEVEL_DTYPE array, see read_recordings.
+    - snapshot_count (int): Number of snapshots.
+    - venues (list): Exchange names by venue code.
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+    - exchanges (tuple): Names of the exchanges to match, the levels of the others are left out. All exchanges if None.
+
+    Returns:
+    - dict: One row of the profit surface.
+
+    Raises:
+    - ValueError: If an exchange that is matched is not in the fee table.
+    """
+    if exchanges is not None:
+        codes = [code for code, exchange in enumerate(venues) if exchange in exchanges]
+        levels = levels[np.isin(levels['venue'], codes)]
+        # The exchanges that are left out need no fees
+        fee_table = {**{exchange: (0.0, 0.0) for exchange in venues if exchange not in exchanges}, **fee_table}
+    batch = BookBatch.from_levels(levels, levels['snapshot'], snapshot_count, venues, fee_table)
+    profit, base_deltas, quote_deltas, fill_counts = match_batch(batch)
+    row = {f'{exchange} Fee': fee_table[exchange][1] for exchange in (exchanges or venues)}
+    row.update({
+        'Exchanges': '+'.join(exchanges if exchanges is not None else venues),
+        'Total Profit': float(profit.sum()),
+        'Snapshots': snapshot_count,
+        'Matches': int(np.count_nonzero(fill_counts)),
+        'Base Volume': float(np.clip(base_deltas, 0, None).sum()),
+    })
+    return row
+
+
+def _attach_levels(memory_name, level_count, snapshot_count, venues):
+    # Worker process initializer: maps the levels of the shared memory block once for all tasks
+    memory = SharedMemory(name=memory_name)
+    _worker_levels['memory'] = memory
+    _worker_levels['levels'] = np.ndarray(level_count, dtype=SWEEP_LEVEL_DTYPE, buffer=memory.buf)
+    _worker_levels['snapshot_count'] = snapshot_count
+    _worker_levels['venues'] = venues
+
+
+def _match_shared_levels(fee_table, exchanges):
+    return match_levels(_worker_levels['levels'], _worker_levels['snapshot_count'], _worker_levels['venues'], fee_table, exchanges)
+
+
+def sweep_fees(file_paths, fee_grid, venue_sets=None, workers=None):
+    """
+    Matches the snapshots of recordings for every combination of fees and every set of exchanges, spread over
+    worker processes.
+
+    Parameters:
+    - file_paths (list): Paths of the recordings, see SnapshotRecorder.
+    - fee_grid (dict): Taker fee rates to try by exchange name (e.g., {'kraken': [0.0016, 0.0024]}). Every exchange
+      that is matched needs fees.
+    - venue_sets (list): Tuples of exchange names that are matched together. All exchanges of the recordings if None.
+    - workers (int): Number of worker processes, one per CPU if None. 0 matches in this process.
+
+    Returns:
+    - pd.DataFrame: Profit surface, one row per fee table and set of exchanges.
+
+    Raises:
+    - ValueError: If an exchange that is matched has no fees in the grid.
+    """
+    levels, snapshot_count, venues = read_recordings(file_paths)
+    tasks = []
+    for exchanges in venue_sets or [None]:
+        # Only the fees of the exchanges that are matched are swept
+        exchanges = tuple(exchanges) if exchanges is not None else None
+        grid = {exchange: fees for exchange, fees in fee_grid.items() if exchanges is None or exchange in exchanges}
+        tasks += [(fee_table, exchanges) for fee_table in fee_tables(grid)]
+    if workers == 0:
+        return pd.DataFrame([match_levels(levels, snapshot_count, venues, fee_table, exchanges) for fee_table, exchanges in tasks])
+
+    # The levels are copied once into shared memory instead of being pickled for every task
+    memory = SharedMemory(create=True, size=max(levels.nbytes, 1))
+    try:
+        np.ndarray(len(levels), dtype=SWEEP_LEVEL_DTYPE, buffer=memory.buf)[:] = levels
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_attach_levels,
+                                 initargs=(memory.name, len(levels), snapshot_count, venues)) as pool:
+            rows = list(pool.map(_match_shared_levels, *zip(*tasks)))
+    finally:
+        memory.close()
+        memory.unlink()
+    return pd.DataFrame(rows)
+
+
+def profit_surface(results, row_exchange, column_exchange):
+    """
+    Turns the results of a sweep of two exchanges into a table of the total profit.
+
+    Parameters:
+    - results (pd.DataFrame): Results of sweep_fees.
+    - row_exchange (str): Exchange whose fees are the rows.
+    - column_exchange (str): Exchange whose fees are the columns.
+
+    Returns:
+    - pd.DataFrame: Total profit by the fee of both exchanges, for every set of exchanges.
+    """
+    return results.pivot_table(index=['Exchanges', f'{row_exchange} Fee'], columns=f'{column_exchange} Fee', values='Total Profit', aggfunc='sum')
+
+
+def parse_fee_grid(fee_arguments):
+    """
+    Parses fee grid arguments of the form 'exchange=fee,fee,...', with fees in percent.
+
+    Parameters:
+    - fee_arguments (list): Arguments (e.g., ['kraken=0.16,0.24']).
+
+    Returns:
+    - dict: Taker fee rates by exchange name.
+
+    Raises:
+    - ValueError: If an argument has no '=' or a fee is not a number.
+    """
+    fee_grid = {}
+    for argument in fee_arguments:
+        exchange, separator, fees = argument.partition('=')
+        if not separator:
+            raise ValueError(f"Expected exchange=fee,fee,... but got {argument!r}")
+        fee_grid[exchange] = [float(fee) / 100 for fee in fees.split(',')]
+    return fee_grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep the exchange fees over recorded order book snapshots and write the profit surface.")
+    parser.add_argument('recordings', nargs='+', help="Paths of the recordings")
+    parser.add_argument('--fees', action='append', default=[], help="Fees in percent to try for an exchange, e.g. kraken=0.16,0.24")
+    parser.add_argument('--venues', action='append', help="Exchanges matched together, e.g. coinmetro,kraken. All exchanges if not given")
+    parser.add_argument('--workers', type=int, help="Number of worker processes, one per CPU if not given")
+    parser.add_argument('--output', default='profit_surface.csv', help="CSV file of the profit surface")
+    arguments = parser.parse_args()
+
+    fee_grid = parse_fee_grid(arguments.fees or ['coinmetro=0,0.05,0.1', 'kraken=0.1,0.16,0.24'])
+    venue_sets = [venues.split(',') for venues in arguments.venues] if arguments.venues else None
+    start = time.perf_counter()
+    results = sweep_fees(arguments.recordings, fee_grid, venue_sets, arguments.workers)
+    print(f"Matched {len(results)} fee tables in {time.perf_counter() - start:.3f} s")
+    results.to_csv(arguments.output, index=False)
+    print(f"Profit surface written to {arguments.output}")
+    if len(fee_grid) == 2:
+        print(profit_surface(results, *fee_grid))
@@ -0,0 +1,153 @@
+"""
+filled_orders_ledger.py
+
+This module keeps track of the resting orders that have been matched today, so that a new order book only offers
+what is left of them.
+"""
+import heapq
+import time
+from itertools import repeat
+
+import numpy as np
+
+
+class FilledOrdersLedger:
+    """
+    Minimum remaining quantity of every matched resting order, keyed by (exchange, ask/bid, price, quantity).
+
+    Fully filled orders are not kept: like before, an order that shows up again after being filled is treated as
+    a new order. Lookups cost one dictionary access per book level, however many trades are recorded.
+
+    Orders that have left the books are dropped after 'max_age' seconds, and the ledger keeps at most 'max_orders'
+    orders, so that its memory stays bounded when the bot runs for weeks. An order is seen when it is matched or found
+    in a book. Finding the orders to drop takes one pass over the ledger, so it runs every tenth of 'max_age' and,
+    when the ledger is full, drops a tenth of the orders at once.
+    """
+
+    def __init__(self, max_age=None, max_orders=None, clock=time.time):
+        """
+        Parameters:
+        - max_age (float): Seconds after which an order that was not seen is dropped. Kept if None.
+        - max_orders (int): Number of orders kept, the orders seen longest ago are dropped first. Not limited if None.
+        - clock (callable): Function returning the current time in seconds.
+        """
+        self.min_remaining = {}
+        # Time every order was last seen, only kept with a limit
+        self.last_seen = {}
+        self.max_age = max_age
+        self.max_orders = max_orders
+        self.clock = clock
+        self.limited = max_age is not None or max_orders is not None
+        self.next_eviction = clock() + max_age / 10 if max_age is not None else np.inf
+        self.evicted = 0
+
+    @classmethod
+    def from_dataframe(cls, matched_orders_today, **limits):
+        """
+        Builds the ledger from the matched orders of the day.
+
+        Parameters:
+        - matched_orders_today (pd.DataFrame): Matched orders with 'Exchange', 'Ask/Bid', 'Price', 'Quantity' and 'Remaining Quantity' columns.
+        - limits: 'max_age', 'max_orders' and 'clock' of the ledger.
+
+        Returns:
+        - FilledOrdersLedger: Ledger containing the matched orders.
+        """
+        ledger = cls(**limits)
+        if not matched_orders_today.empty:
+            ledger.record_orders(matched_orders_today['Exchange'], matched_orders_today['Ask/Bid'], matched_orders_today['Price'],
+                                 matched_orders_today['Quantity'], matched_orders_today['Remaining Quantity'])
+        return ledger
+
+    def __len__(self):
+        return len(self.min_remaining)
+
+    def record(self, matched_trades):
+        """
+        Adds the matched trades returned by match_orders to the ledger.
+
+        Parameters:
+        - matched_trades (list): List of matched trade dictionaries.
+        """
+        self.record_orders((trade['Exchange'] for trade in matched_trades), (trade['Ask/Bid'] for trade in matched_trades),
+                           (trade['Price'] for trade in matched_trades), (trade['Quantity'] for trade in matched_trades),
+                           (trade['Remaining Quantity'] for trade in matched_trades))
+
+    def record_orders(self, exchanges, sides, prices, quantities, remaining_quantities):
+        """
+        Adds matched orders to the ledger, keeping the lowest remaining quantity of every order.
+
+        Parameters:
+        - exchanges (iterable): Exchange names.
+        - sides (iterable): 'Ask' or 'Bid'.
+        - prices (iterable): Order prices.
+        - quantities (iterable): Order quantities.
+        - remaining_quantities (iterable): Quantities left after matching.
+        """
+        min_remaining = self.min_remaining
+        last_seen = self.last_seen if self.limited else {}
+        now = self.clock() if self.limited else 0.0
+        for exchange, side, price, quantity, remaining_quantity in zip(exchanges, sides, prices, quantities, remaining_quantities):
+            key = (exchange, side, float(price), float(quantity))
+            if remaining_quantity > 0:
+                min_remaining[key] = min(remaining_quantity, min_remaining.get(key, remaining_quantity))
+                last_seen[key] = now
+            elif key in min_remaining:
+                # Filled now, the order is done with
+                del min_remaining[key]
+                last_seen.pop(key, None)
+        if self.limited and (now >= self.next_eviction or (self.max_orders is not None and len(min_remaining) > self.max_orders)):
+            self.evict(now)
+
+    def remaining_quantities(self, exchanges, sides, prices, quantities):
+        """
+        Looks up the remaining quantity of every order in one pass.
+
+        Parameters:
+        - exchanges (iterable): Exchange names.
+        - sides (iterable): 'Ask' or 'Bid'.
+        - prices (np.ndarray): Order prices.
+        - quantities (np.ndarray): Order quantities.
+
+        Returns:
+        - np.ndarray: Remaining quantity of every order, infinity for orders not in the ledger.
+        """
+        keys = zip(exchanges, sides, np.asarray(prices, dtype=np.float64).tolist(), np.asarray(quantities, dtype=np.float64).tolist())
+        if not self.limited:
+            return np.fromiter(map(self.min_remaining.get, keys, repeat(np.inf)), dtype=np.float64, count=len(prices))
+        keys = list(keys)
+        remaining = np.fromiter(map(self.min_remaining.get, keys, repeat(np.inf)), dtype=np.float64, count=len(keys))
+        # The orders found are still in the books
+        found = np.flatnonzero(remaining != np.inf).tolist()
+        if found:
+            self.last_seen.update(zip(map(keys.__getitem__, found), repeat(self.clock())))
+        return remaining
+
+    def evict(self, now=None):
+        """
+        Drops the orders not seen for 'max_age' seconds and, above 'max_orders' orders, the orders seen longest ago
+        down to nine tenths of 'max_orders'.
+
+        Parameters:
+        - now (float): Current time in seconds. Defaults to the clock of the ledger.
+
+        Returns:
+        - int: Number of orders dropped.
+        """
+        if not self.limited:
+            return 0
+        now = self.clock() if now is None else now
+        last_seen = self.last_seen
+        dropped = []
+        if self.max_age is not None:
+            dropped = [key for key, seen in last_seen.items() if now - seen > self.max_age]
+            self.next_eviction = now + self.max_age / 10
+        if self.max_orders is not None and len(last_seen) - len(dropped) > self.max_orders:
+            dropped_keys = set(dropped)
+            excess = len(last_seen) - len(dropped) - self.max_orders * 9 // 10
+            dropped += heapq.nsmallest(excess, (key for key in last_seen if key not in dropped_keys), key=last_seen.__getitem__)
+        for key in dropped:
+            del last_seen[key]
+            del self.min_remaining[key]
+        self.evicted += len(dropped)
+        return len(dropped)
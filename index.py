@@ -4,66 +4,165 @@ index.py
 This is the main file for bot that finds crypto arbitrage opportunities between exchanges.
 """
 import asyncio
+
 import pandas as pd
 
-from data_fetch import get_orderbooks
-from orderbook_preparation import combine_and_sort_order_book, calculate_fees, clean_order_book, update_filled_orders
-from matching_engine import match_orders
-from save_results import update_and_save_filled_orders, create_and_save_daily_profit_entry
+from data_fetch import get_venue_orderbooks
+from coinmetro_client import CoinmetroClient, COINMETRO_REQUESTS_PER_SECOND
+from day_state import RollingDayState
+from exchange_registry import ExchangeRegistry
+from filled_orders_ledger import FilledOrdersLedger
+from inventory import Inventory
+from latency import LatencyTracker
+from orderbook_preparation import build_fee_table
+from pipeline import ArbitragePipeline
+from save_results import export_journals_to_excel
+from persistence import JournalWriter
+from snapshot_recorder import SnapshotRecorder
+from staleness import StalenessGuard
+from scheduler import TokenBucket, RateLimitedFeed
+from symbol_shards import SymbolShardCoordinator
+from streaming import StreamingOrderBooks, WebSocketFeed, PollingFeed, KRAKEN_WS_URL, kraken_subscribe_message, parse_kraken_book_message, coinmetro_snapshot_message, ccxt_snapshot_message
 from user_input import get_user_input
-from read_starting_info import initialize_matched_orders_today, initialize_trades_today
+from read_starting_info import initialize_matched_orders_today, fetch_taker_fee
 
+# Attempts at fetching the Kraken taker fee before falling back to the default fee of user_input
+FEE_FETCH_ATTEMPTS = 3
 
-async def main():
-    # Initialize variables and read previous data into memory
-    total_profit = 0
-    coinmetro_fee, kraken_fee, sleep_duration = get_user_input()
-    matched_orders_today = initialize_matched_orders_today()
-    trades_today = initialize_trades_today()
+# Export the journals of a day to Excel files when the day ends and when the script stops
+EXPORT_TO_EXCEL = True
 
-    # Loop searching for arbitrage opportunities until termination by user.
-    while True:
-        # Fetch the bids and asks from Coinmetro and Kraken
-        coinmetro_orders, kraken_orders = await get_orderbooks()
+# How order books are fetched:
+# 'scheduled' - fetch every exchange as fast as its rate limit allows and match on every top of book change
+# 'streaming' - stream the Kraken order book and poll Coinmetro every interval
+# 'polling'   - fetch both exchanges, match and pause for the interval
+# 'sharded'   - poll all SYMBOLS every interval, split over SHARDS worker processes
+RUN_MODE = 'scheduled'
 
-        #Check if orders are not None, i.e. there wasn't any error
-        if coinmetro_orders is None or kraken_orders is None:
-            print("\nError fetching order books. Terminating.")
-            break
+# CCXT exchanges matched against Coinmetro and each other, and their unified symbol
+CCXT_VENUES = ['kraken']
+SYMBOL = 'BTC/EUR'
+
+# Symbols scanned in 'sharded' mode and the number of worker processes, one per CPU if None
+SYMBOLS = ['BTC/EUR', 'ETH/EUR', 'XRP/EUR', 'SOL/EUR', 'ADA/EUR']
+SHARDS = None
+
+# Record every processed snapshot to this file for replay.py, nothing is recorded if None
+RECORD_PATH = None
 
-        # Combine and sort orderbooks
-        book = combine_and_sort_order_book(coinmetro_orders, kraken_orders)
+# Time the fetches and pipeline stages. The p50/p99 latencies are served as Prometheus text on METRICS_PORT if set,
+# and printed as a JSON line every METRICS_LOG_INTERVAL seconds if set
+LATENCY_METRICS = True
+METRICS_PORT = None
+METRICS_LOG_INTERVAL = 60
 
-        # Calculate fees
-        book = calculate_fees(book, coinmetro_fee, kraken_fee)
+# Books older than MAX_BOOK_AGE seconds are not matched, nor exchange pairs whose books are more than MAX_BOOK_SKEW
+# seconds apart. SKEW_MARGIN is the extra spread rate a pair needs for every second of skew. None disables a check.
+MAX_BOOK_AGE = 2.0
+MAX_BOOK_SKEW = 0.5
+SKEW_MARGIN = 0.0
 
-        # Clean orderbook from orders that cannot be matched and if applicable, display error that no arbitrage opportunities found.
-        book = clean_order_book(book)
+# Levels fetched per side from the CCXT exchanges and kept by the streamed books. For deep books, the levels of the
+# exchanges in PRICE_BUCKETS are added up in buckets of that many EUR, e.g. {'kraken': 1.0}, and EDGE_TRUNCATION drops
+# the levels beyond the depth where the edge is gone before matching.
+ORDER_BOOK_DEPTH = 10
+PRICE_BUCKETS = {}
+EDGE_TRUNCATION = False
 
-        if not book.empty:
-            # Process the existing 'book' data
-            book = update_filled_orders(book, matched_orders_today)
+# BTC and EUR held on every exchange, e.g. {'coinmetro': (0.1, 5000.0), 'kraken': (0.1, 5000.0)}. Fills are limited to
+# the balances, which carry over from cycle to cycle. Fills are not limited if None.
+STARTING_BALANCES = None
 
-            #Save current orderbook for error-checking
-            #timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H-%M-%S")
-            #book.to_excel(timestamp + ' orderbook.xlsx', index=False)
-            
-            # Match orders
-            matched_trades, matching_profit, kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity = match_orders(book)
+# The journals start over at midnight. The ledger of the filled orders drops the orders not seen in any book for
+# LEDGER_MAX_AGE seconds and the least recently seen ones beyond LEDGER_MAX_ORDERS, so its memory stays bounded when
+# running for weeks. None disables a limit.
+LEDGER_MAX_AGE = 3600
+LEDGER_MAX_ORDERS = 100000
 
-            # Update and save filled orders file
-            matched_trades = pd.DataFrame(matched_trades)
-            matched_orders_today = update_and_save_filled_orders(matched_orders_today, matched_trades)
-            
-            # Save daily profit data to excel file and update the variable in memory for later comparison
-            trades_today = create_and_save_daily_profit_entry(trades_today, matching_profit, kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity)
 
-            # Print the matched trades, profit for these matches and total profit so far
-            print("Matched Trades:")
-            print(matched_trades)
-            print(f"Profit for these trades at {pd.Timestamp.now().strftime('%Y-%m-%d %H-%M-%S')}: {matching_profit} EUR")
-            total_profit += matching_profit
-            print(f"Total profit so far while running this instance of the script: {total_profit}\n")
+async def main():
+    # Exchange clients are created once and reused by every fetch
+    registry = ExchangeRegistry()
+    coinmetro_client = CoinmetroClient()
+
+    try:
+        # Initialize variables and read previous data into memory
+        kraken_taker_fee = await fetch_taker_fee(registry, 'kraken', 'BTC/EUR', attempts=FEE_FETCH_ATTEMPTS)
+        coinmetro_fee, kraken_fee, sleep_duration = get_user_input(kraken_taker_fee, ask_interval=RUN_MODE != 'scheduled')
+        fee_table = build_fee_table(coinmetro_fee, kraken_fee)
+        ccxt_venues = []
+        for exchange_name in CCXT_VENUES:
+            if exchange_name not in fee_table:
+                taker_fee = await fetch_taker_fee(registry, exchange_name, SYMBOL, attempts=FEE_FETCH_ATTEMPTS)
+                if taker_fee is None:
+                    # An exchange without a known fee cannot be matched, the others still are
+                    print(f"No taker fee for {exchange_name}, it is not matched. {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                    continue
+                fee_table[exchange_name] = (taker_fee / 100, taker_fee / 100)
+            ccxt_venues.append(exchange_name)
+        filled_orders_ledger = FilledOrdersLedger.from_dataframe(initialize_matched_orders_today(), max_age=LEDGER_MAX_AGE, max_orders=LEDGER_MAX_ORDERS)
+        day_state = RollingDayState(filled_orders_ledger=filled_orders_ledger, export_to_excel=EXPORT_TO_EXCEL)
+
+        # Journals are written by a background task, the loop only queues the rows
+        writer = JournalWriter().start()
+        recorder = SnapshotRecorder(RECORD_PATH) if RECORD_PATH else None
+        latency = LatencyTracker(enabled=LATENCY_METRICS)
+        staleness_guard = StalenessGuard(MAX_BOOK_AGE, MAX_BOOK_SKEW, SKEW_MARGIN)
+        pipeline = ArbitragePipeline(fee_table, filled_orders_ledger, writer, recorder=recorder, latency=latency,
+                                     staleness_guard=staleness_guard, price_buckets=PRICE_BUCKETS, edge_truncation=EDGE_TRUNCATION,
+                                     inventory=Inventory(STARTING_BALANCES) if STARTING_BALANCES is not None else None, day_state=day_state)
+        coordinator = None
+        metrics_server = await latency.serve(METRICS_PORT) if LATENCY_METRICS and METRICS_PORT else None
+        metrics_log = asyncio.create_task(latency.log_periodically(METRICS_LOG_INTERVAL)) if LATENCY_METRICS and METRICS_LOG_INTERVAL else None
+        try:
+            if RUN_MODE == 'sharded':
+                coordinator = SymbolShardCoordinator(SYMBOLS, ccxt_venues, fee_table, sleep_duration, SHARDS, writer, export_to_excel=EXPORT_TO_EXCEL)
+                await run_sharded(coordinator)
+            elif RUN_MODE == 'scheduled':
+                await run_scheduled(pipeline, ccxt_venues, coinmetro_client, registry)
+            elif RUN_MODE == 'streaming':
+                await run_streaming(pipeline, ccxt_venues, sleep_duration, coinmetro_client, registry)
+            else:
+                await run_loop(pipeline, ccxt_venues, sleep_duration, coinmetro_client, registry)
+        finally:
+            if metrics_log is not None:
+                metrics_log.cancel()
+            if metrics_server is not None:
+                metrics_server.close()
+            await writer.close()
+            await day_state.close()
+            if recorder is not None:
+                recorder.close()
+                print(f"Recorded {recorder.snapshots} snapshots to {RECORD_PATH}")
+            print(f"Pipeline: {pipeline.metrics()}")
+            if LATENCY_METRICS:
+                print(latency.log_line())
+            print(f"Journal writer: {writer.metrics()}")
+            if EXPORT_TO_EXCEL:
+                # The days that ended were exported at midnight, only the current day is left. The journals are read
+                # after the run, since they are replaced at every midnight.
+                if coordinator is not None:
+                    export_journals_to_excel(*coordinator.all_journals())
+                else:
+                    export_journals_to_excel(pipeline.filled_orders, pipeline.trades, pipeline.venue_deltas)
+    finally:
+        await coinmetro_client.close()
+        await registry.close()
+
+
+async def run_loop(pipeline, ccxt_venues, sleep_duration, coinmetro_client, registry):
+    # Loop searching for arbitrage opportunities until termination by user.
+    while True:
+        # Fetch the bids and asks from Coinmetro and the CCXT exchanges
+        order_lists = await get_venue_orderbooks(ccxt_venues, SYMBOL, coinmetro_client, registry, ORDER_BOOK_DEPTH, latency=pipeline.latency, arrays=True)
+
+        #Check if orders are not None, i.e. there wasn't any error
+        if any(orders is None for orders in order_lists):
+            print("\nError fetching order books. Terminating.")
+            break
+
+        # Match the orderbooks, save and print the results
+        await pipeline.process(order_lists)
 
         # Wait for x seconds before restarting the loop
         try:
@@ -73,5 +172,59 @@ async def main():
             print("\nScript terminated by user. (Error code 1)")
             break  # Exit the loop if cancelled
 
+
+async def run_streaming(pipeline, ccxt_venues, sleep_duration, coinmetro_client, registry):
+    # Kraken is streamed, Coinmetro is polled every sleep_duration seconds
+    async def fetch_coinmetro_snapshot():
+        return coinmetro_snapshot_message(await pipeline.latency.fetch('coinmetro', coinmetro_client.fetch_order_book('BTCEUR')))
+
+    feeds = [
+        PollingFeed('coinmetro', fetch_coinmetro_snapshot, sleep_duration),
+        WebSocketFeed('kraken', KRAKEN_WS_URL, [kraken_subscribe_message(SYMBOL, ORDER_BOOK_DEPTH)], parse_kraken_book_message),
+    ]
+    # The other exchanges are fetched as fast as their rate limit allows
+    feeds += [ccxt_feed(exchange_name, registry, pipeline.latency) for exchange_name in ccxt_venues if exchange_name != 'kraken']
+    streaming_books = StreamingOrderBooks(feeds, pipeline.process, depth=ORDER_BOOK_DEPTH, latency=pipeline.latency)
+    try:
+        await streaming_books.run()
+    except asyncio.CancelledError:
+        print("\nScript terminated by user. (Error code 1)")
+    finally:
+        print(f"Streaming: {streaming_books.metrics()}")
+
+
+async def run_scheduled(pipeline, ccxt_venues, coinmetro_client, registry):
+    # Every exchange is fetched as soon as its token bucket allows, the next fetch runs while a snapshot is matched
+    async def fetch_coinmetro_snapshot():
+        return coinmetro_snapshot_message(await pipeline.latency.fetch('coinmetro', coinmetro_client.fetch_order_book('BTCEUR')))
+
+    feeds = [RateLimitedFeed('coinmetro', fetch_coinmetro_snapshot, TokenBucket(COINMETRO_REQUESTS_PER_SECOND))]
+    feeds += [ccxt_feed(exchange_name, registry, pipeline.latency) for exchange_name in ccxt_venues]
+    scheduled_books = StreamingOrderBooks(feeds, pipeline.process, depth=ORDER_BOOK_DEPTH, latency=pipeline.latency)
+    try:
+        await scheduled_books.run()
+    except asyncio.CancelledError:
+        print("\nScript terminated by user. (Error code 1)")
+    finally:
+        print(f"Scheduler: {scheduled_books.metrics()}")
+
+
+async def run_sharded(coordinator):
+    # The shards fetch and match in worker processes, this process only saves and prints the results
+    try:
+        await coordinator.run()
+    except asyncio.CancelledError:
+        print("\nScript terminated by user. (Error code 1)")
+    finally:
+        print(f"Symbol shards: {coordinator.metrics()}")
+
+
+def ccxt_feed(exchange_name, registry, latency):
+    # Feed of a CCXT exchange limited to the request rate of the exchange
+    async def fetch_snapshot():
+        return ccxt_snapshot_message(await latency.fetch(exchange_name, registry.fetch_order_book(exchange_name, SYMBOL, ORDER_BOOK_DEPTH)))
+
+    return RateLimitedFeed(exchange_name, fetch_snapshot, TokenBucket(registry.request_rate(exchange_name)))
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+inventory.py
+
+This module keeps the BTC and EUR held on every exchange. The balances limit how much the matcher can trade: BTC is
+sold on the exchange of the bid, so a fill needs that much BTC there, and it is bought with EUR on the exchange of the
+ask. The balances are updated with the quantities traded in every cycle, so they carry over without reading the
+trades of the day again.
+"""
+
+
+class Inventory:
+    """
+    Base (BTC) and quote (EUR) balance of every exchange, keyed by the lowercase exchange name. Exchanges without a
+    balance hold nothing, so nothing is traded on them.
+    """
+
+    def __init__(self, balances=None):
+        """
+        Parameters:
+        - balances (dict): Starting base and quote balance by exchange name (e.g., {'kraken': (0.5, 20000.0)}).
+        """
+        self.base = {}
+        self.quote = {}
+        for exchange, (base_balance, quote_balance) in (balances or {}).items():
+            self.set_balance(exchange, base_balance, quote_balance)
+
+    def set_balance(self, exchange, base_balance, quote_balance):
+        """
+        Sets the balances of an exchange, e.g. after a deposit or a transfer between exchanges.
+
+        Parameters:
+        - exchange (str): Exchange name.
+        - base_balance (float): BTC held on the exchange.
+        - quote_balance (float): EUR held on the exchange.
+        """
+        self.base[exchange.lower()] = base_balance
+        self.quote[exchange.lower()] = quote_balance
+
+    def balance(self, exchange):
+        """
+        Returns:
+        - tuple: BTC and EUR held on the exchange, zero for an exchange without a balance.
+        """
+        return self.base.get(exchange.lower(), 0.0), self.quote.get(exchange.lower(), 0.0)
+
+    def balance_lists(self, venues):
+        """
+        Lists the balances of exchanges for the matcher, which looks them up by venue code.
+
+        Parameters:
+        - venues (list): Exchange names by venue code.
+
+        Returns:
+        - tuple: List of the BTC and list of the EUR balances, in the order of 'venues'.
+        """
+        balances = [self.balance(exchange) for exchange in venues]
+        return [base_balance for base_balance, quote_balance in balances], [quote_balance for base_balance, quote_balance in balances]
+
+    def apply(self, venue_deltas):
+        """
+        Adds the quantities traded in one cycle to the balances.
+
+        Parameters:
+        - venue_deltas (dict): BTC and EUR quantities traded on every exchange, as returned by match_orders_by_venue.
+        """
+        for exchange, (base_quantity, quote_quantity) in venue_deltas.items():
+            base_balance, quote_balance = self.balance(exchange)
+            self.set_balance(exchange, base_balance + base_quantity, quote_balance + quote_quantity)
+
+    def balances(self):
+        """
+        Returns:
+        - dict: BTC and EUR balance by exchange name.
+        """
+        return {exchange: (self.base[exchange], self.quote[exchange]) for exchange in self.base}
@@ -0,0 +1,232 @@
+"""
+latency.py
+
+This module times the stages of the main loop: the fetch of every exchange, how old each book is when it is matched,
+and the pipeline stages from fees to persistence. The latest timings are kept in rolling windows and exported as
+p50/p99 summaries, as Prometheus text on a local HTTP endpoint or as a periodic JSON log line.
+
+A disabled tracker hands out one shared no-op span and records nothing, so the instrumentation can stay in place.
+"""
+import asyncio
+import contextlib
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.5, 0.99)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class RollingHistogram:
+    """
+    Latest 'window' durations in a ring buffer, with the count and sum of all durations ever recorded.
+    """
+    __slots__ = ('values', 'position', 'filled', 'count', 'total')
+
+    def __init__(self, window=1024):
+        """
+        Parameters:
+        - window (int): Number of latest durations the quantiles are computed from.
+        """
+        # A list takes a float faster than an array, numpy is only used for the quantiles
+        self.values = [0.0] * window
+        self.position = 0
+        self.filled = 0
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.values[self.position] = seconds
+        self.position = (self.position + 1) % len(self.values)
+        self.filled = min(self.filled + 1, len(self.values))
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self, quantiles=QUANTILES):
+        """
+        Returns:
+        - list: Durations at the quantiles of the window, NaN if nothing was recorded.
+        """
+        if not self.filled:
+            return [np.nan] * len(quantiles)
+        return np.quantile(self.values[:self.filled], quantiles).tolist()
+
+    def summary(self):
+        """
+        Returns:
+        - dict: Count, p50, p99 and maximum of the window, in milliseconds.
+        """
+        p50, p99 = self.quantiles()
+        maximum = max(self.values[:self.filled]) if self.filled else np.nan
+        return {'count': self.count, 'p50_ms': round(p50 * 1000, 3), 'p99_ms': round(p99 * 1000, 3), 'max_ms': round(maximum * 1000, 3)}
+
+
+class _Span:
+    __slots__ = ('tracker', 'stage', 'started')
+
+    def __init__(self, tracker, stage):
+        self.tracker = tracker
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = self.tracker.clock()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.tracker.record(self.stage, self.tracker.clock() - self.started)
+
+
+class LatencyTracker:
+    """
+    Rolling latency histograms of the pipeline stages, and of the fetch latency and book age of every exchange.
+    """
+
+    def __init__(self, enabled=True, window=1024, clock=time.perf_counter):
+        """
+        Parameters:
+        - enabled (bool): Record timings. A disabled tracker only costs an attribute check per span.
+        - window (int): Number of latest timings the quantiles are computed from.
+        - clock (callable): Function returning the current time in seconds.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.clock = clock
+        self.stages = {}
+        self.fetches = {}
+        self.ages = {}
+        self.received_at = {}
+
+    def span(self, stage):
+        """
+        Times the code of a 'with' block as one run of a stage.
+
+        Parameters:
+        - stage (str): Name of the stage (e.g., 'matching').
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage)
+
+    def record(self, stage, seconds):
+        """
+        Records one run of a stage.
+        """
+        if self.enabled:
+            self._histogram(self.stages, stage).record(seconds)
+
+    async def fetch(self, venue, awaitable):
+        """
+        Awaits the fetch of an exchange, records its latency and marks the book of the exchange as received.
+
+        Parameters:
+        - venue (str): Name of the exchange.
+        - awaitable (awaitable): The fetch, e.g. a coroutine returning an order list or snapshot.
+
+        Returns:
+        - The result of the fetch.
+        """
+        if not self.enabled:
+            return await awaitable
+        started = self.clock()
+        result = await awaitable
+        finished = self.clock()
+        self._histogram(self.fetches, venue).record(finished - started)
+        if result is not None:
+            self.received_at[venue] = finished
+        return result
+
+    def mark_received(self, venue):
+        """
+        Marks the book of an exchange as received now, e.g. when a streamed update is applied.
+        """
+        if self.enabled:
+            self.received_at[venue] = self.clock()
+
+    def record_book_ages(self):
+        """
+        Records how long ago the book of every exchange was received, called when the books are matched.
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        for venue, received_at in self.received_at.items():
+            self._histogram(self.ages, venue).record(now - received_at)
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Summaries of the stages, and of the fetch latency and book age by exchange, see RollingHistogram.summary.
+        """
+        return {
+            'stages': {stage: histogram.summary() for stage, histogram in self.stages.items()},
+            'fetch': {venue: histogram.summary() for venue, histogram in self.fetches.items()},
+            'book_age': {venue: histogram.summary() for venue, histogram in self.ages.items()},
+        }
+
+    def log_line(self):
+        """
+        Returns:
+        - str: The metrics with a timestamp as one JSON line.
+        """
+        return json.dumps({'timestamp': pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"), 'latency': self.metrics()})
+
+    def prometheus_text(self):
+        """
+        Returns:
+        - str: The histograms in the Prometheus text exposition format, as summaries in seconds.
+        """
+        lines = []
+        for name, label, histograms, description in (
+                ('arbitrage_stage_seconds', 'stage', self.stages, "Duration of the pipeline stages."),
+                ('arbitrage_fetch_seconds', 'venue', self.fetches, "Order book fetch latency by exchange."),
+                ('arbitrage_book_age_seconds', 'venue', self.ages, "Age of the order book of every exchange when matched.")):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} summary")
+            for key, histogram in histograms.items():
+                for quantile, value in zip(QUANTILES, histogram.quantiles()):
+                    lines.append(f'{name}{{{label}="{key}",quantile="{quantile}"}} {value!r}')
+                lines.append(f'{name}_sum{{{label}="{key}"}} {histogram.total!r}')
+                lines.append(f'{name}_count{{{label}="{key}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port, host='127.0.0.1'):
+        """
+        Starts a local HTTP endpoint that answers every request with the Prometheus text.
+
+        Parameters:
+        - port (int): Port to listen on.
+        - host (str): Address to listen on, only the local machine by default.
+
+        Returns:
+        - asyncio.Server: The running server, close it to stop.
+        """
+        async def handle(reader, writer):
+            try:
+                # Read the request up to the blank line ending the headers, the path is not looked at
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                body = self.prometheus_text().encode('utf-8')
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+    async def log_periodically(self, interval):
+        """
+        Prints the JSON log line every 'interval' seconds until the task is cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            print(self.log_line())
+
+    def _histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = RollingHistogram(self.window)
+        return histogram
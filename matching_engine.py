@@ -3,12 +3,279 @@ matching_engine.py
 
 This module contains the code to match orders to find arbitrage opportunities.
 """
+import numpy as np
 import pandas as pd
 
-def match_orders(book):
+from order_book import OrderBook, ASK, BID
+
+
+def sweep_sorted_sides(ask_net_prices, ask_remaining, bid_net_prices, bid_remaining, ask_venues=None, bid_venues=None, base_balances=None,
+                       quote_balances=None, venue_pairs=None):
+    """
+    Matches the ask side against the bid side with a greedy two-pointer sweep.
+
+    Both sides must be sorted by net price in ascending order, i.e. in the order they appear in the combined book.
+    The sweep follows the same two passes as the row-by-row matcher: first the cheapest asks are matched against
+    the most expensive bids, then the cheapest bids left are matched against the cheapest asks left.
+
+    With balances, a fill is cut down to the BTC held on the exchange of the bid and the EUR held on the exchange of
+    the ask, and levels of an exchange without the balance they need are passed over. Every fill moves the balances,
+    so what one fill brings in can be used by the next.
+
+    With venue pairs, an ask is only filled against the bids of the exchanges it is paired with. An ask that crosses
+    no bid it may trade with is passed over, and so is such a bid in the second pass.
+
+    Parameters:
+    - ask_net_prices (np.ndarray): Net prices of the ask side.
+    - ask_remaining (np.ndarray): Remaining quantities of the ask side. Updated in place.
+    - bid_net_prices (np.ndarray): Net prices of the bid side.
+    - bid_remaining (np.ndarray): Remaining quantities of the bid side. Updated in place.
+    - ask_venues (np.ndarray): Venue code of every ask. Only used with balances or venue pairs.
+    - bid_venues (np.ndarray): Venue code of every bid. Only used with balances or venue pairs.
+    - base_balances (list): BTC held on every exchange, by venue code. Updated in place. Fills are not limited if None.
+    - quote_balances (list): EUR held on every exchange, by venue code. Updated in place.
+    - venue_pairs (set): Venue codes (ask venue, bid venue) of the exchange pairs that may trade. All pairs if None.
+
+    Returns:
+    - list: Fills as tuples (ask position, bid position, matched quantity, ask remaining quantity, bid remaining quantity).
+    """
+    # Work on Python floats, indexing NumPy scalars one by one is slower than the sweep itself
+    ask_net = ask_net_prices.tolist()
+    bid_net = bid_net_prices.tolist()
+    ask_rem = ask_remaining.tolist()
+    bid_rem = bid_remaining.tolist()
+    limited = base_balances is not None
+    paired = venue_pairs is not None
+    if limited or paired:
+        ask_venue = ask_venues.tolist()
+        bid_venue = bid_venues.tolist()
+    fills = []
+    # Pointers of the exchanges into the other side, only used with venue pairs
+    bid_pointers = {}
+    ask_pointers = {}
+
+    # First pass: cheapest asks against the most expensive bids. Every ask takes at most one fill and moves on
+    # once its bid is used up, the pass ends when an ask is used up.
+    bid_pos = len(bid_net) - 1
+    for ask_pos in range(len(ask_net)):
+        if ask_rem[ask_pos] <= 0:
+            break
+        # No EUR left to buy on the exchange of the ask
+        if limited and quote_balances[ask_venue[ask_pos]] <= 0:
+            continue
+        # Bids above the pointer are used up or there is no BTC left to sell on their exchange
+        while bid_pos >= 0 and (bid_rem[bid_pos] <= 0 or (limited and base_balances[bid_venue[bid_pos]] <= 0)):
+            bid_pos -= 1
+        # Later asks are more expensive, so nothing crosses anymore
+        if bid_pos < 0 or bid_net[bid_pos] <= ask_net[ask_pos]:
+            break
+        fill_pos = bid_pos
+        if paired:
+            # The best bid this ask may trade with. Every exchange of the asks has its own pointer, which only moves
+            # down past the bids it may not trade with, so the pass stays linear in the levels for every exchange.
+            venue = ask_venue[ask_pos]
+            fill_pos = min(bid_pointers.get(venue, bid_pos), bid_pos)
+            while fill_pos >= 0 and (bid_rem[fill_pos] <= 0 or (limited and base_balances[bid_venue[fill_pos]] <= 0)
+                                     or (venue, bid_venue[fill_pos]) not in venue_pairs):
+                fill_pos -= 1
+            bid_pointers[venue] = fill_pos
+            if fill_pos < 0 or bid_net[fill_pos] <= ask_net[ask_pos]:
+                continue
+
+        max_quantity = min(ask_rem[ask_pos], bid_rem[fill_pos])
+        if limited:
+            max_quantity = _trade_balances(base_balances, quote_balances, ask_venue[ask_pos], bid_venue[fill_pos], ask_net[ask_pos], bid_net[fill_pos], max_quantity)
+        ask_rem[ask_pos] -= max_quantity
+        bid_rem[fill_pos] -= max_quantity
+        fills.append((ask_pos, fill_pos, max_quantity, ask_rem[ask_pos], bid_rem[fill_pos]))
+
+        if ask_rem[ask_pos] == 0:
+            break
+
+    # Second pass: cheapest bids against the cheapest asks. Every bid takes at most one fill and moves on
+    # once its ask is used up, the pass ends when a bid is used up.
+    ask_pos = 0
+    for bid_pos in range(len(bid_net)):
+        if bid_rem[bid_pos] <= 0:
+            break
+        # No BTC left to sell on the exchange of the bid
+        if limited and base_balances[bid_venue[bid_pos]] <= 0:
+            continue
+        # Asks below the pointer are used up or there is no EUR left to buy on their exchange
+        while ask_pos < len(ask_net) and (ask_rem[ask_pos] <= 0 or (limited and quote_balances[ask_venue[ask_pos]] <= 0)):
+            ask_pos += 1
+        if ask_pos == len(ask_net):
+            break
+        # A more expensive bid may still cross
+        if ask_net[ask_pos] >= bid_net[bid_pos]:
+            continue
+        fill_pos = ask_pos
+        if paired:
+            # The cheapest ask this bid may trade with, with a pointer for every exchange of the bids
+            venue = bid_venue[bid_pos]
+            fill_pos = max(ask_pointers.get(venue, ask_pos), ask_pos)
+            while fill_pos < len(ask_net) and (ask_rem[fill_pos] <= 0 or (limited and quote_balances[ask_venue[fill_pos]] <= 0)
+                                               or (ask_venue[fill_pos], venue) not in venue_pairs):
+                fill_pos += 1
+            ask_pointers[venue] = fill_pos
+            if fill_pos == len(ask_net) or ask_net[fill_pos] >= bid_net[bid_pos]:
+                continue
+
+        max_quantity = min(ask_rem[fill_pos], bid_rem[bid_pos])
+        if limited:
+            max_quantity = _trade_balances(base_balances, quote_balances, ask_venue[fill_pos], bid_venue[bid_pos], ask_net[fill_pos], bid_net[bid_pos], max_quantity)
+        ask_rem[fill_pos] -= max_quantity
+        bid_rem[bid_pos] -= max_quantity
+        fills.append((fill_pos, bid_pos, max_quantity, ask_rem[fill_pos], bid_rem[bid_pos]))
+
+        if bid_rem[bid_pos] == 0:
+            break
+
+    ask_remaining[:] = ask_rem
+    bid_remaining[:] = bid_rem
+    return fills
+
+
+def _trade_balances(base_balances, quote_balances, ask_venue, bid_venue, ask_net_price, bid_net_price, quantity):
+    # Cuts a fill down to the BTC on the bid exchange and the EUR on the ask exchange, then moves the balances.
+    # The EUR balance is set to zero when it limits the fill, so that rounding leaves no dust that looks spendable.
+    affordable = quote_balances[ask_venue] / ask_net_price
+    quantity = min(quantity, base_balances[bid_venue], affordable)
+    base_balances[bid_venue] -= quantity
+    base_balances[ask_venue] += quantity
+    quote_balances[ask_venue] = 0.0 if quantity == affordable else quote_balances[ask_venue] - ask_net_price * quantity
+    quote_balances[bid_venue] += bid_net_price * quantity
+    return quantity
+
+
+def match_orders_by_venue(book, inventory=None, pairs=None):
+    """
+    Matches bid and ask orders to find arbitrage opportunities, for any number of exchanges.
+
+    Parameters:
+    - book (DataFrame or OrderBook): The combined and sorted order book containing bid and ask information.
+    - inventory (Inventory): BTC and EUR held on every exchange, fills are limited to them. The inventory itself is
+      not changed, apply the returned quantities to it. Fills are not limited if None.
+    - pairs (list): Exchange pairs (ask exchange, bid exchange) that may trade, e.g. the pairs kept by a
+      StalenessGuard. All exchange pairs of the book if None.
+
+    Returns:
+    - tuple: A tuple containing a list of matched trades, total matching profit, and the BTC and EUR quantities traded
+      on every exchange as a dictionary {exchange: (btc quantity, eur quantity)}.
+    """
+    matched_trades = []
+    matching_profit = 0
+    venue_quantities = {}
+
+    # Split the book into the ask and the bid side, both stay sorted by net price
+    if isinstance(book, OrderBook):
+        ask_rows = (book.side == ASK).nonzero()[0]
+        bid_rows = (book.side == BID).nonzero()[0]
+        price, quantity, fee, net_price, remaining = book.price, book.quantity, book.fee, book.net_price, book.remaining
+        exchange = book.exchange_names()
+        venues, venue = book.venues, book.venue
+    else:
+        side = book['Ask/Bid'].to_numpy()
+        ask_rows = (side == 'Ask').nonzero()[0]
+        bid_rows = (side == 'Bid').nonzero()[0]
+        price = book['Price'].to_numpy()
+        quantity = book['Quantity'].to_numpy()
+        exchange = book['Exchange'].to_numpy()
+        fee = book['Fee'].to_numpy()
+        net_price = book['Net Price'].to_numpy(dtype=float)
+        remaining = book['Remaining Quantity'].to_numpy(dtype=float, copy=True)
+        venues, venue = np.unique(exchange, return_inverse=True) if inventory is not None or pairs is not None else ((), None)
+    ask_remaining = remaining[ask_rows]
+    bid_remaining = remaining[bid_rows]
+
+    if inventory is None and pairs is None:
+        fills = sweep_sorted_sides(net_price[ask_rows], ask_remaining, net_price[bid_rows], bid_remaining)
+    else:
+        balances = inventory.balance_lists(venues) if inventory is not None else (None, None)
+        venue_pairs = None
+        if pairs is not None:
+            codes = {exchange: code for code, exchange in enumerate(venues)}
+            venue_pairs = {(codes[ask_exchange], codes[bid_exchange]) for ask_exchange, bid_exchange in pairs
+                           if ask_exchange in codes and bid_exchange in codes}
+        fills = sweep_sorted_sides(net_price[ask_rows], ask_remaining, net_price[bid_rows], bid_remaining, venue[ask_rows], venue[bid_rows],
+                                   *balances, venue_pairs)
+
+    current_timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    for ask_pos, bid_pos, max_quantity, ask_remaining_quantity, bid_remaining_quantity in fills:
+        ask = ask_rows[ask_pos]
+        bid = bid_rows[bid_pos]
+
+        # Update trade information for profit calculation and saving.
+        trade_profit = max_quantity * (net_price[bid] - net_price[ask])
+        matching_profit += trade_profit
+
+        # Update quantities based on the matched trades, BTC is sold on the bid exchange and bought on the ask exchange
+        bid_quantities = venue_quantities.setdefault(exchange[bid], [0, 0])
+        bid_quantities[0] -= max_quantity
+        bid_quantities[1] += net_price[bid] * max_quantity
+        ask_quantities = venue_quantities.setdefault(exchange[ask], [0, 0])
+        ask_quantities[1] -= net_price[ask] * max_quantity
+        ask_quantities[0] += max_quantity
+
+        # Add executed trades to matched_trades
+        for row, ask_bid, remaining_quantity in ((ask, 'Ask', ask_remaining_quantity), (bid, 'Bid', bid_remaining_quantity)):
+            matched_trades.append({
+                'Timestamp': current_timestamp,
+                'Price': price[row],
+                'Quantity': quantity[row],
+                'Ask/Bid': ask_bid,
+                'Exchange': exchange[row],
+                'Fee': fee[row],
+                'Net Price': net_price[row],
+                'Matched Quantity': max_quantity,
+                'Remaining Quantity': remaining_quantity
+            })
+
+    # Write the remaining quantities back to the book
+    remaining[ask_rows] = ask_remaining
+    remaining[bid_rows] = bid_remaining
+    if not isinstance(book, OrderBook):
+        book['Remaining Quantity'] = remaining
+
+    venue_deltas = {venue: tuple(quantities) for venue, quantities in venue_quantities.items()}
+    return matched_trades, matching_profit, venue_deltas
+
+
+def kraken_coinmetro_quantities(venue_deltas):
+    """
+    Picks the Kraken and Coinmetro quantities out of the quantities of all exchanges. Names are compared case-insensitively.
+
+    Parameters:
+    - venue_deltas (dict): BTC and EUR quantities by exchange, as returned by match_orders_by_venue.
+
+    Returns:
+    - tuple: Kraken BTC, Kraken EUR, Coinmetro BTC and Coinmetro EUR quantities.
+    """
+    deltas = {venue.lower(): quantities for venue, quantities in venue_deltas.items()}
+    kraken_btc_quantity, kraken_eur_quantity = deltas.get('kraken', (0, 0))
+    coinmetro_btc_quantity, coinmetro_eur_quantity = deltas.get('coinmetro', (0, 0))
+    return kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity
+
+
+def match_orders(book, inventory=None):
     """
     Matches bid and ask orders to find arbitrage opportunities.
 
+    Parameters:
+    - book (DataFrame or OrderBook): The combined and sorted order book containing bid and ask information.
+    - inventory (Inventory): BTC and EUR held on every exchange, see match_orders_by_venue.
+
+    Returns:
+    - tuple: A tuple containing a list of matched trades, total matching profit, and quantities for Kraken and Coinmetro (BTC and EUR).
+    """
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book, inventory)
+    return (matched_trades, matching_profit) + kraken_coinmetro_quantities(venue_deltas)
+
+
+def match_orders_iterrows(book):
+    """
+    Matches bid and ask orders row by row. This is the original matcher, kept as the reference for match_orders.
+
     Parameters:
     - book (DataFrame): The combined and sorted order book containing bid and ask information.
 
@@ -0,0 +1,216 @@
+"""
+order_book.py
+
+This module contains the array-backed order book that is passed through the matching pipeline.
+"""
+import numpy as np
+import pandas as pd
+
+# Side codes of the order book
+ASK = 0
+BID = 1
+SIDES = ('Ask', 'Bid')
+
+COLUMNS = ['Price', 'Quantity', 'Ask/Bid', 'Exchange', 'Fee', 'Net Price', 'Remaining Quantity']
+
+
+class OrderList(list):
+    """
+    Orders of one exchange as tuples (price, quantity, ask/bid, exchange), with the times of the book.
+
+    It is a plain list for everything that reads the orders. 'received_at' is when the book was received and
+    'exchange_timestamp' the time the exchange reported for it, both in seconds since the epoch, None if unknown.
+    """
+
+    def __init__(self, orders=(), received_at=None, exchange_timestamp=None):
+        super().__init__(orders)
+        self.received_at = received_at
+        self.exchange_timestamp = exchange_timestamp
+
+
+def order_list_exchange(orders):
+    """
+    Parameters:
+    - orders (list or OrderBook): Non-empty order list of one exchange, or the order book of one exchange.
+
+    Returns:
+    - str: Name of the exchange.
+    """
+    if isinstance(orders, OrderBook):
+        return orders.venues[orders.venue[0]]
+    return orders[0][3]
+
+
+class OrderBook:
+    """
+    Order book stored as contiguous float64 arrays, one element per price level.
+
+    The side and the exchange of every level are stored as small integer codes. The exchange code is the position
+    of the exchange name in 'venues'. Slicing returns views of the arrays, only sorting and 'take' copy them.
+
+    The order book of one fetched exchange can be passed through the pipeline in place of its order list, with the
+    times of the book in 'received_at' and 'exchange_timestamp' like an OrderList. Derived books do not keep them.
+    """
+    __slots__ = ('price', 'quantity', 'fee', 'net_price', 'remaining', 'side', 'venue', 'venues', 'received_at', 'exchange_timestamp')
+
+    def __init__(self, price, quantity, side, venue, venues, fee=None, net_price=None, remaining=None):
+        """
+        Parameters:
+        - price (np.ndarray): Prices of the levels.
+        - quantity (np.ndarray): Quantities of the levels.
+        - side (np.ndarray): Side codes of the levels (ASK or BID).
+        - venue (np.ndarray): Exchange codes of the levels.
+        - venues (tuple): Exchange names, indexed by the exchange code.
+        - fee (np.ndarray): Fees of the levels. Defaults to zeros.
+        - net_price (np.ndarray): Prices including fees. Defaults to the prices.
+        - remaining (np.ndarray): Quantities left to match. Defaults to the quantities.
+        """
+        self.price = price
+        self.quantity = quantity
+        self.side = side
+        self.venue = venue
+        self.venues = tuple(venues)
+        self.fee = np.zeros_like(price) if fee is None else fee
+        self.net_price = price.copy() if net_price is None else net_price
+        self.remaining = quantity.copy() if remaining is None else remaining
+        self.received_at = None
+        self.exchange_timestamp = None
+
+    @classmethod
+    def from_orders(cls, *order_lists):
+        """
+        Builds an order book from the order lists returned by data_fetch.
+
+        Parameters:
+        - order_lists (list): Lists of tuples (price, quantity, ask/bid, exchange).
+
+        Returns:
+        - OrderBook: Unsorted order book containing all the orders.
+        """
+        orders = [order for order_list in order_lists for order in order_list]
+        count = len(orders)
+        venue_codes = {}
+
+        price = np.fromiter((float(order[0]) for order in orders), dtype=np.float64, count=count)
+        quantity = np.fromiter((float(order[1]) for order in orders), dtype=np.float64, count=count)
+        side = np.fromiter((BID if order[2] == 'Bid' else ASK for order in orders), dtype=np.int8, count=count)
+        venue = np.fromiter((venue_codes.setdefault(order[3], len(venue_codes)) for order in orders), dtype=np.int16, count=count)
+
+        return cls(price, quantity, side, venue, venue_codes)
+
+    @classmethod
+    def from_dataframe(cls, book):
+        """
+        Builds an order book from an order book DataFrame.
+
+        Parameters:
+        - book (pd.DataFrame): Order book with at least 'Price', 'Quantity', 'Ask/Bid' and 'Exchange' columns.
+
+        Returns:
+        - OrderBook: Order book in the same row order.
+        """
+        venue, venues = pd.factorize(book['Exchange'])
+        price = book['Price'].to_numpy(dtype=np.float64, copy=True)
+        quantity = book['Quantity'].to_numpy(dtype=np.float64, copy=True)
+        side = np.where(book['Ask/Bid'].to_numpy() == 'Bid', BID, ASK).astype(np.int8)
+        fee = book['Fee'].to_numpy(dtype=np.float64, copy=True) if 'Fee' in book else None
+        net_price = book['Net Price'].to_numpy(dtype=np.float64, copy=True) if 'Net Price' in book else None
+        remaining = book['Remaining Quantity'].to_numpy(dtype=np.float64, copy=True) if 'Remaining Quantity' in book else None
+
+        return cls(price, quantity, side, venue.astype(np.int16), venues, fee, net_price, remaining)
+
+    @classmethod
+    def concatenate(cls, books):
+        """
+        Joins order books into one, e.g. the books of several exchanges.
+
+        Parameters:
+        - books (list): Order books to join, their exchange codes may overlap.
+
+        Returns:
+        - OrderBook: Order book with the levels of all books in the given order.
+        """
+        venue_codes = {}
+        venue_parts = []
+        for book in books:
+            # Map the exchange codes of every book to the codes of the joined book
+            code_map = np.array([venue_codes.setdefault(name, len(venue_codes)) for name in book.venues], dtype=np.int16)
+            venue_parts.append(code_map[book.venue])
+        if not books:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(empty, empty.copy(), np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int16), ())
+
+        return cls(np.concatenate([book.price for book in books]), np.concatenate([book.quantity for book in books]),
+                   np.concatenate([book.side for book in books]), np.concatenate(venue_parts), venue_codes,
+                   np.concatenate([book.fee for book in books]), np.concatenate([book.net_price for book in books]),
+                   np.concatenate([book.remaining for book in books]))
+
+    def __len__(self):
+        return len(self.price)
+
+    @property
+    def empty(self):
+        """
+        Returns:
+        - bool: True if the order book has no levels.
+        """
+        return len(self.price) == 0
+
+    def view(self, start, stop):
+        """
+        Returns the levels between 'start' and 'stop' without copying the arrays.
+
+        Parameters:
+        - start (int): Position of the first level.
+        - stop (int): Position after the last level.
+
+        Returns:
+        - OrderBook: Order book sharing the arrays of this order book.
+        """
+        window = slice(start, stop)
+        return OrderBook(self.price[window], self.quantity[window], self.side[window], self.venue[window], self.venues,
+                         self.fee[window], self.net_price[window], self.remaining[window])
+
+    def take(self, positions):
+        """
+        Returns the levels at the given positions as a new order book.
+
+        Parameters:
+        - positions (np.ndarray): Positions of the levels.
+
+        Returns:
+        - OrderBook: Order book with copies of the selected levels.
+        """
+        return OrderBook(self.price[positions], self.quantity[positions], self.side[positions], self.venue[positions], self.venues,
+                         self.fee[positions], self.net_price[positions], self.remaining[positions])
+
+    def sort_by_net_price(self):
+        """
+        Returns:
+        - OrderBook: Order book sorted by net price in ascending order.
+        """
+        return self.take(np.argsort(self.net_price, kind='stable'))
+
+    def exchange_names(self):
+        """
+        Returns:
+        - np.ndarray: Exchange name of every level.
+        """
+        return np.array(self.venues, dtype=object)[self.venue]
+
+    def to_dataframe(self):
+        """
+        Converts the order book into a DataFrame for reporting.
+
+        Returns:
+        - pd.DataFrame: Order book with the columns used by the rest of the project.
+        """
+        return pd.DataFrame({
+            'Price': self.price,
+            'Quantity': self.quantity,
+            'Ask/Bid': np.array(SIDES, dtype=object)[self.side],
+            'Exchange': self.exchange_names(),
+            'Fee': self.fee,
+            'Net Price': self.net_price,
+            'Remaining Quantity': self.remaining
+        }, columns=COLUMNS)
@@ -4,8 +4,12 @@ orderbook_preparation.py
 This is the file to combine data retrieved from multiple exchanges into a single orderbook and process this orderbook for matching.
 """
 
+import numpy as np
 import pandas as pd
 
+from order_book import OrderBook, ASK, BID
+from filled_orders_ledger import FilledOrdersLedger
+
 def combine_and_sort_order_book(coinmetro_orders, kraken_orders):
     """
     Combines and sorts bid and ask data from Coinmetro and Kraken.
@@ -31,20 +35,67 @@ def combine_and_sort_order_book(coinmetro_orders, kraken_orders):
     return book
 
 
-def calculate_fees(book, coinmetro_fee, kraken_fee):
+def build_fee_table(coinmetro_fee, kraken_fee):
+    """
+    Builds the fee table for Coinmetro and Kraken from their fee rates.
+
+    Parameters:
+    - coinmetro_fee (float): Coinmetro fee rate (e.g., 0.001 for 0.1%).
+    - kraken_fee (float): Kraken fee rate.
+
+    Returns:
+    - dict: Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+    """
+    return {'coinmetro': (coinmetro_fee, coinmetro_fee), 'kraken': (kraken_fee, kraken_fee)}
+
+
+def taker_fee_rates(venues, fee_table):
+    """
+    Looks up the taker fee rate of every exchange. Exchange names are compared case-insensitively.
+
+    Parameters:
+    - venues (list): Exchange names.
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+
+    Returns:
+    - np.ndarray: Taker fee rate of every exchange, in the order of 'venues'.
+    """
+    taker_fees = {venue.lower(): taker_fee for venue, (maker_fee, taker_fee) in fee_table.items()}
+    missing = [venue for venue in venues if venue.lower() not in taker_fees]
+    if missing:
+        raise ValueError(f"No fees for exchanges {missing}. Fee table has: {list(fee_table)}")
+    return np.array([taker_fees[venue.lower()] for venue in venues], dtype=np.float64)
+
+
+def calculate_fees(book, coinmetro_fee=None, kraken_fee=None, fee_table=None, sort=True):
     """
-    Adjust prices in the order book DataFrame based on specific rules for each exchange.
+    Adjust prices in the order book DataFrame with the taker fee of each exchange.
 
     Args:
-    - book (pd.DataFrame): DataFrame containing order book data.
+    - book (pd.DataFrame or OrderBook): DataFrame containing order book data.
+    - coinmetro_fee (float): Coinmetro fee rate, used when no fee table is given.
+    - kraken_fee (float): Kraken fee rate, used when no fee table is given.
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+    - sort (bool): Sort an OrderBook by net price. Unsorted, the levels stay in their order, e.g. for sides that
+      arrive sorted, see venue_books.sorted_side.
 
     Returns:
-    - pd.DataFrame: Updated order book DataFrame with adjusted prices.
+    - pd.DataFrame or OrderBook: Updated order book DataFrame with adjusted prices.
     """
+    if fee_table is None:
+        fee_table = build_fee_table(coinmetro_fee, kraken_fee)
+
+    if isinstance(book, OrderBook):
+        # Fee rate per exchange code, then one pass over the arrays
+        book.fee = taker_fee_rates(book.venues, fee_table)[book.venue] * book.price
+        book.net_price = np.where(book.side == BID, book.price - book.fee, book.price + book.fee)
+        return book.sort_by_net_price() if sort else book
+
     # Calculate fees and net prices
-    book['Fee'] = book.apply(lambda row: kraken_fee * row['Price'] if row['Exchange'] == 'Kraken' else coinmetro_fee * row['Price'], axis=1)
-    book['Net Price'] = book.apply(lambda row: row['Price'] - row['Fee'] if row['Ask/Bid'] == 'Bid' else row['Price'] + row['Fee'], axis=1)
-                    
+    venue_codes, venues = pd.factorize(book['Exchange'])
+    book['Fee'] = taker_fee_rates(venues, fee_table)[venue_codes] * book['Price']
+    book['Net Price'] = np.where(book['Ask/Bid'] == 'Bid', book['Price'] - book['Fee'], book['Price'] + book['Fee'])
+
     # Sort the DataFrame by the 'Net Price' column in ascending order
     book = book.sort_values(by='Net Price')
 
@@ -59,7 +110,7 @@ def calculate_spread(book):
     Calculate the price difference and spread percentage between the highest Bid Net Price and lowest Ask Net Price.
 
     Parameters:
-    - book (pd.DataFrame): The order book data containing 'Ask/Bid' and 'Net Price' columns.
+    - book (pd.DataFrame or OrderBook): The order book data containing 'Ask/Bid' and 'Net Price' columns.
 
     Returns:
     - float: Hihgest bid net price.
@@ -70,6 +121,15 @@ def calculate_spread(book):
     Example:
     calculate_spread(book)
     """
+    if isinstance(book, OrderBook):
+        bid_net_prices = book.net_price[book.side == BID]
+        ask_net_prices = book.net_price[book.side == ASK]
+        highest_bid_net_price = bid_net_prices.max() if len(bid_net_prices) else np.nan
+        lowest_ask_net_price = ask_net_prices.min() if len(ask_net_prices) else np.nan
+        price_difference = round(highest_bid_net_price - lowest_ask_net_price, 3)
+        spread_percentage = round((price_difference/lowest_ask_net_price) * 100, 4)
+        return highest_bid_net_price, lowest_ask_net_price, price_difference, spread_percentage
+
     # Find the highest Net Price for a Bid
     highest_bid_net_price = book.loc[book['Ask/Bid'] == 'Bid', 'Net Price'].max()
 
@@ -88,14 +148,24 @@ def clean_order_book(book):
     Cleans the order book DataFrame by keeping rows from the first 'Ask' to the last 'Bid'. Removed lines couldn't be matched.
 
     Parameters:
-    - book (pd.DataFrame): The order book data to be filtered.
+    - book (pd.DataFrame or OrderBook): The order book data to be filtered.
 
     Returns:
-    - pd.DataFrame: The filtered order book data.
+    - pd.DataFrame or OrderBook: The filtered order book data. An OrderBook is returned as a view of the input.
     """
     # Get variables to display in case there is no arbitrage opportunities
     highest_bid_net_price, lowest_ask_net_price, price_difference, spread_percentage = calculate_spread(book)
 
+    if isinstance(book, OrderBook):
+        # Keep the levels from the first Ask to the last Bid after it
+        ask_rows = (book.side == ASK).nonzero()[0]
+        bid_rows = (book.side == BID).nonzero()[0]
+        if len(ask_rows) == 0 or len(bid_rows) == 0 or bid_rows[-1] < ask_rows[0]:
+            timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"No arbitrage opportunities. Highest bid: {highest_bid_net_price}, lowest ask: {lowest_ask_net_price}, spread: {price_difference} EUR/BTC ({spread_percentage} %), {timestamp}")
+            return book.view(0, 0)
+        return book.view(ask_rows[0], bid_rows[-1] + 1)
+
     # Find the row number of the first Ask
     first_ask_row = book[book['Ask/Bid'] == 'Ask'].index[0]
 
@@ -127,36 +197,33 @@ def clean_order_book(book):
 
 def update_filled_orders(book, matched_orders_today):
     """
-    Processes the existing 'book' data from a file and removes matching rows from the order book.
+    Sets the remaining quantity of every order in the book, taking into account the orders matched today.
 
     Parameters:
-    - book (pd.DataFrame): The order book data to be processed.
-    - matched_orders_today (pd.DataFrame): The DataFrame containing matched orders for the day.
+    - book (pd.DataFrame or OrderBook): The order book data to be processed.
+    - matched_orders_today (FilledOrdersLedger or pd.DataFrame): The ledger or the DataFrame containing matched orders for the day.
 
     Returns:
-    - pd.DataFrame: The processed order book data.
+    - pd.DataFrame or OrderBook: The processed order book data.
     """
-    # Step 1: Create a new column "Remaining Quantity" in book
+    if isinstance(matched_orders_today, FilledOrdersLedger):
+        ledger = matched_orders_today
+    else:
+        ledger = FilledOrdersLedger.from_dataframe(matched_orders_today)
+
+    if isinstance(book, OrderBook):
+        book.remaining = book.quantity.copy()
+        if len(ledger) and not book.empty:
+            side_names = np.where(book.side == BID, 'Bid', 'Ask').tolist()
+            remaining_quantities = ledger.remaining_quantities(book.exchange_names(), side_names, book.price, book.quantity)
+            np.minimum(book.remaining, remaining_quantities, out=book.remaining)
+        return book
+
+    # Create a new column "Remaining Quantity" in book, lowered to what is left of the orders matched today
     book['Remaining Quantity'] = book['Quantity'].copy()
-
-    # Step 2: Merge book and matched_orders_today based on specified columns
-    merged_df = pd.merge(book, matched_orders_today, on=["Price", "Quantity", "Ask/Bid", "Exchange"], how="inner", suffixes=('', '_matched'))
-
-    # Step 3: Update "Remaining Quantity" in book with the minimum value from matched_orders_today
-    for index, row in merged_df.iterrows():
-        matching_rows = (book["Price"] == row["Price"]) & (book["Quantity"] == row["Quantity"]) & (book["Ask/Bid"] == row["Ask/Bid"]) & (book["Exchange"] == row["Exchange"])
-
-        # If there is a match in the book, update the "Remaining Quantity"
-        if matching_rows.any():
-            # Start with the current value of "Remaining Quantity"
-            min_remaining_quantity = row["Remaining Quantity_matched"]
-
-            # Update "Remaining Quantity" in the book DataFrame with the minimum value
-            if min_remaining_quantity > 0:
-                # Use iloc to access the DataFrame by integer location
-                book.loc[matching_rows, 'Remaining Quantity'] = book.loc[matching_rows, 'Remaining Quantity'].apply(lambda x: min(min_remaining_quantity, x))
-    # Step 4: Drop unnecessary columns from the merged DataFrame
-    merged_df = merged_df.drop(columns=['Remaining Quantity_matched'])
+    if len(ledger) and not book.empty:
+        remaining_quantities = ledger.remaining_quantities(book['Exchange'], book['Ask/Bid'], book['Price'], book['Quantity'])
+        book['Remaining Quantity'] = np.minimum(book['Remaining Quantity'].to_numpy(), remaining_quantities)
 
     # Optionally, drop duplicates from the book DataFrame
     book = book.drop_duplicates()
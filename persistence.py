@@ -0,0 +1,159 @@
+"""
+persistence.py
+
+This module contains the background writer that saves journal rows, so that the fetch and match loop only has to
+put them in a queue.
+"""
+import asyncio
+import time
+
+import pandas as pd
+
+
+class JournalWriter:
+    """
+    Background task that drains a queue of journal rows and writes them in batches.
+
+    A batch is written when it reaches 'max_batch_rows' rows or when its oldest row has waited 'flush_interval'
+    seconds. Files are written in a worker thread, so slow disks do not block the event loop. When the queue is
+    full, 'submit' waits for the writer, which is counted in the backpressure metrics.
+    """
+
+    def __init__(self, max_batch_rows=500, flush_interval=1.0, max_queue_size=10000):
+        """
+        Parameters:
+        - max_batch_rows (int): Number of pending rows that triggers a write.
+        - flush_interval (float): Maximum number of seconds rows stay pending.
+        - max_queue_size (int): Number of submits the queue holds before 'submit' waits.
+        """
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.task = None
+        self.enqueued_rows = 0
+        self.written_rows = 0
+        self.failed_rows = 0
+        self.flushes = 0
+        self.max_queue_depth = 0
+        self.blocked_submits = 0
+        self.blocked_seconds = 0.0
+        self.last_flush_seconds = 0.0
+
+    def start(self):
+        """
+        Starts the writer task in the running event loop.
+
+        Returns:
+        - JournalWriter: The writer itself.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        return self
+
+    async def submit(self, journal, rows):
+        """
+        Queues rows to be appended to a journal.
+
+        Parameters:
+        - journal (TradeJournal): Journal to append the rows to.
+        - rows (list): Rows as dictionaries or lists, see TradeJournal.append.
+        """
+        if not rows:
+            return
+        try:
+            self.queue.put_nowait((journal, rows))
+        except asyncio.QueueFull:
+            # Backpressure: wait until the writer has caught up
+            self.blocked_submits += 1
+            started = time.perf_counter()
+            await self.queue.put((journal, rows))
+            self.blocked_seconds += time.perf_counter() - started
+        self.enqueued_rows += len(rows)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    async def flush(self):
+        """
+        Waits until every row queued so far is written, e.g. before a journal is exported.
+        """
+        if self.task is None:
+            return
+        written = asyncio.Event()
+        await self.queue.put(written)
+        await written.wait()
+
+    async def close(self):
+        """
+        Writes everything that is queued or pending and stops the writer task.
+        """
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Counters of the writer, including the queue depth and the backpressure on 'submit'.
+        """
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'enqueued_rows': self.enqueued_rows,
+            'written_rows': self.written_rows,
+            'failed_rows': self.failed_rows,
+            'flushes': self.flushes,
+            'blocked_submits': self.blocked_submits,
+            'blocked_seconds': self.blocked_seconds,
+            'last_flush_seconds': self.last_flush_seconds,
+        }
+
+    async def _run(self):
+        pending = {}
+        pending_rows = 0
+        first_pending = 0.0
+        closing = False
+        flush_requests = []
+
+        while not closing:
+            if pending_rows:
+                # Wait for more rows until the oldest pending row is due
+                timeout = max(self.flush_interval - (time.monotonic() - first_pending), 0)
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = ()
+            else:
+                item = await self.queue.get()
+
+            if item is None:
+                closing = True
+            elif isinstance(item, asyncio.Event):
+                # Every row queued before the request is pending now
+                flush_requests.append(item)
+            elif item:
+                journal, rows = item
+                if not pending_rows:
+                    first_pending = time.monotonic()
+                pending.setdefault(journal, []).extend(rows)
+                pending_rows += len(rows)
+
+            if pending_rows and (closing or flush_requests or pending_rows >= self.max_batch_rows or time.monotonic() - first_pending >= self.flush_interval):
+                await self._flush(pending)
+                pending = {}
+                pending_rows = 0
+            for written in flush_requests:
+                written.set()
+            flush_requests = []
+
+    async def _flush(self, pending):
+        started = time.perf_counter()
+        for journal, rows in pending.items():
+            try:
+                self.written_rows += await asyncio.to_thread(journal.append, rows)
+            except Exception as e:
+                self.failed_rows += len(rows)
+                timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"Error writing {len(rows)} rows to {journal.file_path}: {e}, {timestamp}")
+        self.flushes += 1
+        self.last_flush_seconds = time.perf_counter() - started
@@ -0,0 +1,193 @@
+"""
+pipeline.py
+
+This module runs order book snapshots through the matching pipeline: fees, crossing exchange pairs, filled orders
+and matching.
+"""
+import pandas as pd
+
+from book_depth import truncate_at_edge, aggregation_error_bound, bucket_remaining, unbucket_trades
+from latency import LatencyTracker
+from orderbook_preparation import update_filled_orders
+from matching_engine import match_orders_by_venue, kraken_coinmetro_quantities
+from save_results import daily_profit_entry, venue_delta_entries
+from venue_books import VenueBooks, taker_fee_lookup, best_net_prices, tops_cross, print_no_opportunity
+
+
+class ArbitragePipeline:
+    """
+    Matches order book snapshots and queues the results for the journals.
+    """
+
+    def __init__(self, fee_table, filled_orders_ledger, writer=None, filled_orders=None, trades=None, venue_deltas=None, verbose=True, recorder=None, latency=None, staleness_guard=None,
+                 price_buckets=None, edge_truncation=False, inventory=None, day_state=None):
+        """
+        Parameters:
+        - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+        - filled_orders_ledger (FilledOrdersLedger): Ledger of the orders matched today.
+        - writer (JournalWriter): Background writer of the journals. Nothing is saved if not given.
+        - filled_orders (TradeJournal): Journal of the matched orders.
+        - trades (TradeJournal): Journal of the trades and profits.
+        - venue_deltas (TradeJournal): Journal of the BTC and EUR quantities traded on every exchange.
+        - verbose (bool): Print the matched trades and profits, and the spread when there are no arbitrage opportunities.
+        - recorder (SnapshotRecorder): Records every processed snapshot for replays. Nothing is recorded if not given.
+        - latency (LatencyTracker): Times the stages and the age of the books. Nothing is timed if not given.
+        - staleness_guard (StalenessGuard): Keeps stale and skewed books from being matched. Not checked if not given.
+        - price_buckets (dict): Bucket size by exchange name, the levels of these exchanges are added up in price
+          buckets before matching, see book_depth.aggregate_side. The fills of a bucket are returned and recorded as
+          fills of its levels, see book_depth.unbucket_trades. Nothing is aggregated if not given.
+        - edge_truncation (bool): Drop the levels beyond the depth where the edge is gone before matching, see
+          truncate_at_edge. The sweep can fill differently on the shorter book.
+        - inventory (Inventory): BTC and EUR held on every exchange. Fills are limited to the balances, which are
+          updated after every match. Fills are not limited if not given.
+        - day_state (RollingDayState): Journals of the current day, rolled over at midnight. Replaces the journals
+          given above. The journals are kept as given if not given.
+        """
+        self.fee_table = fee_table
+        self.filled_orders_ledger = filled_orders_ledger
+        self.writer = writer
+        self.filled_orders = filled_orders
+        self.trades = trades
+        self.venue_deltas = venue_deltas
+        self.venue_books = VenueBooks(fee_table, verbose, price_buckets)
+        self.taker_fees = taker_fee_lookup(fee_table)
+        self.verbose = verbose
+        self.recorder = recorder
+        self.latency = latency or LatencyTracker(enabled=False)
+        self.staleness_guard = staleness_guard
+        self.price_buckets = price_buckets
+        self.edge_truncation = edge_truncation
+        self.inventory = inventory
+        self.day_state = day_state
+        if day_state is not None:
+            self.filled_orders, self.trades, self.venue_deltas = day_state.journals
+        self.profit_error_bound = 0.0
+        self.total_profit = 0
+        self.snapshots = 0
+        self.skipped = 0
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Snapshots received, snapshots skipped because no exchange pair crosses, the total profit, the bound of
+          the profit missed by the price buckets, the counters of the staleness guard, the balances of the
+          inventory and the day of the journals.
+        """
+        metrics = {'snapshots': self.snapshots, 'skipped': self.skipped, 'total_profit': self.total_profit}
+        if self.price_buckets:
+            metrics['profit_error_bound'] = self.profit_error_bound
+        if self.staleness_guard is not None:
+            metrics['staleness'] = self.staleness_guard.metrics()
+        if self.inventory is not None:
+            metrics['inventory'] = self.inventory.balances()
+        if self.day_state is not None:
+            metrics['day_state'] = self.day_state.metrics()
+        return metrics
+
+    def match(self, order_lists):
+        """
+        Runs one snapshot through the pipeline and records the matched trades in the ledger.
+
+        Parameters:
+        - order_lists (list): Order lists of the exchanges, tuples (price, quantity, ask/bid, exchange), or the
+          OrderBook of every exchange, e.g. from get_venue_orderbooks with 'arrays'.
+
+        Returns:
+        - tuple: The result of match_orders_by_venue, None if there are no arbitrage opportunities.
+        """
+        self.snapshots += 1
+        if self.staleness_guard is not None:
+            order_lists = self.staleness_guard.fresh_order_lists(order_lists)
+
+        # Compare the best bid and ask of every exchange before building any book. If applicable, display error that
+        # no arbitrage opportunities found.
+        with self.latency.span('precheck'):
+            best_bids, best_asks = best_net_prices(order_lists, self.taker_fees)
+            crossing = tops_cross(best_bids, best_asks)
+        if not crossing:
+            self.skipped += 1
+            if self.verbose:
+                print_no_opportunity(best_bids, best_asks)
+            return None
+
+        # Index the books of every exchange, then combine only the levels of the exchange pairs that cross
+        with self.latency.span('fees'):
+            self.venue_books.load(order_lists)
+        with self.latency.span('cleaning'):
+            pairs = self.venue_books.crossing_pairs()
+            # The book of the pairs that are kept can still cross between two exchanges of different pairs, so the
+            # sweep is held to the kept pairs once the guard rejects one
+            allowed_pairs = None
+            if self.staleness_guard is not None:
+                kept_pairs = self.staleness_guard.filter_pairs(pairs, self.venue_books)
+                if len(kept_pairs) < len(pairs):
+                    allowed_pairs = kept_pairs
+                pairs = kept_pairs
+            book = self.venue_books.crossing_book(pairs)
+        if book.empty:
+            return None
+
+        # Process the existing 'book' data
+        with self.latency.span('ledger'):
+            book = update_filled_orders(book, self.filled_orders_ledger)
+            if self.price_buckets:
+                bucket_remaining(book, self.venue_books.bucketed_levels, self.price_buckets, self.filled_orders_ledger)
+        if self.edge_truncation:
+            with self.latency.span('truncation'):
+                book = truncate_at_edge(book)
+
+        #Save current orderbook for error-checking
+        #timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H-%M-%S")
+        #book.to_dataframe().to_excel(timestamp + ' orderbook.xlsx', index=False)
+
+        # Match orders and update the ledger and the balances
+        with self.latency.span('matching'):
+            result = match_orders_by_venue(book, self.inventory, allowed_pairs)
+            if self.price_buckets:
+                # The ledger and the journals get the levels the exchanges sent instead of the buckets
+                result = (unbucket_trades(result[0], self.venue_books.bucketed_levels, self.price_buckets, self.filled_orders_ledger),) + result[1:]
+            self.filled_orders_ledger.record(result[0])
+            if self.inventory is not None:
+                self.inventory.apply(result[2])
+        self.total_profit += result[1]
+        if self.price_buckets:
+            self.profit_error_bound += aggregation_error_bound(result[0], self.price_buckets, self.taker_fees)
+        return result
+
+    async def process(self, order_lists):
+        """
+        Matches one snapshot, queues the results for the journals and prints them.
+
+        Parameters:
+        - order_lists (list): Order lists of the exchanges, tuples (price, quantity, ask/bid, exchange).
+
+        Returns:
+        - tuple: The result of match_orders_by_venue, None if there are no arbitrage opportunities.
+        """
+        # After midnight the results go to the journals of the new day
+        if self.day_state is not None and self.day_state.due():
+            self.day_state.roll(self.writer)
+            self.filled_orders, self.trades, self.venue_deltas = self.day_state.journals
+        if self.recorder is not None:
+            self.recorder.record(order_lists)
+        self.latency.record_book_ages()
+        result = self.match(order_lists)
+        if result is None:
+            return None
+        matched_trades, matching_profit, venue_deltas = result
+
+        if self.writer is not None:
+            # Queue the filled orders and daily profit data for the journals
+            with self.latency.span('persistence'):
+                await self.writer.submit(self.filled_orders, matched_trades)
+                await self.writer.submit(self.trades, [daily_profit_entry(matching_profit, *kraken_coinmetro_quantities(venue_deltas))])
+                if self.venue_deltas is not None:
+                    await self.writer.submit(self.venue_deltas, venue_delta_entries(venue_deltas))
+
+        if self.verbose:
+            # Print the matched trades, profit for these matches and total profit so far
+            print("Matched Trades:")
+            print(pd.DataFrame(matched_trades))
+            print(f"Profit for these trades at {pd.Timestamp.now().strftime('%Y-%m-%d %H-%M-%S')}: {matching_profit} EUR")
+            print(f"Total profit so far while running this instance of the script: {self.total_profit}\n")
+        return result
@@ -1,12 +1,23 @@
+import asyncio
 import pandas as pd
 import os
 import ccxt
 
+from trade_journal import matched_orders_journal, trades_journal
 
-def initialize_matched_orders_today(temp_directory=""):
+
+def initialize_matched_orders_today(temp_directory="", symbol=None):
     # Define expected_columns outside the try-except block
     expected_columns = ['Timestamp', 'Price', 'Quantity', 'Ask/Bid', 'Exchange', 'Fee', 'Net Price', 'Matched Quantity', 'Remaining Quantity']
-    
+
+    # The journal is appended to during the day, the Excel file is only an export of it
+    journal = matched_orders_journal(temp_directory, symbol=symbol)
+    if journal.exists():
+        return journal.read()
+    if journal.file_path.name != matched_orders_journal(temp_directory).file_path.name:
+        # Only the default symbol has Excel files from before the journals
+        return pd.DataFrame(columns=expected_columns)
+
     try:
         matched_orders_filename = os.path.join(temp_directory, pd.Timestamp.now().strftime("%Y-%m-%d") + ' matched_orders.xlsx')
         matched_orders_today = pd.read_excel(matched_orders_filename)
@@ -23,6 +34,10 @@ def initialize_matched_orders_today(temp_directory=""):
 
 def initialize_trades_today(temp_directory=""):
     # Initialize trades_today. It is used to calculate the capital allocation requirements, daily profits, and profitability.
+    journal = trades_journal(temp_directory)
+    if journal.exists():
+        return journal.read()
+
     try:
         trades_filename = os.path.join(temp_directory, pd.Timestamp.now().strftime("%Y-%m-%d") + ' trades.xlsx')
         trades_today = pd.read_excel(trades_filename)
@@ -32,26 +47,20 @@ def initialize_trades_today(temp_directory=""):
     return trades_today
 
 
-def fetch_kraken_taker_fee():
-    try:
-        # Create an instance of the Kraken exchange class
-        kraken = ccxt.kraken()
-
-        # Fetch exchange information, including trading fees
-        exchange_info = kraken.fetch_markets()
-
-        # Find the trading pair you are interested in (e.g., 'BTC/USD')
-        trading_pair = 'BTC/EUR'
-        market = next(m for m in exchange_info if m['symbol'] == trading_pair)
-
-        # Extract taker fee from the market information
-        taker_fee = market['taker']
+async def fetch_taker_fee(registry, exchange_name='kraken', trading_pair='BTC/EUR', attempts=1, retry_delay=1.0):
+    # Tries up to 'attempts' times, 'retry_delay' seconds apart. Returns None if every attempt fails.
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(retry_delay)
+        try:
+            # Markets and fees are loaded once by the registry and cached
+            taker_fee = await registry.taker_fee(exchange_name, trading_pair)
 
-        return float(taker_fee) * 100  # Convert to percentage
+            return taker_fee * 100  # Convert to percentage
 
-    except ccxt.NetworkError as e:
-        print(f"Network error: {e}")
-    except ccxt.ExchangeError as e:
-        print(f"Exchange error: {e}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        except ccxt.NetworkError as e:
+            print(f"Network error: {e}")
+        except ccxt.ExchangeError as e:
+            print(f"Exchange error: {e}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
@@ -0,0 +1,121 @@
+"""
+replay.py
+
+This module replays recorded order book snapshots through the matching pipeline, without any network access, and
+reports how fast the snapshots were matched and the simulated profit. With --batch, all snapshots are matched at
+once and each on its own, as if the ledger were empty for every snapshot, see batch_matching.
+
+Usage: python replay.py <recording> --coinmetro-fee 0.1 --kraken-fee 0.24 [--bucket-size 1.0] [--edge-truncation] [--batch]
+"""
+import argparse
+import time
+
+from batch_matching import BookBatch, match_batch
+from filled_orders_ledger import FilledOrdersLedger
+from orderbook_preparation import build_fee_table
+from pipeline import ArbitragePipeline
+from snapshot_recorder import read_snapshots
+
+
+def replay(file_path, fee_table, filled_orders_ledger=None, price_buckets=None, edge_truncation=False):
+    """
+    Runs every snapshot of a recording through the pipeline.
+
+    Parameters:
+    - file_path (str or Path): Path of the recording, see SnapshotRecorder.
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+    - filled_orders_ledger (FilledOrdersLedger): Ledger of the orders matched before the replay. Starts empty if not given.
+    - price_buckets (dict): Bucket size by exchange name, see ArbitragePipeline.
+    - edge_truncation (bool): Cut the books where the edge is gone before matching, see ArbitragePipeline.
+
+    Returns:
+    - dict: Snapshots replayed and skipped by the pre-check, snapshots with matches, seconds taken, snapshots per
+      second, total profit, the bound of the profit missed by the price buckets and the base and quote quantities
+      traded on every exchange.
+    """
+    pipeline = ArbitragePipeline(fee_table, filled_orders_ledger or FilledOrdersLedger(), verbose=False, price_buckets=price_buckets,
+                                 edge_truncation=edge_truncation)
+    matches = 0
+    venue_totals = {}
+    start = time.perf_counter()
+    for timestamp, order_lists in read_snapshots(file_path):
+        result = pipeline.match(order_lists)
+        if result is None or not result[0]:
+            continue
+        matches += 1
+        for exchange, (base_quantity, quote_quantity) in result[2].items():
+            base_total, quote_total = venue_totals.get(exchange, (0.0, 0.0))
+            venue_totals[exchange] = (base_total + base_quantity, quote_total + quote_quantity)
+    seconds = time.perf_counter() - start
+    return {
+        'snapshots': pipeline.snapshots,
+        'skipped': pipeline.skipped,
+        'matches': matches,
+        'seconds': seconds,
+        'snapshots_per_second': pipeline.snapshots / seconds if seconds > 0 else 0.0,
+        'total_profit': pipeline.total_profit,
+        'profit_error_bound': pipeline.profit_error_bound,
+        'venue_deltas': venue_totals,
+    }
+
+
+def replay_batch(file_path, fee_table):
+    """
+    Matches every snapshot of a recording on its own, all snapshots at once.
+
+    Parameters:
+    - file_path (str or Path): Path of the recording, see SnapshotRecorder.
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+
+    Returns:
+    - dict: Snapshots, snapshots with matches, seconds taken, snapshots per second, total profit, the base and quote
+      quantities traded on every exchange, and the timestamps, profits, fill counts and base and quote quantities by
+      exchange of every snapshot as arrays.
+    """
+    start = time.perf_counter()
+    batch = BookBatch.from_recording(file_path, fee_table)
+    profit, base_deltas, quote_deltas, fill_counts = match_batch(batch)
+    seconds = time.perf_counter() - start
+    traded = base_deltas.any(axis=0) | quote_deltas.any(axis=0)
+    return {
+        'snapshots': len(batch),
+        'matches': int((fill_counts > 0).sum()),
+        'seconds': seconds,
+        'snapshots_per_second': len(batch) / seconds if seconds > 0 else 0.0,
+        'total_profit': float(profit.sum()),
+        'venue_deltas': {exchange: (float(base_deltas[:, venue].sum()), float(quote_deltas[:, venue].sum()))
+                         for venue, exchange in enumerate(batch.venues) if traded[venue]},
+        'timestamps': batch.timestamps,
+        'profits': profit,
+        'fill_counts': fill_counts,
+        'base_deltas': base_deltas,
+        'quote_deltas': quote_deltas,
+        'venues': batch.venues,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded order book snapshots through the matching pipeline.")
+    parser.add_argument('recording', help="Path of the recording")
+    parser.add_argument('--coinmetro-fee', type=float, default=0.1, help="Coinmetro fee in percent")
+    parser.add_argument('--kraken-fee', type=float, default=0.24, help="Kraken fee in percent")
+    parser.add_argument('--bucket-size', type=float, help="Add up the levels of every exchange in price buckets of this size")
+    parser.add_argument('--edge-truncation', action='store_true', help="Cut the books where the edge is gone before matching")
+    parser.add_argument('--batch', action='store_true', help="Match every snapshot on its own with an empty ledger, all snapshots at once")
+    arguments = parser.parse_args()
+
+    fee_table = build_fee_table(arguments.coinmetro_fee / 100, arguments.kraken_fee / 100)
+    if arguments.batch:
+        results = replay_batch(arguments.recording, fee_table)
+        print(f"Matched {results['snapshots']} snapshots in {results['seconds']:.3f} s ({results['snapshots_per_second']:.0f} snapshots/s), "
+              f"{results['matches']} with matches")
+    else:
+        price_buckets = {exchange: arguments.bucket_size for exchange in fee_table} if arguments.bucket_size else None
+        results = replay(arguments.recording, fee_table, price_buckets=price_buckets, edge_truncation=arguments.edge_truncation)
+        print(f"Replayed {results['snapshots']} snapshots in {results['seconds']:.3f} s ({results['snapshots_per_second']:.0f} snapshots/s), "
+              f"{results['skipped']} skipped by the pre-check, {results['matches']} with matches")
+    print(f"Total simulated profit: {results['total_profit']} EUR")
+    if not arguments.batch and price_buckets:
+        print(f"Profit missed by the price buckets: at most {results['profit_error_bound']} EUR")
+    for exchange, (base_quantity, quote_quantity) in results['venue_deltas'].items():
+        print(f"{exchange}: {base_quantity} base, {quote_quantity} quote")
@@ -8,6 +8,8 @@ import os
 
 from pathlib import Path
 
+from trade_journal import TRADES_COLUMNS, VENUE_DELTAS_COLUMNS
+
 def update_and_save_filled_orders(matched_orders_today, matched_trades, path=""):
     """
     Update the daily filled orders with matched trades and save to an Excel file.
@@ -76,3 +78,93 @@ def create_and_save_daily_profit_entry(trades_today, total_profit, kraken_btc_qu
         trades_today.to_excel(writer, index=False)
     
     return trades_today
+
+
+def append_filled_orders(journal, matched_trades):
+    """
+    Append matched trades to the journal of filled orders. Only the new rows are written.
+
+    Parameters:
+    - journal (TradeJournal): Journal of the matched orders of the day.
+    - matched_trades (list or pd.DataFrame): Matched trades data.
+
+    Returns:
+    - int: Number of rows written.
+    """
+    try:
+        if isinstance(matched_trades, pd.DataFrame):
+            matched_trades = matched_trades.to_dict('records')
+        if not matched_trades:
+            print("No matched trades to update.")
+            return 0
+        return journal.append(matched_trades)
+    except Exception as e:
+        print(f"Error updating and saving filled orders: {str(e)}")
+        return 0
+
+
+def daily_profit_entry(total_profit, kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity):
+    """
+    Create a new daily profit entry for the journal of trades.
+
+    Parameters:
+    - total_profit (float): The profit of the matched trades.
+    - kraken_btc_quantity (float): Quantity of BTC traded on Kraken.
+    - kraken_eur_quantity (float): Quantity of EUR traded on Kraken.
+    - coinmetro_btc_quantity (float): Quantity of BTC traded on Coinmetro.
+    - coinmetro_eur_quantity (float): Quantity of EUR traded on Coinmetro.
+
+    Returns:
+    - dict: The new entry, keyed by the trades columns.
+    """
+    timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    return dict(zip(TRADES_COLUMNS, [timestamp, total_profit, kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity]))
+
+
+def venue_delta_entries(venue_deltas):
+    """
+    Create the entries of the BTC and EUR quantities traded on every exchange for the journal of venue deltas.
+
+    Parameters:
+    - venue_deltas (dict): BTC and EUR quantities by exchange, as returned by match_orders_by_venue.
+
+    Returns:
+    - list: One entry per exchange, keyed by the venue deltas columns.
+    """
+    timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [dict(zip(VENUE_DELTAS_COLUMNS, [timestamp, exchange, btc_quantity, eur_quantity])) for exchange, (btc_quantity, eur_quantity) in venue_deltas.items()]
+
+
+def append_daily_profit_entry(journal, total_profit, kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity):
+    """
+    Append a new daily profit entry to the journal of trades.
+
+    Parameters:
+    - journal (TradeJournal): Journal of the trades of the day.
+    - total_profit (float): The profit of the matched trades.
+    - kraken_btc_quantity (float): Quantity of BTC traded on Kraken.
+    - kraken_eur_quantity (float): Quantity of EUR traded on Kraken.
+    - coinmetro_btc_quantity (float): Quantity of BTC traded on Coinmetro.
+    - coinmetro_eur_quantity (float): Quantity of EUR traded on Coinmetro.
+
+    Returns:
+    - dict: The new entry.
+    """
+    new_entry = daily_profit_entry(total_profit, kraken_btc_quantity, kraken_eur_quantity, coinmetro_btc_quantity, coinmetro_eur_quantity)
+    journal.append([new_entry])
+    return new_entry
+
+
+def export_journals_to_excel(*journals):
+    """
+    Export journals to Excel files next to them, e.g. at the end of the day.
+
+    Parameters:
+    - journals (TradeJournal): Journals to export. Journals without a file are skipped.
+    """
+    for journal in journals:
+        try:
+            if journal.exists():
+                journal.export_excel()
+        except Exception as e:
+            print(f"Error exporting {journal.file_path} to Excel: {str(e)}")
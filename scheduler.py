@@ -0,0 +1,143 @@
+"""
+scheduler.py
+
+This module schedules REST order book fetches by the rate limit of every exchange instead of a fixed pause. Each
+exchange has a token bucket and is fetched again as soon as its bucket has a token, independently of the other
+exchanges and of the matching of the previous snapshot.
+"""
+import asyncio
+import time
+
+import pandas as pd
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens are added at 'rate' per second up to 'capacity', every request takes one.
+    """
+
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic):
+        """
+        Parameters:
+        - rate (float): Tokens added per second, i.e. the sustained requests per second.
+        - capacity (float): Maximum number of tokens, i.e. the number of requests that can be sent in a burst.
+        - clock (callable): Function returning the current time in seconds.
+        """
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.throttled_seconds = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, tokens=1.0):
+        """
+        Returns:
+        - float: Seconds until 'tokens' tokens are available, 0 if they are available now.
+        """
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def try_acquire(self, tokens=1.0):
+        """
+        Takes 'tokens' tokens if they are available.
+
+        Returns:
+        - bool: True if the tokens were taken.
+        """
+        self._refill()
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    async def acquire(self, tokens=1.0):
+        """
+        Waits until 'tokens' tokens are available and takes them.
+        """
+        while not self.try_acquire(tokens):
+            delay = self.wait_time(tokens)
+            self.throttled_seconds += delay
+            await asyncio.sleep(delay)
+
+    def drain(self):
+        """
+        Empties the bucket, e.g. after the exchange answered that the rate limit was exceeded.
+        """
+        self._refill()
+        self.tokens = 0.0
+
+
+class RateLimitedFeed:
+    """
+    Feed for StreamingOrderBooks that fetches REST snapshots as fast as the token bucket of the exchange allows.
+
+    The fetches run in their own task, so the next snapshot is already requested while the previous one is matched.
+    """
+
+    def __init__(self, exchange, fetch_snapshot, bucket, clock=time.monotonic):
+        """
+        Parameters:
+        - exchange (str): Name of the exchange.
+        - fetch_snapshot (callable): Coroutine function returning a snapshot message or None.
+        - bucket (TokenBucket): Rate limit of the exchange.
+        - clock (callable): Function returning the current time in seconds.
+        """
+        self.exchange = exchange
+        self.fetch_snapshot = fetch_snapshot
+        self.bucket = bucket
+        self.clock = clock
+        self.snapshots = 0
+        self.errors = 0
+        self.started_at = None
+
+    async def messages(self):
+        self.started_at = self.clock()
+        while True:
+            snapshot = await self.resync()
+            if snapshot is not None:
+                self.snapshots += 1
+                yield snapshot
+
+    async def resync(self):
+        await self.bucket.acquire()
+        try:
+            snapshot = await self.fetch_snapshot()
+        except Exception as e:
+            timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"Error fetching {self.exchange} order book: {e!r}, {timestamp}")
+            snapshot = None
+        if snapshot is None:
+            # Back off for one full token so a failing exchange is not hammered
+            self.errors += 1
+            self.bucket.drain()
+        return snapshot
+
+    def snapshots_per_second(self):
+        """
+        Returns:
+        - float: Snapshots received per second since the feed started.
+        """
+        if self.started_at is None:
+            return 0.0
+        elapsed = self.clock() - self.started_at
+        return self.snapshots / elapsed if elapsed > 0 else 0.0
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Snapshot and error counters, achieved snapshots per second and seconds spent waiting for tokens.
+        """
+        return {
+            'snapshots': self.snapshots,
+            'errors': self.errors,
+            'snapshots_per_second': round(self.snapshots_per_second(), 3),
+            'throttled_seconds': round(self.bucket.throttled_seconds, 3),
+        }
@@ -0,0 +1,172 @@
+"""
+snapshot_recorder.py
+
+This module records the fetched order lists to a compact binary file and reads them back, so that the pipeline can
+be replayed offline.
+
+File format: the magic bytes b'OBSNAP1\n', then records. A record starts with one type byte:
+- b'V': a new exchange name, as a uint16 code, a uint16 length and the UTF-8 name.
+- b'S': a snapshot, as a float64 timestamp, a uint32 level count and the levels as packed LEVEL_DTYPE items.
+Every order list of a snapshot is stored as one run of levels of the same exchange.
+"""
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+
+from order_book import OrderBook
+
+MAGIC = b'OBSNAP1\n'
+LEVEL_DTYPE = np.dtype([('price', '<f8'), ('quantity', '<f8'), ('side', 'i1'), ('venue', '<u2')])
+SIDES = ('Ask', 'Bid')
+
+_VENUE_HEADER = struct.Struct('<HH')
+_SNAPSHOT_HEADER = struct.Struct('<dI')
+
+
+class SnapshotRecorder:
+    """
+    Appends order book snapshots to a recording file. Use it as a context manager or call 'close'.
+    """
+
+    def __init__(self, file_path):
+        """
+        Parameters:
+        - file_path (str or Path): Path of the recording. An existing recording is appended to.
+        """
+        self.file_path = Path(file_path)
+        self.venue_codes = {}
+        self.snapshots = 0
+        if self.file_path.is_file() and self.file_path.stat().st_size > 0:
+            # Continue with the exchange codes of the existing recording
+            self.venue_codes = _read_venue_codes(self.file_path)
+            self.file = open(self.file_path, 'ab')
+        else:
+            self.file = open(self.file_path, 'wb')
+            self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def record(self, order_lists, timestamp=None):
+        """
+        Appends one snapshot. Order lists that are None or empty, e.g. failed fetches, are left out.
+
+        Parameters:
+        - order_lists (list): Order lists of the exchanges, tuples (price, quantity, ask/bid, exchange), or the
+          OrderBook of every exchange.
+        - timestamp (float): Seconds since the epoch. Defaults to now.
+        """
+        parts = [self._levels(orders) for orders in order_lists if orders is not None and len(orders)]
+        levels = np.concatenate(parts) if parts else np.empty(0, dtype=LEVEL_DTYPE)
+        self.file.write(b'S')
+        self.file.write(_SNAPSHOT_HEADER.pack(time.time() if timestamp is None else timestamp, len(levels)))
+        self.file.write(levels.tobytes())
+        self.snapshots += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def _levels(self, orders):
+        levels = np.empty(len(orders), dtype=LEVEL_DTYPE)
+        if isinstance(orders, OrderBook):
+            # Sides use the same codes, ASK is 0 and BID is 1
+            levels['price'] = orders.price
+            levels['quantity'] = orders.quantity
+            levels['side'] = orders.side
+            levels['venue'] = np.array([self._venue_code(exchange) for exchange in orders.venues], dtype=np.uint16)[orders.venue]
+            return levels
+        for position, (price, quantity, ask_bid, exchange) in enumerate(orders):
+            levels[position] = (price, quantity, 1 if ask_bid == 'Bid' else 0, self._venue_code(exchange))
+        return levels
+
+    def _venue_code(self, exchange):
+        code = self.venue_codes.get(exchange)
+        if code is None:
+            code = len(self.venue_codes)
+            self.venue_codes[exchange] = code
+            name = exchange.encode('utf-8')
+            self.file.write(b'V')
+            self.file.write(_VENUE_HEADER.pack(code, len(name)))
+            self.file.write(name)
+        return code
+
+
+def _records(file_path):
+    # Yields (b'V', code, name) and (b'S', timestamp, levels) records in file order
+    data = memoryview(Path(file_path).read_bytes())
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{file_path} is not an order book recording")
+    position = len(MAGIC)
+    while position < len(data):
+        record_type = bytes(data[position:position + 1])
+        position += 1
+        if record_type == b'V':
+            code, length = _VENUE_HEADER.unpack_from(data, position)
+            position += _VENUE_HEADER.size
+            yield record_type, code, bytes(data[position:position + length]).decode('utf-8')
+            position += length
+        elif record_type == b'S':
+            timestamp, count = _SNAPSHOT_HEADER.unpack_from(data, position)
+            position += _SNAPSHOT_HEADER.size
+            end = position + count * LEVEL_DTYPE.itemsize
+            if end > len(data):
+                raise ValueError(f"{file_path} is cut off in the middle of a snapshot")
+            yield record_type, timestamp, np.frombuffer(data[position:end], dtype=LEVEL_DTYPE)
+            position = end
+        else:
+            raise ValueError(f"Unknown record type {record_type!r} at byte {position - 1} of {file_path}")
+
+
+def _read_venue_codes(file_path):
+    return {name: code for record_type, code, name in _records(file_path) if record_type == b'V'}
+
+
+def read_snapshot_levels(file_path):
+    """
+    Reads a recording as arrays, without turning the levels into Python objects.
+
+    Parameters:
+    - file_path (str or Path): Path of the recording.
+
+    Yields:
+    - tuple: Timestamp, levels as a LEVEL_DTYPE array sharing the file buffer, and the exchange names by code.
+
+    Raises:
+    - ValueError: If the file is not a recording or is cut off.
+    """
+    venues = []
+    for record_type, first, second in _records(file_path):
+        if record_type == b'V':
+            venues[first:first + 1] = [second]
+        else:
+            yield first, second, venues
+
+
+def read_snapshots(file_path):
+    """
+    Reads a recording back into the order lists that were recorded.
+
+    Parameters:
+    - file_path (str or Path): Path of the recording.
+
+    Yields:
+    - tuple: Timestamp and the order lists of the snapshot, tuples (price, quantity, ask/bid, exchange).
+    """
+    for timestamp, levels, venues in read_snapshot_levels(file_path):
+        order_lists = []
+        last_venue = None
+        for price, quantity, side, venue in levels.tolist():
+            if venue != last_venue:
+                order_lists.append([])
+                last_venue = venue
+            order_lists[-1].append((price, quantity, SIDES[side], venues[venue]))
+        yield timestamp, order_lists
@@ -0,0 +1,115 @@
+"""
+staleness.py
+
+This module keeps books that are too old, or taken too far apart, from being matched. Matching a fresh book against
+one that is hundreds of milliseconds old finds opportunities that are already gone.
+
+The time of a book is when it was received, see OrderList. Books without a time are never rejected, e.g. replayed
+snapshots.
+"""
+import time
+
+from order_book import order_list_exchange
+
+
+class StalenessGuard:
+    """
+    Drops stale books before matching and rejects or discounts exchange pairs whose books are skewed in time.
+    """
+
+    def __init__(self, max_age=None, max_skew=None, skew_margin=0.0, use_exchange_time=False, clock=time.time):
+        """
+        Parameters:
+        - max_age (float): Seconds after which a book is not matched anymore. Not checked if None.
+        - max_skew (float): Seconds between the books of an exchange pair above which the pair is not matched. Not
+          checked if None.
+        - skew_margin (float): Discount of skewed pairs. A pair is only matched if its best bid net price is above its
+          best ask net price by this rate for every second of skew (e.g., 0.001 for 0.1% per second).
+        - use_exchange_time (bool): Use the time reported by the exchange instead of the receive time when a book has it.
+        - clock (callable): Function returning the current time in seconds since the epoch.
+        """
+        self.max_age = max_age
+        self.max_skew = max_skew
+        self.skew_margin = skew_margin
+        self.use_exchange_time = use_exchange_time
+        self.clock = clock
+        self.stale_books = {}
+        self.skewed_pairs = 0
+        self.discounted_pairs = 0
+        self.max_seen_skew = 0.0
+
+    def book_time(self, received_at, exchange_timestamp=None):
+        """
+        Parameters:
+        - received_at (float): Time the book was received, None if unknown.
+        - exchange_timestamp (float): Time the exchange reported for the book, None if unknown.
+
+        Returns:
+        - float: Time of the book in seconds since the epoch, None if unknown.
+        """
+        if self.use_exchange_time and exchange_timestamp is not None:
+            return exchange_timestamp
+        return received_at
+
+    def fresh_order_lists(self, order_lists):
+        """
+        Leaves out the books older than 'max_age' and counts them by exchange.
+
+        Parameters:
+        - order_lists (list): Order lists of the exchanges, tuples (price, quantity, ask/bid, exchange).
+
+        Returns:
+        - list: The order lists that are fresh enough to be matched.
+        """
+        if self.max_age is None:
+            return order_lists
+        now = self.clock()
+        fresh = []
+        for orders in order_lists:
+            book_time = self.book_time(getattr(orders, 'received_at', None), getattr(orders, 'exchange_timestamp', None)) if orders else None
+            if book_time is not None and now - book_time > self.max_age:
+                exchange = order_list_exchange(orders)
+                self.stale_books[exchange] = self.stale_books.get(exchange, 0) + 1
+                continue
+            fresh.append(orders)
+        return fresh
+
+    def filter_pairs(self, pairs, venue_books):
+        """
+        Rejects the exchange pairs whose books are more than 'max_skew' apart, and discounts the others by 'skew_margin'.
+
+        Parameters:
+        - pairs (list): Crossing pairs as tuples (ask exchange, bid exchange), see VenueBooks.crossing_pairs.
+        - venue_books (VenueBooks): Books of the exchanges, with their times and best net prices.
+
+        Returns:
+        - list: The pairs that can still be matched.
+        """
+        book_times = {exchange: self.book_time(received_at, venue_books.exchange_timestamps.get(exchange))
+                      for exchange, received_at in venue_books.received_at.items()}
+        kept = []
+        for ask_exchange, bid_exchange in pairs:
+            ask_time = book_times.get(ask_exchange)
+            bid_time = book_times.get(bid_exchange)
+            if ask_time is None or bid_time is None:
+                kept.append((ask_exchange, bid_exchange))
+                continue
+            skew = abs(ask_time - bid_time)
+            self.max_seen_skew = max(self.max_seen_skew, skew)
+            if self.max_skew is not None and skew > self.max_skew:
+                self.skewed_pairs += 1
+                continue
+            if self.skew_margin and venue_books.best_bid[bid_exchange] <= venue_books.best_ask[ask_exchange] * (1 + self.skew_margin * skew):
+                self.discounted_pairs += 1
+                continue
+            kept.append((ask_exchange, bid_exchange))
+        return kept
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Stale books by exchange, pairs rejected for skew, pairs that did not cross after the discount and the
+          largest skew seen in seconds.
+        """
+        return {'stale_books': dict(self.stale_books), 'skewed_pairs': self.skewed_pairs, 'discounted_pairs': self.discounted_pairs,
+                'max_skew': round(self.max_seen_skew, 6)}
@@ -0,0 +1,502 @@
+"""
+streaming.py
+
+This module keeps local L2 order books up to date from streamed snapshots and deltas, and triggers the matching
+pipeline whenever the top of a book changes.
+
+Feeds yield normalized messages:
+    {'type': 'snapshot' or 'update', 'sequence': int or None, 'bids': [[price, quantity], ...], 'asks': [...]}
+Messages can have a 'timestamp', the time the exchange reported for them in seconds since the epoch.
+A quantity of 0 in an update removes the price level. Updates must follow the sequence number of the previous
+message, otherwise the book is resynchronized from a new snapshot. Messages without a sequence number are not
+checked. A {'type': 'reset'} message marks the book as out of sync until the next snapshot. A {'type': 'heartbeat'}
+message tells that the subscription is alive, so an unchanged book is still current.
+"""
+import asyncio
+import json
+import time
+from bisect import bisect_left, insort
+
+import aiohttp
+import pandas as pd
+
+from order_book import OrderList
+
+KRAKEN_WS_URL = 'wss://ws.kraken.com/v2'
+
+
+class SequenceGapError(Exception):
+    """
+    Raised when an update does not follow the last applied sequence number.
+    """
+
+
+class L2Book:
+    """
+    Local L2 order book of one exchange, price levels stored as {price: quantity} dictionaries.
+
+    The prices of both sides are also kept in ascending lists. An update only inserts or removes the changed prices,
+    so the book is never sorted again between snapshots.
+    """
+
+    def __init__(self, exchange, depth=None, clock=time.time):
+        """
+        Parameters:
+        - exchange (str): Name of the exchange, used in the order tuples.
+        - depth (int): Number of levels kept per side. All levels are kept if not given.
+        - clock (callable): Function returning the current time in seconds since the epoch.
+        """
+        self.exchange = exchange
+        self.depth = depth
+        self.clock = clock
+        self.received_at = None
+        self.exchange_timestamp = None
+        self.bids = {}
+        self.asks = {}
+        self.bid_prices = []
+        self.ask_prices = []
+        self.orders = None
+        self.sequence = None
+        self.synced = False
+        self.top = (None, None, None, None)
+
+    def reset(self):
+        """
+        Clears the book. It stays out of sync until the next snapshot.
+        """
+        self.bids = {}
+        self.asks = {}
+        self.bid_prices = []
+        self.ask_prices = []
+        self.orders = None
+        self.sequence = None
+        self.synced = False
+        self.top = (None, None, None, None)
+        self.received_at = None
+        self.exchange_timestamp = None
+
+    def apply_snapshot(self, bids, asks, sequence=None, timestamp=None):
+        """
+        Replaces the book with a snapshot.
+
+        Parameters:
+        - bids (list): Bid levels as [price, quantity] pairs.
+        - asks (list): Ask levels as [price, quantity] pairs.
+        - sequence (int): Sequence number of the snapshot.
+        - timestamp (float): Time the exchange reported for the snapshot, in seconds since the epoch.
+
+        Returns:
+        - bool: True if the top of the book changed.
+        """
+        self.bids = {}
+        self.asks = {}
+        self._apply_levels(self.bids, bids)
+        self._apply_levels(self.asks, asks)
+        self.bid_prices = sorted(self.bids)
+        self.ask_prices = sorted(self.asks)
+        self.orders = None
+        self.sequence = sequence
+        self.synced = True
+        self.received_at = self.clock()
+        self.exchange_timestamp = timestamp
+        return self._update_top()
+
+    def apply_update(self, bids, asks, sequence=None, timestamp=None):
+        """
+        Applies a delta to the book.
+
+        Parameters:
+        - bids (list): Changed bid levels as [price, quantity] pairs, quantity 0 removes the level.
+        - asks (list): Changed ask levels as [price, quantity] pairs, quantity 0 removes the level.
+        - sequence (int): Sequence number of the update.
+        - timestamp (float): Time the exchange reported for the update, in seconds since the epoch.
+
+        Returns:
+        - bool: True if the top of the book changed.
+
+        Raises:
+        - SequenceGapError: If the book has no snapshot or an update is missing.
+        """
+        if not self.synced:
+            raise SequenceGapError(f"{self.exchange}: update {sequence} received before a snapshot")
+        if sequence is not None and self.sequence is not None:
+            if sequence <= self.sequence:
+                # Already contained in the snapshot
+                return False
+            if sequence != self.sequence + 1:
+                expected = self.sequence + 1
+                self.reset()
+                raise SequenceGapError(f"{self.exchange}: expected update {expected}, received {sequence}")
+
+        self._apply_levels(self.bids, bids, self.bid_prices)
+        self._apply_levels(self.asks, asks, self.ask_prices)
+        self.orders = None
+        # An update without a sequence number keeps the last one, so gaps are still found in the next updates
+        if sequence is not None:
+            self.sequence = sequence
+        self.received_at = self.clock()
+        if timestamp is not None:
+            self.exchange_timestamp = timestamp
+        return self._update_top()
+
+    def mark_alive(self):
+        """
+        Marks the book as current without a change, on a heartbeat of its subscription. A push feed only sends
+        messages when the book changes, so a quiet book is as recent as the last sign that the subscription is alive.
+        The order list keeps its identity, only its time is refreshed.
+        """
+        if not self.synced:
+            return
+        self.received_at = self.clock()
+        if self.orders is not None:
+            self.orders.received_at = self.received_at
+
+    def to_orders(self):
+        """
+        Returns:
+        - OrderList: Orders as tuples (price, quantity, ask/bid, exchange), bids from the highest and asks from the
+          lowest price, with the time of the last applied message or heartbeat. The same list is returned until the
+          next change.
+        """
+        if self.orders is None:
+            bids = self.bids
+            asks = self.asks
+            orders = [(price, bids[price], 'Bid', self.exchange) for price in reversed(self.bid_prices)] + [(price, asks[price], 'Ask', self.exchange) for price in self.ask_prices]
+            self.orders = OrderList(orders, self.received_at, self.exchange_timestamp)
+        return self.orders
+
+    def _apply_levels(self, side, levels, prices=None):
+        # The sorted prices are rebuilt after a snapshot, an update inserts or removes only the changed prices
+        for price, quantity in levels:
+            price = float(price)
+            quantity = float(quantity)
+            if quantity > 0:
+                if prices is not None and price not in side:
+                    insort(prices, price)
+                side[price] = quantity
+            elif side.pop(price, None) is not None and prices is not None:
+                del prices[bisect_left(prices, price)]
+
+    def _update_top(self):
+        if self.depth is not None:
+            self._truncate()
+        best_bid = self.bid_prices[-1] if self.bid_prices else None
+        best_ask = self.ask_prices[0] if self.ask_prices else None
+        top = (best_bid, self.bids.get(best_bid), best_ask, self.asks.get(best_ask))
+        changed = top != self.top
+        self.top = top
+        return changed
+
+    def _truncate(self):
+        # Levels that fall out of the subscribed depth are not updated by the exchange anymore
+        if len(self.bid_prices) > self.depth:
+            for price in self.bid_prices[:-self.depth]:
+                del self.bids[price]
+            del self.bid_prices[:-self.depth]
+        if len(self.ask_prices) > self.depth:
+            for price in self.ask_prices[self.depth:]:
+                del self.asks[price]
+            del self.ask_prices[self.depth:]
+
+
+class ReplayFeed:
+    """
+    Plays back normalized messages, e.g. for tests or recorded streams.
+    """
+
+    def __init__(self, exchange, messages, resync_snapshots=None, delay=0.0):
+        """
+        Parameters:
+        - exchange (str): Name of the exchange.
+        - messages (list): Normalized messages in the order they are played back.
+        - resync_snapshots (list): Snapshot messages returned, one per resync.
+        - delay (float): Seconds between two messages.
+        """
+        self.exchange = exchange
+        self.replay_messages = list(messages)
+        self.resync_snapshots = list(resync_snapshots or [])
+        self.delay = delay
+
+    async def messages(self):
+        for message in self.replay_messages:
+            # Let the other feeds and the pipeline run between two messages
+            await asyncio.sleep(self.delay)
+            yield message
+
+    async def resync(self):
+        return self.resync_snapshots.pop(0) if self.resync_snapshots else None
+
+
+class PollingFeed:
+    """
+    Turns REST snapshots fetched at an interval into snapshot messages, for exchanges without a stream.
+    """
+
+    def __init__(self, exchange, fetch_snapshot, interval):
+        """
+        Parameters:
+        - exchange (str): Name of the exchange.
+        - fetch_snapshot (callable): Coroutine function returning a snapshot message or None.
+        - interval (float): Seconds between two fetches.
+        """
+        self.exchange = exchange
+        self.fetch_snapshot = fetch_snapshot
+        self.interval = interval
+
+    async def messages(self):
+        while True:
+            snapshot = await self.fetch_snapshot()
+            if snapshot is not None:
+                yield snapshot
+            await asyncio.sleep(self.interval)
+
+    async def resync(self):
+        return await self.fetch_snapshot()
+
+
+class WebSocketFeed:
+    """
+    Streams an exchange WebSocket channel and turns its messages into normalized messages.
+
+    After a disconnect the feed reconnects and subscribes again. Exchanges answer a subscription with a snapshot.
+    """
+
+    def __init__(self, exchange, url, subscribe_messages, parse_message, reconnect_delay=1.0, heartbeat=30.0):
+        """
+        Parameters:
+        - exchange (str): Name of the exchange.
+        - url (str): WebSocket URL.
+        - subscribe_messages (list): Messages sent after connecting.
+        - parse_message (callable): Function turning a decoded exchange message into a list of normalized messages.
+        - reconnect_delay (float): Seconds to wait before reconnecting.
+        - heartbeat (float): Seconds between pings.
+        """
+        self.exchange = exchange
+        self.url = url
+        self.subscribe_messages = subscribe_messages
+        self.parse_message = parse_message
+        self.reconnect_delay = reconnect_delay
+        self.heartbeat = heartbeat
+        self.websocket = None
+
+    async def messages(self):
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(self.url, heartbeat=self.heartbeat) as websocket:
+                        self.websocket = websocket
+                        await self._subscribe()
+                        async for raw_message in websocket:
+                            if raw_message.type != aiohttp.WSMsgType.TEXT:
+                                continue
+                            for message in self.parse_message(json.loads(raw_message.data)):
+                                yield message
+                except aiohttp.ClientError as e:
+                    timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+                    print(f"{self.exchange} stream error: {e!r}, {timestamp}")
+                finally:
+                    self.websocket = None
+
+                # The book is out of sync until the snapshot of the new subscription
+                yield {'type': 'reset'}
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def resync(self):
+        # Subscribing again makes the exchange send a new snapshot
+        if self.websocket is not None and not self.websocket.closed:
+            await self._subscribe()
+        return None
+
+    async def _subscribe(self):
+        for subscribe_message in self.subscribe_messages:
+            await self.websocket.send_json(subscribe_message)
+
+
+def kraken_subscribe_message(symbol='BTC/EUR', depth=10):
+    """
+    Parameters:
+    - symbol (str): Trading symbol (e.g., 'BTC/EUR').
+    - depth (int): Number of levels per side.
+
+    Returns:
+    - dict: Subscription message of the Kraken v2 book channel.
+    """
+    return {'method': 'subscribe', 'params': {'channel': 'book', 'symbol': [symbol], 'depth': depth}}
+
+
+def parse_kraken_book_message(message):
+    """
+    Turns a Kraken v2 book channel message into normalized messages.
+
+    Kraken does not number its book messages, it publishes a checksum instead, so the messages are not
+    sequence checked. The heartbeats Kraken sends about every second while subscribed keep a quiet book current.
+
+    Parameters:
+    - message (dict): Decoded Kraken WebSocket message.
+
+    Returns:
+    - list: Normalized messages.
+    """
+    if message.get('channel') == 'heartbeat':
+        return [{'type': 'heartbeat'}]
+    if message.get('channel') != 'book' or message.get('type') not in ('snapshot', 'update'):
+        return []
+    return [{
+        'type': message['type'],
+        'sequence': None,
+        'timestamp': pd.Timestamp(data['timestamp']).timestamp() if data.get('timestamp') else None,
+        'bids': [(level['price'], level['qty']) for level in data.get('bids', [])],
+        'asks': [(level['price'], level['qty']) for level in data.get('asks', [])],
+    } for data in message.get('data', [])]
+
+
+def coinmetro_snapshot_message(coinmetro_order_book):
+    """
+    Parameters:
+    - coinmetro_order_book (dict): Raw order book data from the Coinmetro exchange.
+
+    Returns:
+    - dict: Normalized snapshot message, None if there is no order book.
+    """
+    if coinmetro_order_book is None:
+        return None
+    return {
+        'type': 'snapshot',
+        'sequence': None,
+        'bids': list(coinmetro_order_book.get('bid', {}).items()),
+        'asks': list(coinmetro_order_book.get('ask', {}).items()),
+    }
+
+
+def ccxt_snapshot_message(exchange_order_book):
+    """
+    Parameters:
+    - exchange_order_book (dict): Raw order book data from a CCXT exchange.
+
+    Returns:
+    - dict: Normalized snapshot message, None if there is no order book.
+    """
+    if exchange_order_book is None:
+        return None
+    return {
+        'type': 'snapshot',
+        'sequence': None,
+        'timestamp': exchange_order_book['timestamp'] / 1000 if exchange_order_book.get('timestamp') else None,
+        'bids': [level[:2] for level in exchange_order_book.get('bids', [])],
+        'asks': [level[:2] for level in exchange_order_book.get('asks', [])],
+    }
+
+
+class StreamingOrderBooks:
+    """
+    Keeps one L2Book per feed and runs 'on_top_change' with the order lists of all books when the top of a book
+    changes. Changes that arrive while the pipeline is running are handled in one run after it.
+    """
+
+    def __init__(self, feeds, on_top_change, depth=None, latency=None):
+        """
+        Parameters:
+        - feeds (list): Feeds with an 'exchange' name, a 'messages' async iterator and a 'resync' coroutine.
+        - on_top_change (callable): Coroutine function called with the order lists of all books.
+        - depth (int): Number of levels kept per side.
+        - latency (LatencyTracker): Marks the books as received when a message is applied, for their age.
+        """
+        self.feeds = feeds
+        self.books = {feed.exchange: L2Book(feed.exchange, depth) for feed in feeds}
+        self.on_top_change = on_top_change
+        self.latency = latency
+        self.messages = 0
+        self.gaps = 0
+        self.resyncs = 0
+        self.triggers = 0
+        self._wakeup = None
+        self._pending = False
+        self._finished = False
+
+    def order_lists(self):
+        """
+        Returns:
+        - list: Order lists of the books, tuples (price, quantity, ask/bid, exchange).
+        """
+        return [book.to_orders() for book in self.books.values()]
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Message, gap, resync and pipeline trigger counters, and the metrics of the feeds that have them.
+        """
+        metrics = {'messages': self.messages, 'gaps': self.gaps, 'resyncs': self.resyncs, 'triggers': self.triggers}
+        venues = {feed.exchange: feed.metrics() for feed in self.feeds if hasattr(feed, 'metrics')}
+        if venues:
+            metrics['venues'] = venues
+        return metrics
+
+    async def run(self):
+        """
+        Consumes all feeds until they end or the task is cancelled.
+        """
+        self._wakeup = asyncio.Event()
+        self._finished = False
+        trigger_task = asyncio.create_task(self._trigger_pipeline())
+        feed_tasks = [asyncio.create_task(self._consume(feed)) for feed in self.feeds]
+        try:
+            await asyncio.gather(*feed_tasks)
+            # Handle the last change before stopping
+            self._finished = True
+            self._wakeup.set()
+            await trigger_task
+        finally:
+            for task in feed_tasks + [trigger_task]:
+                task.cancel()
+
+    async def _consume(self, feed):
+        book = self.books[feed.exchange]
+        waiting_for_snapshot = True
+        async for message in feed.messages():
+            self.messages += 1
+            try:
+                if message['type'] == 'snapshot':
+                    changed = book.apply_snapshot(message['bids'], message['asks'], message.get('sequence'), message.get('timestamp'))
+                    waiting_for_snapshot = False
+                elif message['type'] == 'update':
+                    # Updates before the requested snapshot cannot be applied
+                    if waiting_for_snapshot:
+                        continue
+                    changed = book.apply_update(message['bids'], message['asks'], message.get('sequence'), message.get('timestamp'))
+                elif message['type'] == 'heartbeat':
+                    # The subscription is alive, an unchanged book is still current
+                    book.mark_alive()
+                    continue
+                else:
+                    book.reset()
+                    waiting_for_snapshot = True
+                    continue
+            except SequenceGapError as e:
+                self.gaps += 1
+                timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"Resynchronizing order book: {e}, {timestamp}")
+                book.reset()
+                self.resyncs += 1
+                snapshot = await feed.resync()
+                if snapshot is None:
+                    waiting_for_snapshot = True
+                    continue
+                changed = book.apply_snapshot(snapshot['bids'], snapshot['asks'], snapshot.get('sequence'), snapshot.get('timestamp'))
+            if self.latency is not None:
+                self.latency.mark_received(feed.exchange)
+
+            # Only complete sets of books are matched
+            if changed and all(other.synced for other in self.books.values()):
+                self._pending = True
+                self._wakeup.set()
+
+    async def _trigger_pipeline(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._pending:
+                self._pending = False
+                self.triggers += 1
+                await self.on_top_change(self.order_lists())
+            if self._finished and not self._pending:
+                return
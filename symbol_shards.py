@@ -0,0 +1,211 @@
+"""
+symbol_shards.py
+
+This module scans many trading symbols at once. The symbols are split into shards and every shard runs its own
+fetch and matching loop in a worker process. The results stream back to one coordinator in the main process, which
+saves and reports them, so matching is spread over all cores instead of one Python process.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from coinmetro_client import CoinmetroClient
+from data_fetch import get_venue_orderbooks
+from day_state import RollingDayState
+from exchange_registry import ExchangeRegistry
+from filled_orders_ledger import FilledOrdersLedger
+from matching_engine import kraken_coinmetro_quantities
+from pipeline import ArbitragePipeline
+from read_starting_info import initialize_matched_orders_today
+from save_results import daily_profit_entry, venue_delta_entries
+
+
+def shard_symbols(symbols, shard_count):
+    """
+    Splits the symbols into shards of about the same size.
+
+    Parameters:
+    - symbols (list): Trading symbols (e.g., ['BTC/EUR', 'ETH/EUR']).
+    - shard_count (int): Number of shards.
+
+    Returns:
+    - list: Lists of symbols, no shard is empty.
+    """
+    shard_count = max(1, min(shard_count, len(symbols)))
+    return [list(symbols[shard::shard_count]) for shard in range(shard_count)]
+
+
+async def fetch_symbol_order_lists(symbol, ccxt_venues, coinmetro_client, registry):
+    """
+    Fetches the order books of one symbol from Coinmetro and the CCXT exchanges, as arrays.
+
+    Returns:
+    - list: OrderBook of every exchange that answered.
+    """
+    order_lists = await get_venue_orderbooks(ccxt_venues, symbol, coinmetro_client, registry, arrays=True)
+    return [orders for orders in order_lists if orders]
+
+
+def run_shard(shard, symbols, ccxt_venues, fee_table, ledgers, interval, result_queue, stop_event, max_cycles=None, fetch_order_lists=None):
+    """
+    Entry point of a worker process. Fetches and matches the symbols of one shard until 'stop_event' is set.
+
+    Every result is put on 'result_queue' as a tuple (symbol, matched trades, matching profit, venue deltas). When the
+    shard stops it puts (None, shard, snapshots matched, snapshots skipped by the pre-check).
+
+    Parameters:
+    - shard (int): Number of the shard.
+    - symbols (list): Trading symbols of the shard.
+    - ccxt_venues (list): Names of the CCXT exchanges.
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+    - ledgers (dict): FilledOrdersLedger of every symbol.
+    - interval (float): Seconds between two fetches of the shard.
+    - result_queue (Queue): Process-safe queue read by the coordinator.
+    - stop_event (Event): Process-safe event set by the coordinator to stop the shard.
+    - max_cycles (int): Number of fetches after which the shard stops. Runs until stopped if not given.
+    - fetch_order_lists (callable): Coroutine function (symbol, ccxt_venues, coinmetro_client, registry) returning the
+      order lists of a symbol. Defaults to fetch_symbol_order_lists.
+    """
+    asyncio.run(_run_shard(shard, symbols, ccxt_venues, fee_table, ledgers, interval, result_queue, stop_event, max_cycles,
+                           fetch_order_lists or fetch_symbol_order_lists))
+
+
+async def _run_shard(shard, symbols, ccxt_venues, fee_table, ledgers, interval, result_queue, stop_event, max_cycles, fetch_order_lists):
+    # Clients cannot be shared between processes, every shard opens its own connections
+    registry = ExchangeRegistry()
+    coinmetro_client = CoinmetroClient()
+    pipelines = {symbol: ArbitragePipeline(fee_table, ledgers.get(symbol) or FilledOrdersLedger(), verbose=False) for symbol in symbols}
+    cycles = 0
+    try:
+        while not stop_event.is_set() and (max_cycles is None or cycles < max_cycles):
+            cycles += 1
+            # The symbols of the shard are fetched concurrently, the CCXT clients keep to the rate limits
+            order_lists_by_symbol = await asyncio.gather(*(fetch_order_lists(symbol, ccxt_venues, coinmetro_client, registry) for symbol in symbols))
+            for symbol, order_lists in zip(symbols, order_lists_by_symbol):
+                result = pipelines[symbol].match(order_lists)
+                if result is not None and result[0]:
+                    result_queue.put((symbol,) + result)
+            await asyncio.sleep(interval)
+    finally:
+        await coinmetro_client.close()
+        await registry.close()
+        result_queue.put((None, shard, sum(pipeline.snapshots for pipeline in pipelines.values()), sum(pipeline.skipped for pipeline in pipelines.values())))
+
+
+class SymbolShardCoordinator:
+    """
+    Runs the shards in a process pool and saves and reports the results of all symbols.
+    """
+
+    def __init__(self, symbols, ccxt_venues, fee_table, interval, shard_count=None, writer=None, path="", verbose=True, max_cycles=None, fetch_order_lists=None,
+                 export_to_excel=False):
+        """
+        Parameters:
+        - symbols (list): Trading symbols (e.g., ['BTC/EUR', 'ETH/EUR']).
+        - ccxt_venues (list): Names of the CCXT exchanges matched against Coinmetro and each other.
+        - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+        - interval (float): Seconds between two fetches of a shard.
+        - shard_count (int): Number of worker processes. Defaults to the number of CPUs.
+        - writer (JournalWriter): Background writer of the journals. Nothing is saved if not given.
+        - path (str or Path): Directory of the journals.
+        - verbose (bool): Print the profit of every match.
+        - max_cycles (int): Number of fetches after which every shard stops. Runs until cancelled if not given.
+        - fetch_order_lists (callable): Module level coroutine function passed to the shards, see run_shard.
+        - export_to_excel (bool): Export the journals of a symbol to Excel files when the day ends.
+        """
+        self.symbols = list(symbols)
+        self.ccxt_venues = list(ccxt_venues)
+        self.fee_table = fee_table
+        self.interval = interval
+        self.shards = shard_symbols(self.symbols, shard_count or os.cpu_count() or 1)
+        self.writer = writer
+        self.verbose = verbose
+        self.max_cycles = max_cycles
+        self.fetch_order_lists = fetch_order_lists
+        # The ledgers are copied to the shards, the day states only roll the journals over
+        self.day_states = {symbol: RollingDayState(path, symbol, export_to_excel=export_to_excel) for symbol in self.symbols}
+        self.journals = {symbol: day_state.journals for symbol, day_state in self.day_states.items()}
+        self.ledgers = {symbol: FilledOrdersLedger.from_dataframe(initialize_matched_orders_today(path, symbol)) for symbol in self.symbols}
+        self.total_profit = {symbol: 0 for symbol in self.symbols}
+        self.matches = 0
+        self.snapshots = 0
+        self.skipped = 0
+
+    def all_journals(self):
+        """
+        Returns:
+        - list: Journals of all symbols.
+        """
+        return [journal for journals in self.journals.values() for journal in journals]
+
+    def metrics(self):
+        """
+        Returns:
+        - dict: Number of shards, snapshots matched and skipped by the shards, results received and total profit by symbol.
+        """
+        return {'shards': len(self.shards), 'snapshots': self.snapshots, 'skipped': self.skipped, 'matches': self.matches, 'total_profit': dict(self.total_profit)}
+
+    async def run(self):
+        """
+        Starts the shards and handles their results until they stop or the task is cancelled.
+        """
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=len(self.shards)) as pool:
+            result_queue = manager.Queue()
+            stop_event = manager.Event()
+            futures = [asyncio.wrap_future(pool.submit(run_shard, shard, symbols, self.ccxt_venues, self.fee_table,
+                                                       {symbol: self.ledgers[symbol] for symbol in symbols}, self.interval,
+                                                       result_queue, stop_event, self.max_cycles, self.fetch_order_lists))
+                       for shard, symbols in enumerate(self.shards)]
+            running = len(futures)
+            try:
+                while running:
+                    try:
+                        result = await asyncio.to_thread(result_queue.get, True, 0.5)
+                    except queue.Empty:
+                        # A shard that crashed never reports that it stopped
+                        if all(future.done() for future in futures):
+                            break
+                        continue
+                    if result[0] is None:
+                        running -= 1
+                        self.snapshots += result[2]
+                        self.skipped += result[3]
+                        continue
+                    await self.handle_result(*result)
+            finally:
+                stop_event.set()
+                for future in futures:
+                    try:
+                        await future
+                    except Exception as e:
+                        print(f"Symbol shard stopped with an error: {e!r}")
+                for day_state in self.day_states.values():
+                    await day_state.close()
+
+    async def handle_result(self, symbol, matched_trades, matching_profit, venue_deltas):
+        """
+        Saves and prints the result of one symbol.
+
+        Parameters:
+        - symbol (str): Trading symbol.
+        - matched_trades (list): Matched trades of the snapshot.
+        - matching_profit (float): Profit of the matched trades.
+        - venue_deltas (dict): Base and quote quantities traded on every exchange.
+        """
+        self.matches += 1
+        self.total_profit[symbol] += matching_profit
+        day_state = self.day_states[symbol]
+        if day_state.roll(self.writer):
+            self.journals[symbol] = day_state.journals
+        if self.writer is not None:
+            filled_orders, trades, venue_deltas_entries = self.journals[symbol]
+            await self.writer.submit(filled_orders, matched_trades)
+            await self.writer.submit(trades, [daily_profit_entry(matching_profit, *kraken_coinmetro_quantities(venue_deltas))])
+            await self.writer.submit(venue_deltas_entries, venue_delta_entries(venue_deltas))
+        if self.verbose:
+            print(f"{symbol}: {len(matched_trades) // 2} trades, profit {matching_profit} at {pd.Timestamp.now().strftime('%Y-%m-%d %H-%M-%S')}, "
+                  f"total profit for {symbol}: {self.total_profit[symbol]}")
@@ -0,0 +1,76 @@
+# test__arbitrage_graph.py
+
+import pytest
+from arbitrage_graph import ArbitrageGraph
+
+no_fees = {'kraken': (0, 0), 'coinmetro': (0, 0)}
+
+
+def triangular_graph(fee_table=no_fees):
+    graph = ArbitrageGraph(fee_table, default_transfer_cost=None)
+    graph.update_market('kraken', 'BTC/EUR', (20000.0, 1.0), (20000.0, 1.0))
+    graph.update_market('kraken', 'ETH/EUR', (1100.0, 5.0), (1100.0, 5.0))
+    graph.update_market('kraken', 'ETH/BTC', (0.05, 10.0), (0.05, 10.0))
+    return graph
+
+
+def test__triangular_cycle():
+    cycles = triangular_graph().profitable_cycles(max_hops=3)
+
+    assert len(cycles) == 1
+    cycle = cycles[0]
+    # 1 BTC buys 20 ETH, sold for 22000 EUR, which buy 1.1 BTC
+    assert cycle['path'] == [('kraken', 'BTC'), ('kraken', 'ETH'), ('kraken', 'EUR'), ('kraken', 'BTC')]
+    assert cycle['markets'] == [('kraken', 'ETH/BTC', 'Ask'), ('kraken', 'ETH/EUR', 'Bid'), ('kraken', 'BTC/EUR', 'Ask')]
+    assert cycle['rate'] == pytest.approx(1.1)
+    assert cycle['profit_rate'] == pytest.approx(0.1)
+    # The 5 ETH bid takes 0.25 BTC worth of ETH
+    assert cycle['amount'] == pytest.approx(0.25)
+
+
+def test__fees_remove_the_profit():
+    fee_table = {'kraken': (0.04, 0.04)}
+    assert triangular_graph(fee_table).profitable_cycles(max_hops=3) == []
+    assert triangular_graph(no_fees).profitable_cycles(max_hops=3, min_profit=0.2) == []
+
+
+def test__cross_exchange_cycle():
+    graph = ArbitrageGraph(no_fees, transfer_costs={'BTC': 0.001})
+    graph.update_market('kraken', 'BTC/EUR', (19900.0, 1.0), (20000.0, 1.0))
+    graph.update_market('coinmetro', 'BTC/EUR', (20200.0, 0.5), (20300.0, 1.0))
+
+    cycles = graph.profitable_cycles()
+    assert len(cycles) == 1
+    # Sell BTC on Coinmetro, buy it back on Kraken and move it back to Coinmetro
+    assert cycles[0]['path'] == [('coinmetro', 'BTC'), ('coinmetro', 'EUR'), ('kraken', 'EUR'), ('kraken', 'BTC'), ('coinmetro', 'BTC')]
+    assert cycles[0]['markets'] == [('coinmetro', 'BTC/EUR', 'Bid'), ('kraken', 'BTC/EUR', 'Ask')]
+    assert cycles[0]['rate'] == pytest.approx(20200 / 20000 * 0.999)
+    assert cycles[0]['amount'] == pytest.approx(0.5)
+
+
+def test__incremental_search_only_changed_markets():
+    graph = triangular_graph()
+    assert len(graph.profitable_cycles(max_hops=3)) == 1
+    # Nothing changed, nothing to search
+    assert graph.profitable_cycles(max_hops=3) == []
+
+    # The ETH/EUR bid drops, the cycle is not profitable anymore
+    graph.update_market('kraken', 'ETH/EUR', (900.0, 5.0), (1100.0, 5.0))
+    assert graph.profitable_cycles(max_hops=3) == []
+    assert graph.profitable_cycles(max_hops=3, full=True) == []
+
+    graph.update_market('kraken', 'ETH/EUR', (1050.0, 5.0), (1100.0, 5.0))
+    assert graph.profitable_cycles(max_hops=3)[0]['rate'] == pytest.approx(1.05)
+
+
+def test__update_from_orders_and_remove_market():
+    graph = ArbitrageGraph(no_fees, default_transfer_cost=None)
+    graph.update_from_orders('BTC/EUR', [(20000.0, 1.0, 'Bid', 'kraken'), (20001.0, 1.0, 'Bid', 'kraken'), (20002.0, 2.0, 'Ask', 'kraken'), (20003.0, 1.0, 'Ask', 'kraken')])
+    graph.update_market('kraken', 'ETH/EUR', (1100.0, 5.0), (1100.0, 5.0))
+    graph.update_market('kraken', 'ETH/BTC', (0.05, 10.0), (0.05, 10.0))
+    assert graph.markets[('kraken', 'BTC/EUR')] == ((20001.0, 1.0), (20002.0, 2.0))
+    assert len(graph.profitable_cycles(max_hops=3)) == 1
+
+    graph.remove_market('kraken', 'BTC/EUR')
+    assert len(graph) == 2
+    assert graph.profitable_cycles(max_hops=3, full=True) == []
@@ -0,0 +1,113 @@
+# test__batch_matching.py
+
+import numpy as np
+import pytest
+from batch_matching import BookBatch, match_batch
+from filled_orders_ledger import FilledOrdersLedger
+from matching_engine import match_orders_by_venue
+from order_book import OrderBook
+from orderbook_preparation import update_filled_orders
+from pipeline import ArbitragePipeline
+from replay import replay_batch
+from snapshot_recorder import SnapshotRecorder
+from venue_books import VenueBooks
+from test__venue_books import random_order_lists, fee_table
+
+
+def crossing_book(order_lists, filled_orders_ledger=None):
+    venue_books = VenueBooks(fee_table, verbose=False)
+    venue_books.load(order_lists)
+    return update_filled_orders(venue_books.crossing_book(), filled_orders_ledger or FilledOrdersLedger())
+
+
+def assert_same_as_matching_engine(books):
+    batch = BookBatch.from_books(books)
+    profit, base_deltas, quote_deltas, fill_counts = match_batch(batch)
+    venues = batch.venues
+    for row, book in enumerate(books):
+        matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book.take(np.arange(len(book))))
+        assert profit[row] == pytest.approx(matching_profit)
+        assert fill_counts[row] == len(matched_trades) // 2
+        expected_base = np.zeros(len(venues))
+        expected_quote = np.zeros(len(venues))
+        for exchange, (base_quantity, quote_quantity) in venue_deltas.items():
+            expected_base[venues.index(exchange)] = base_quantity
+            expected_quote[venues.index(exchange)] = quote_quantity
+        assert base_deltas[row] == pytest.approx(expected_base)
+        assert quote_deltas[row] == pytest.approx(expected_quote)
+
+
+def test__from_books__padded_sides():
+    books = [OrderBook.from_orders([(100.0, 1.0, 'Ask', 'a'), (99.0, 2.0, 'Ask', 'a'), (101.0, 1.0, 'Bid', 'b'), (98.0, 1.0, 'Bid', 'b')]),
+             OrderBook.from_orders([(100.0, 1.0, 'Ask', 'a'), (99.0, 1.0, 'Bid', 'b')])]
+    for book in books:
+        book.net_price[:] = book.price
+
+    batch = BookBatch.from_books(books)
+
+    # Only the levels that cross are kept, the second book has none
+    assert len(batch) == 2
+    assert batch.ask_count.tolist() == [2, 0]
+    assert batch.bid_count.tolist() == [1, 0]
+    assert batch.ask_net_price.tolist() == [[99.0, 100.0], [np.inf, np.inf]]
+    assert batch.bid_net_price.tolist() == [[101.0], [-np.inf]]
+    assert batch.ask_remaining.tolist() == [[2.0, 1.0], [0.0, 0.0]]
+    assert [batch.venues[venue] for venue in batch.bid_venue[0]] == ['b']
+
+
+@pytest.mark.parametrize("levels", [3, 20, 60])
+def test__match_batch__same_as_matching_engine(levels):
+    books = [crossing_book(random_order_lists(seed, levels=levels)) for seed in range(30)]
+    assert any(not book.empty for book in books)
+    assert_same_as_matching_engine(books)
+
+
+def test__match_batch__remaining_quantities_of_the_ledger():
+    # Levels partly filled by earlier matches keep only their remaining quantity
+    order_lists = random_order_lists(2, levels=20)
+    ledger = FilledOrdersLedger()
+    ArbitragePipeline(fee_table, ledger, verbose=False).match(order_lists)
+    books = [crossing_book(order_lists, ledger), crossing_book(order_lists)]
+    assert (books[0].remaining < books[0].quantity).any()
+    assert_same_as_matching_engine(books)
+
+
+def test__match_batch__no_matches():
+    profit, base_deltas, quote_deltas, fill_counts = match_batch(BookBatch.from_books([OrderBook.from_orders([])]))
+    assert profit.tolist() == [0.0]
+    assert base_deltas.shape == quote_deltas.shape == (1, 0)
+    assert fill_counts.tolist() == [0]
+
+
+def test__replay_batch__same_as_pipeline_per_snapshot(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    snapshots = [random_order_lists(seed) for seed in range(20)]
+    with SnapshotRecorder(file_path) as recorder:
+        for timestamp, order_lists in enumerate(snapshots):
+            recorder.record(order_lists, timestamp=1700000000.0 + timestamp)
+
+    results = replay_batch(file_path, fee_table)
+
+    assert results['snapshots'] == 20
+    assert results['timestamps'].tolist() == [1700000000.0 + timestamp for timestamp in range(20)]
+    # Every snapshot is matched with an empty ledger
+    for row, order_lists in enumerate(snapshots):
+        result = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False).match(order_lists)
+        matching_profit, venue_deltas = (result[1], result[2]) if result is not None else (0.0, {})
+        assert results['profits'][row] == pytest.approx(matching_profit)
+        for exchange, (base_quantity, quote_quantity) in venue_deltas.items():
+            venue = results['venues'].index(exchange)
+            assert results['base_deltas'][row, venue] == pytest.approx(base_quantity)
+            assert results['quote_deltas'][row, venue] == pytest.approx(quote_quantity)
+    assert results['matches'] == np.count_nonzero(results['profits']) > 0
+    assert results['total_profit'] == pytest.approx(results['profits'].sum())
+
+
+def test__replay_batch__empty_recording(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    SnapshotRecorder(file_path).close()
+
+    results = replay_batch(file_path, fee_table)
+    assert results['snapshots'] == results['matches'] == 0
+    assert results['total_profit'] == 0.0
+    assert results['venue_deltas'] == {}
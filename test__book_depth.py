@@ -0,0 +1,120 @@
+# test__book_depth.py
+
+import numpy as np
+import pytest
+from book_depth import aggregate_side, edge_depth, truncate_at_edge, aggregation_error_bound
+from filled_orders_ledger import FilledOrdersLedger
+from order_book import OrderBook, ASK, BID
+from orderbook_preparation import update_filled_orders
+from pipeline import ArbitragePipeline
+from venue_books import VenueBooks, taker_fee_lookup, sorted_positions
+from test__venue_books import random_order_lists, fee_table
+
+
+def crossing_book(order_lists, price_buckets=None):
+    venue_books = VenueBooks(fee_table, verbose=False, price_buckets=price_buckets)
+    venue_books.load(order_lists)
+    return update_filled_orders(venue_books.crossing_book(), FilledOrdersLedger())
+
+
+def test__aggregate_side__worse_price_of_bucket():
+    book = OrderBook.from_orders([(100.4, 1.0, 'Bid', 'kraken'), (100.1, 2.0, 'Bid', 'kraken'), (99.9, 0.5, 'Bid', 'kraken'),
+                                  (101.2, 1.0, 'Ask', 'kraken'), (101.9, 3.0, 'Ask', 'kraken'), (102.0, 1.0, 'Ask', 'kraken')])
+
+    # Bids are rounded down and asks up, the quantities of a bucket are added up
+    bids = aggregate_side(book, sorted_positions(book, BID), 1.0)
+    asks = aggregate_side(book, sorted_positions(book, ASK), 1.0)
+    assert list(zip(bids.price.tolist(), bids.quantity.tolist())) == [(99.0, 0.5), (100.0, 3.0)]
+    assert list(zip(asks.price.tolist(), asks.quantity.tolist())) == [(102.0, 5.0)]
+    assert asks.exchange_names().tolist() == ['kraken']
+    assert aggregate_side(book, np.empty(0, dtype=np.intp), 1.0).empty
+
+
+def test__venue_books__buckets_only_exchanges_with_a_size():
+    venue_books = VenueBooks(fee_table, price_buckets={'coinmetro': 1.0})
+    venue_books.load([[(100.4, 1.0, 'Bid', 'coinmetro'), (100.6, 1.0, 'Bid', 'coinmetro'), (101.2, 1.0, 'Ask', 'coinmetro')],
+                      [(100.4, 1.0, 'Bid', 'kraken'), (100.6, 1.0, 'Bid', 'kraken')]])
+
+    assert venue_books.bids['coinmetro'].price.tolist() == [100.0]
+    assert venue_books.bids['coinmetro'].quantity.tolist() == [2.0]
+    assert venue_books.best_ask['coinmetro'] == pytest.approx(102.0 * 1.001)
+    assert venue_books.bids['kraken'].price.tolist() == [100.4, 100.6]
+
+
+def test__edge_depth_and_truncation():
+    # The second ask is still below the second bid, the third ask is above the bid at its depth
+    book = OrderBook.from_orders([(100.0, 1.0, 'Ask', 'a'), (101.0, 1.0, 'Ask', 'a'), (103.0, 5.0, 'Ask', 'a'),
+                                  (104.0, 1.5, 'Bid', 'b'), (102.0, 1.0, 'Bid', 'b'), (100.5, 4.0, 'Bid', 'b')]).sort_by_net_price()
+
+    quantity, profit = edge_depth(book)
+    assert quantity == pytest.approx(2.0)
+    assert profit == pytest.approx(1.0 * 4.0 + 0.5 * 3.0 + 0.5 * 1.0)
+
+    truncated = truncate_at_edge(book)
+    assert sorted(truncated.price.tolist()) == [100.0, 101.0, 102.0, 104.0]
+    assert np.all(np.diff(truncated.net_price) >= 0)
+    assert edge_depth(truncated) == pytest.approx((quantity, profit))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test__truncation_keeps_the_edge(seed):
+    book = crossing_book(random_order_lists(seed, levels=50))
+    if book.empty:
+        pytest.skip("No exchange pair crosses")
+    truncated = truncate_at_edge(book)
+    assert len(truncated) <= len(book)
+    assert edge_depth(truncated) == pytest.approx(edge_depth(book))
+
+
+@pytest.mark.parametrize("bucket_size", [0.5, 5.0])
+@pytest.mark.parametrize("seed", range(10))
+def test__aggregation_profit_within_bound(seed, bucket_size):
+    order_lists = random_order_lists(seed, levels=50)
+    quantity, profit = edge_depth(crossing_book(order_lists))
+    aggregated_quantity, aggregated_profit = edge_depth(crossing_book(order_lists, {exchange: bucket_size for exchange in fee_table}))
+
+    # Buckets never add profit, and every unit loses at most one bucket on each side
+    max_fee = max(taker_fee for maker_fee, taker_fee in fee_table.values())
+    assert aggregated_profit <= profit + 1e-6
+    assert profit - aggregated_profit <= 2 * bucket_size * (1 + max_fee) * quantity + 1e-6
+
+
+def test__pipeline__reports_error_bound():
+    order_lists = random_order_lists(1, levels=50)
+    price_buckets = {exchange: 1.0 for exchange in fee_table}
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, price_buckets=price_buckets, edge_truncation=True)
+
+    matched_trades, matching_profit, venue_deltas = pipeline.match(order_lists)
+
+    bound = aggregation_error_bound(matched_trades, price_buckets, taker_fee_lookup(fee_table))
+    matched_quantity = sum(trade['Matched Quantity'] for trade in matched_trades)
+    assert 0 < bound <= matched_quantity * 1.0 * (1 + 0.003)
+    assert pipeline.metrics()['profit_error_bound'] == bound
+    # The fills of the buckets are recorded at the levels the exchanges sent
+    sent = {(order[3], order[2], order[0], order[1]) for orders in order_lists for order in orders}
+    assert all((trade['Exchange'], trade['Ask/Bid'], trade['Price'], trade['Quantity']) in sent for trade in matched_trades)
+
+
+def bucketed_fills(matched_trades):
+    return [(trade['Price'], trade['Matched Quantity'], trade['Remaining Quantity']) for trade in matched_trades if trade['Exchange'] == 'kraken']
+
+
+def test__pipeline__bucket_fills_are_split_over_its_levels():
+    pipeline = ArbitragePipeline({'coinmetro': (0.0, 0.0), 'kraken': (0.0, 0.0)}, FilledOrdersLedger(), verbose=False, price_buckets={'kraken': 1.0})
+    matched_trades, matching_profit, venue_deltas = pipeline.match([
+        [(100.2, 1.0, 'Ask', 'kraken'), (100.7, 1.0, 'Ask', 'kraken')], [(105.0, 1.5, 'Bid', 'coinmetro')]])
+
+    # The bucket at 101 is filled with 1.5, the cheapest level first
+    assert bucketed_fills(matched_trades) == [(100.2, 1.0, 0.0), (100.7, 0.5, 0.5)]
+    assert matching_profit == pytest.approx(1.5 * (105.0 - 101.0))
+    assert venue_deltas['kraken'][0] == pytest.approx(1.5)
+    assert pipeline.filled_orders_ledger.min_remaining == {('kraken', 'Ask', 100.7, 1.0): 0.5}
+
+
+def test__pipeline__filled_levels_stay_filled_when_their_bucket_changes():
+    pipeline = ArbitragePipeline({'coinmetro': (0.0, 0.0), 'kraken': (0.0, 0.0)}, FilledOrdersLedger(), verbose=False, price_buckets={'kraken': 1.0})
+    pipeline.match([[(100.2, 1.0, 'Ask', 'kraken'), (100.7, 1.0, 'Ask', 'kraken')], [(105.0, 0.5, 'Bid', 'coinmetro')]])
+
+    # Another order of the bucket changed, only the half left of the level at 100.2 is offered before the next level
+    matched_trades = pipeline.match([[(100.2, 1.0, 'Ask', 'kraken'), (100.7, 2.0, 'Ask', 'kraken')], [(105.0, 1.0, 'Bid', 'coinmetro')]])[0]
+    assert bucketed_fills(matched_trades) == [(100.2, 0.5, 0.0), (100.7, 0.5, 1.5)]
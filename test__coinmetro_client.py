@@ -0,0 +1,102 @@
+# test__coinmetro_client.py
+
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import coinmetro_client
+from coinmetro_client import CoinmetroClient, decode_json
+from data_fetch import fetch_coinmetro_order_book
+
+coinmetro_book = {'book': {'bid': {'23428.00': 0.30639636}, 'ask': {'23437.2': 0.21239833}}}
+
+
+@pytest_asyncio.fixture
+async def stub_server():
+    connections = set()
+
+    async def order_book(request):
+        connections.add(request.transport.get_extra_info('peername'))
+        if request.match_info['pair'] == 'SLOW':
+            await asyncio.sleep(1)
+        if request.match_info['pair'] == 'HTML':
+            return web.Response(body=b'<html><body>502 Bad Gateway</body></html>', content_type='text/html')
+        if request.match_info['pair'] == 'TRUNCATED':
+            return web.Response(body=b'{"book": {"bid": {"23428.00"', content_type='application/json')
+        if request.match_info['pair'] == 'LIST':
+            return web.json_response([])
+        if request.match_info['pair'] != 'BTCEUR':
+            return web.json_response({'message': 'Unknown pair'}, status=404)
+        return web.json_response(coinmetro_book)
+
+    app = web.Application()
+    app.router.add_get('/exchange/book/{pair}', order_book)
+    server = TestServer(app)
+    await server.start_server()
+    server.connections = connections
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test__fetch_order_book__reuses_connection(stub_server):
+    async with CoinmetroClient(str(stub_server.make_url(''))) as client:
+        for _ in range(5):
+            assert await client.fetch_order_book('BTCEUR') == coinmetro_book['book']
+    assert len(stub_server.connections) == 1
+
+
+@pytest.mark.asyncio
+async def test__fetch_order_book__error_status(stub_server):
+    async with CoinmetroClient(str(stub_server.make_url(''))) as client:
+        assert await client.fetch_order_book('XXXEUR') is None
+
+
+@pytest.mark.asyncio
+async def test__fetch_order_book__timeout(stub_server):
+    async with CoinmetroClient(str(stub_server.make_url('')), timeout=0.1) as client:
+        assert await client.fetch_order_book('SLOW') is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pair", ['HTML', 'TRUNCATED', 'LIST'])
+async def test__fetch_order_book__malformed_body(stub_server, pair):
+    async with CoinmetroClient(str(stub_server.make_url(''))) as client:
+        assert await client.fetch_order_book(pair) is None
+        # The connection is still usable
+        assert await client.fetch_order_book('BTCEUR') == coinmetro_book['book']
+
+
+@pytest.mark.asyncio
+async def test__fetch_coinmetro_order_book__transforms_book(stub_server):
+    async with CoinmetroClient(str(stub_server.make_url(''))) as client:
+        orders = await fetch_coinmetro_order_book(client)
+    assert orders == [(23428.0, 0.30639636, 'Bid', 'coinmetro'), (23437.2, 0.21239833, 'Ask', 'coinmetro')]
+
+
+@pytest.mark.asyncio
+async def test__fetch_coinmetro_order_book__arrays(stub_server):
+    async with CoinmetroClient(str(stub_server.make_url(''))) as client:
+        book = await fetch_coinmetro_order_book(client, arrays=True)
+    assert book.price.tolist() == [23428.0, 23437.2]
+    assert book.quantity.tolist() == [0.30639636, 0.21239833]
+    assert book.exchange_names().tolist() == ['coinmetro', 'coinmetro']
+    assert book.received_at is not None
+
+
+def test__decode_json__without_orjson(monkeypatch):
+    body = b'{"book": {"bid": {"23428.00": 0.30639636}, "ask": {}}}'
+    expected = {'book': {'bid': {'23428.00': 0.30639636}, 'ask': {}}}
+    assert decode_json(body) == expected
+    monkeypatch.setattr(coinmetro_client, 'orjson', None)
+    assert decode_json(body) == expected
+
+
+@pytest.mark.parametrize("body", [b'{"book": {"bid": {"23428.00"', b'<html><body>502 Bad Gateway</body></html>', b''])
+def test__decode_json__malformed_body_raises_value_error(monkeypatch, body):
+    with pytest.raises(ValueError):
+        decode_json(body)
+    monkeypatch.setattr(coinmetro_client, 'orjson', None)
+    with pytest.raises(ValueError):
+        decode_json(body)
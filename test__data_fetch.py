@@ -2,7 +2,9 @@
 
 import asyncio
 import pytest
-from data_fetch import get_orderbooks
+import numpy as np
+from data_fetch import get_orderbooks, transform_ccxt_exchange_order_book, transform_coinmetro_order_book, coinmetro_order_book_arrays, ccxt_order_book_arrays
+from order_book import OrderBook
 
 
 @pytest.mark.asyncio
@@ -62,3 +64,46 @@ async def test__get_orderbooks__response_structure():
         float_quantity = float(quantity)
         assert isinstance(float_price, float)
         assert isinstance(float_quantity, float)
+
+
+def test__transform_ccxt_exchange_order_book__timestamps():
+    kraken_order_book = {'bids': [[23400.0, 0.5, 1702375200], [23399.0, 1.0, 1702375190]], 'asks': [[23401.0, 0.2, 1702375201]], 'timestamp': None}
+    orders = transform_ccxt_exchange_order_book(kraken_order_book, 'kraken', received_at=1702375201.5)
+    assert orders == [(23400.0, 0.5, 'Bid', 'kraken'), (23399.0, 1.0, 'Bid', 'kraken'), (23401.0, 0.2, 'Ask', 'kraken')]
+    assert orders.received_at == 1702375201.5
+    # The latest level timestamp of Kraken is the time of the book
+    assert orders.exchange_timestamp == 1702375201
+
+    # Other exchanges only have a book timestamp, in milliseconds, and may have no level timestamps
+    bitstamp_order_book = {'bids': [[23400.0, 0.5]], 'asks': [[23401.0, 0.2]], 'timestamp': 1702375200250}
+    orders = transform_ccxt_exchange_order_book(bitstamp_order_book, 'bitstamp')
+    assert orders == [(23400.0, 0.5, 'Bid', 'bitstamp'), (23401.0, 0.2, 'Ask', 'bitstamp')]
+    assert orders.exchange_timestamp == 1702375200.25
+    assert orders.received_at is None
+
+
+def test__transform_coinmetro_order_book__received_at():
+    orders = transform_coinmetro_order_book({'bid': {'23400.0': 0.5}, 'ask': {'23401.0': 0.2}}, received_at=1702375200.0)
+    assert orders == [(23400.0, 0.5, 'Bid', 'coinmetro'), (23401.0, 0.2, 'Ask', 'coinmetro')]
+    assert orders.received_at == 1702375200.0
+    assert orders.exchange_timestamp is None
+
+
+def assert_same_levels(book, orders):
+    expected = OrderBook.from_orders(orders)
+    np.testing.assert_array_equal(book.price, expected.price)
+    np.testing.assert_array_equal(book.quantity, expected.quantity)
+    np.testing.assert_array_equal(book.side, expected.side)
+    assert book.exchange_names().tolist() == expected.exchange_names().tolist()
+    assert (book.received_at, book.exchange_timestamp) == (orders.received_at, orders.exchange_timestamp)
+
+
+def test__order_book_arrays__same_levels_as_order_lists():
+    coinmetro_order_book = {'bid': {'23400.5': 0.5, '23399': 1.25}, 'ask': {'23401.25': 0.2}}
+    assert_same_levels(coinmetro_order_book_arrays(coinmetro_order_book, 1702375200.0), transform_coinmetro_order_book(coinmetro_order_book, 1702375200.0))
+
+    kraken_order_book = {'bids': [[23400.0, 0.5, 1702375200], [23399.0, 1.0, 1702375190]], 'asks': [[23401.0, 0.2, 1702375201]], 'timestamp': None}
+    assert_same_levels(ccxt_order_book_arrays(kraken_order_book, 'kraken', 1702375202.0), transform_ccxt_exchange_order_book(kraken_order_book, 'kraken', 1702375202.0))
+
+    empty_book = ccxt_order_book_arrays({'bids': [], 'asks': []}, 'bitstamp')
+    assert empty_book.empty and empty_book.venues == ('bitstamp',)
@@ -0,0 +1,86 @@
+# test__day_state.py
+
+from datetime import datetime
+import pandas as pd
+import pytest
+from day_state import RollingDayState
+from filled_orders_ledger import FilledOrdersLedger
+from persistence import JournalWriter
+from pipeline import ArbitragePipeline
+from symbol_shards import SymbolShardCoordinator
+
+fee_table = {'coinmetro': (0.0, 0.0), 'kraken': (0.0, 0.0)}
+order_lists = [[(100.0, 1.0, 'Ask', 'coinmetro')], [(105.0, 1.0, 'Bid', 'kraken')]]
+
+
+class FakeClock:
+    def __init__(self, moment):
+        self.now = moment.timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def test__rolls_over_at_midnight(tmp_path):
+    clock = FakeClock(datetime(2024, 5, 1, 23, 59, 50))
+    day_state = RollingDayState(tmp_path, clock=clock)
+    assert day_state.day == '2024-05-01'
+    assert day_state.journals[0].file_path.name == '2024-05-01 matched_orders.csv'
+
+    clock.now += 5
+    assert not day_state.due()
+    assert not day_state.roll()
+    clock.now += 10
+    assert day_state.roll()
+    assert day_state.day == '2024-05-02'
+    assert [journal.file_path.name for journal in day_state.journals] == ['2024-05-02 matched_orders.csv', '2024-05-02 trades.csv', '2024-05-02 venue_deltas.csv']
+    # The next rollover is the following midnight
+    clock.now += 3600
+    assert not day_state.roll()
+    assert day_state.metrics() == {'day': '2024-05-02', 'rollovers': 1}
+
+
+def test__rollover_evicts_the_ledger(tmp_path):
+    clock = FakeClock(datetime(2024, 5, 1, 23, 0))
+    ledger = FilledOrdersLedger(max_age=1800, clock=clock)
+    ledger.record([{'Exchange': 'Kraken', 'Ask/Bid': 'Ask', 'Price': 100.0, 'Quantity': 1.0, 'Remaining Quantity': 0.5}])
+    day_state = RollingDayState(tmp_path, filled_orders_ledger=ledger, clock=clock)
+
+    clock.now += 3600
+    assert day_state.roll()
+    assert day_state.metrics() == {'day': '2024-05-02', 'rollovers': 1, 'ledger_orders': 0, 'ledger_evicted': 1}
+
+
+@pytest.mark.asyncio
+async def test__pipeline__writes_to_the_journals_of_the_new_day(tmp_path):
+    clock = FakeClock(datetime(2024, 5, 1, 23, 59))
+    writer = JournalWriter(flush_interval=60).start()
+    day_state = RollingDayState(tmp_path, export_to_excel=True, clock=clock)
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), writer, verbose=False, day_state=day_state)
+
+    await pipeline.process(order_lists)
+    first_day = pipeline.trades
+    clock.now += 120
+    await pipeline.process(order_lists)
+    await day_state.close()
+
+    # The rows of the day that ended are written before it is exported, the new day only gets the new rows
+    assert first_day.file_path.name == '2024-05-01 trades.csv'
+    assert len(pd.read_excel(first_day.file_path.with_suffix('.xlsx'))) == 1
+    assert pipeline.trades.file_path.name == '2024-05-02 trades.csv'
+    await writer.close()
+    assert len(first_day.read()) == 1
+    assert len(pipeline.trades.read()) == 1
+    assert pipeline.metrics()['day_state'] == {'day': '2024-05-02', 'rollovers': 1}
+
+
+@pytest.mark.asyncio
+async def test__symbol_shards__journals_roll_over(tmp_path):
+    coordinator = SymbolShardCoordinator(['ETH/EUR'], ['kraken'], fee_table, 0, 1, path=tmp_path, verbose=False)
+    clock = FakeClock(datetime(2024, 5, 1, 23, 59))
+    coordinator.day_states['ETH/EUR'] = day_state = RollingDayState(tmp_path, 'ETH/EUR', clock=clock)
+
+    clock.now += 120
+    await coordinator.handle_result('ETH/EUR', [], 1.0, {})
+    assert coordinator.journals['ETH/EUR'] == day_state.journals
+    assert coordinator.all_journals()[0].file_path.name == '2024-05-02 ETH-EUR matched_orders.csv'
@@ -0,0 +1,95 @@
+# test__exchange_registry.py
+
+import types
+import pytest
+import exchange_registry
+from exchange_registry import ExchangeRegistry
+from data_fetch import fetch_ccxt_exchange_order_book
+from read_starting_info import fetch_taker_fee
+
+
+class FakeKraken:
+    instances = 0
+    failures = 0
+
+    def __init__(self, config):
+        FakeKraken.instances += 1
+        self.id = 'kraken'
+        self.rateLimit = 1000
+        self.config = config
+        self.markets = None
+        self.market_loads = []
+        self.closed = False
+
+    async def load_markets(self, reload=False):
+        self.market_loads.append(reload)
+        if FakeKraken.failures:
+            FakeKraken.failures -= 1
+            raise ConnectionError('Kraken is unreachable')
+        self.markets = {'BTC/EUR': {'taker': 0.0026, 'maker': 0.0016}}
+        return self.markets
+
+    async def fetch_order_book(self, symbol, limit):
+        return {'bids': [[23423.09, 1.2, 1702311080]], 'asks': [[23425.01, 0.058, 1702311076]]}
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_ccxt(monkeypatch):
+    FakeKraken.instances = 0
+    FakeKraken.failures = 0
+    monkeypatch.setattr(exchange_registry, 'ccxt_async', types.SimpleNamespace(kraken=FakeKraken))
+
+
+@pytest.mark.asyncio
+async def test__get__creates_exchange_once(fake_ccxt):
+    registry = ExchangeRegistry()
+    assert registry.get('kraken') is registry.get('Kraken')
+    assert FakeKraken.instances == 1
+    assert registry.get('kraken').config == {'enableRateLimit': True}
+
+
+@pytest.mark.asyncio
+async def test__load_markets__cached_until_ttl(fake_ccxt):
+    registry = ExchangeRegistry()
+    for _ in range(3):
+        await registry.fetch_order_book('kraken', 'BTC/EUR')
+    assert await registry.taker_fee('kraken', 'BTC/EUR') == 0.0026
+    assert registry.get('kraken').market_loads == [False]
+
+    registry.markets_ttl = 0
+    await registry.load_markets('kraken')
+    assert registry.get('kraken').market_loads == [False, True]
+
+
+@pytest.mark.asyncio
+async def test__fetch_ccxt_exchange_order_book__with_registry(fake_ccxt):
+    registry = ExchangeRegistry()
+    orders = await fetch_ccxt_exchange_order_book('kraken', 'BTC/EUR', registry=registry)
+    assert orders == [(23423.09, 1.2, 'Bid', 'kraken'), (23425.01, 0.058, 'Ask', 'kraken')]
+
+    kraken = registry.get('kraken')
+    await registry.close()
+    assert kraken.closed
+    assert registry.exchanges == {}
+
+
+@pytest.mark.asyncio
+async def test__request_rate(fake_ccxt):
+    registry = ExchangeRegistry()
+    assert registry.request_rate('kraken') == 1.0
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test__fetch_taker_fee__retries_through_the_registry(fake_ccxt):
+    registry = ExchangeRegistry()
+    FakeKraken.failures = 2
+    assert await fetch_taker_fee(registry, 'kraken', 'BTC/EUR', attempts=3, retry_delay=0) == pytest.approx(0.26)
+    assert FakeKraken.instances == 1
+
+    FakeKraken.failures = 1
+    registry.markets_ttl = 0
+    assert await fetch_taker_fee(registry, 'kraken', 'BTC/EUR', retry_delay=0) is None
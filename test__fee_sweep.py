@@ -0,0 +1,89 @@
+# test__fee_sweep.py
+
+import pytest
+from fee_sweep import read_recordings, fee_tables, sweep_fees, profit_surface, parse_fee_grid
+from replay import replay_batch
+from snapshot_recorder import SnapshotRecorder
+from test__venue_books import random_order_lists
+
+fee_grid = {'coinmetro': [0.0, 0.001], 'kraken': [0.0016, 0.0024], 'bitstamp': [0.004]}
+
+
+def record(file_path, snapshots):
+    with SnapshotRecorder(file_path) as recorder:
+        for order_lists in snapshots:
+            recorder.record(order_lists)
+    return file_path
+
+
+def test__read_recordings__shared_exchange_codes(tmp_path):
+    first = record(tmp_path / 'first.bin', [[[(100.0, 1.0, 'Bid', 'kraken')], [(101.0, 2.0, 'Ask', 'coinmetro')]]])
+    second = record(tmp_path / 'second.bin', [[[(102.0, 1.0, 'Ask', 'coinmetro')]], [], [[(99.0, 3.0, 'Bid', 'kraken')]]])
+
+    levels, snapshot_count, venues = read_recordings([first, second])
+
+    assert snapshot_count == 4
+    assert venues == ['kraken', 'coinmetro']
+    assert levels['snapshot'].tolist() == [0, 0, 1, 3]
+    assert [venues[venue] for venue in levels['venue']] == ['kraken', 'coinmetro', 'coinmetro', 'kraken']
+    assert levels['price'].tolist() == [100.0, 101.0, 102.0, 99.0]
+
+
+def test__fee_tables():
+    assert fee_tables({'coinmetro': [0.0, 0.001], 'kraken': [0.0024]}) == [
+        {'coinmetro': (0.0, 0.0), 'kraken': (0.0024, 0.0024)},
+        {'coinmetro': (0.001, 0.001), 'kraken': (0.0024, 0.0024)},
+    ]
+
+
+def test__parse_fee_grid():
+    assert parse_fee_grid(['kraken=0.16,0.24', 'coinmetro=0']) == {'kraken': [0.0016, 0.0024], 'coinmetro': [0.0]}
+    with pytest.raises(ValueError):
+        parse_fee_grid(['kraken'])
+
+
+def test__sweep_fees__same_as_replay_batch(tmp_path):
+    venues = ('coinmetro', 'kraken', 'bitstamp')
+    file_path = record(tmp_path / 'snapshots.bin', [random_order_lists(seed, venues=venues) for seed in range(10)])
+
+    results = sweep_fees([file_path], fee_grid, workers=0)
+
+    assert len(results) == 4
+    for fee_table, row in zip(fee_tables(fee_grid), results.to_dict('records')):
+        assert row['Exchanges'] == 'coinmetro+kraken+bitstamp'
+        assert row['Snapshots'] == 10
+        assert row['Total Profit'] == pytest.approx(replay_batch(file_path, fee_table)['total_profit'])
+    # Lower fees never earn less
+    surface = profit_surface(results, 'coinmetro', 'kraken')
+    assert (surface.diff(axis=1).dropna(axis=1) <= 1e-9).all().all()
+    assert (surface.diff().dropna() <= 1e-9).all().all()
+
+
+def test__sweep_fees__exchange_sets(tmp_path):
+    venues = ('coinmetro', 'kraken', 'bitstamp')
+    snapshots = [random_order_lists(seed, venues=venues) for seed in range(10)]
+    file_path = record(tmp_path / 'snapshots.bin', snapshots)
+    pair_path = record(tmp_path / 'pair.bin', [order_lists[:2] for order_lists in snapshots])
+
+    results = sweep_fees([file_path], fee_grid, venue_sets=[['kraken'], ['coinmetro', 'kraken']], workers=0)
+
+    # One exchange cannot be matched with itself, the pair matches like a recording of only the pair
+    assert results.loc[results['Exchanges'] == 'kraken', 'Total Profit'].tolist() == [0.0] * 2
+    pair = results[results['Exchanges'] == 'coinmetro+kraken']
+    expected = sweep_fees([pair_path], {exchange: fees for exchange, fees in fee_grid.items() if exchange != 'bitstamp'}, workers=0)
+    assert pair['Total Profit'].tolist() == pytest.approx(expected['Total Profit'].tolist())
+
+
+def test__sweep_fees__worker_processes(tmp_path):
+    file_path = record(tmp_path / 'snapshots.bin', [random_order_lists(seed, venues=('coinmetro', 'kraken', 'bitstamp')) for seed in range(10)])
+
+    results = sweep_fees([file_path], fee_grid, workers=2)
+
+    assert results.equals(sweep_fees([file_path], fee_grid, workers=0))
+    assert results['Matches'].max() > 0
+
+
+def test__sweep_fees__missing_fees(tmp_path):
+    file_path = record(tmp_path / 'snapshots.bin', [random_order_lists(0, venues=('coinmetro', 'kraken'))])
+    with pytest.raises(ValueError):
+        sweep_fees([file_path], {'coinmetro': [0.001]}, workers=0)
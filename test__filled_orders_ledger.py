@@ -0,0 +1,121 @@
+# test__filled_orders_ledger.py
+
+import numpy as np
+import pandas as pd
+from filled_orders_ledger import FilledOrdersLedger
+from order_book import OrderBook
+from orderbook_preparation import update_filled_orders
+
+matched_orders_today = pd.DataFrame({
+    'Price': [23426.12, 23426.12, 23433.49, 23436.32],
+    'Quantity': [2.926, 2.926, 1.926, 0.005],
+    'Ask/Bid': ['Ask', 'Ask', 'Ask', 'Bid'],
+    'Exchange': ['Kraken', 'Kraken', 'Kraken', 'Coinmetro'],
+    'Remaining Quantity': [2.5, 2.0, 0.0, 0.002],
+})
+
+orders = [
+    (23426.12, 2.926, 'Ask', 'Kraken'),
+    (23433.49, 1.926, 'Ask', 'Kraken'),
+    (23436.32, 0.005, 'Bid', 'Coinmetro'),
+    (23436.32, 0.005, 'Ask', 'Coinmetro'),
+]
+
+
+def test__from_dataframe__keeps_minimum_and_skips_filled_orders():
+    ledger = FilledOrdersLedger.from_dataframe(matched_orders_today)
+    assert ledger.min_remaining == {
+        ('Kraken', 'Ask', 23426.12, 2.926): 2.0,
+        ('Coinmetro', 'Bid', 23436.32, 0.005): 0.002,
+    }
+
+
+def test__record__matched_trades():
+    ledger = FilledOrdersLedger()
+    ledger.record([
+        {'Exchange': 'Kraken', 'Ask/Bid': 'Ask', 'Price': 100.0, 'Quantity': 1.0, 'Remaining Quantity': 0.5},
+        {'Exchange': 'Kraken', 'Ask/Bid': 'Ask', 'Price': 100.0, 'Quantity': 1.0, 'Remaining Quantity': 0.75},
+    ])
+    assert ledger.min_remaining == {('Kraken', 'Ask', 100.0, 1.0): 0.5}
+
+
+def test__remaining_quantities():
+    ledger = FilledOrdersLedger.from_dataframe(matched_orders_today)
+    result = ledger.remaining_quantities(['Kraken', 'Kraken', 'Coinmetro'], ['Ask', 'Ask', 'Ask'], np.array([23426.12, 23433.49, 23436.32]), np.array([2.926, 1.926, 0.005]))
+    assert result.tolist() == [2.0, np.inf, np.inf]
+
+
+def test__update_filled_orders__ledger_same_as_dataframe():
+    ledger = FilledOrdersLedger.from_dataframe(matched_orders_today)
+
+    book = update_filled_orders(OrderBook.from_orders(orders), ledger)
+    assert book.remaining.tolist() == [2.0, 1.926, 0.002, 0.005]
+
+    book = update_filled_orders(OrderBook.from_orders(orders), matched_orders_today)
+    assert book.remaining.tolist() == [2.0, 1.926, 0.002, 0.005]
+
+    book = update_filled_orders(OrderBook.from_orders(orders).to_dataframe(), ledger)
+    assert book['Remaining Quantity'].tolist() == [2.0, 1.926, 0.002, 0.005]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def matched_order(price, remaining_quantity, quantity=1.0):
+    return {'Exchange': 'Kraken', 'Ask/Bid': 'Ask', 'Price': price, 'Quantity': quantity, 'Remaining Quantity': remaining_quantity}
+
+
+def test__record__fully_filled_order_is_dropped():
+    ledger = FilledOrdersLedger()
+    ledger.record([matched_order(100.0, 0.5), matched_order(101.0, 0.0)])
+    ledger.record([matched_order(100.0, 0.0)])
+    assert len(ledger) == 0
+    assert ledger.remaining_quantities(['Kraken'], ['Ask'], np.array([100.0]), np.array([1.0])).tolist() == [np.inf]
+
+
+def test__evict__orders_not_seen_for_max_age():
+    clock = FakeClock()
+    ledger = FilledOrdersLedger(max_age=60, clock=clock)
+    ledger.record([matched_order(100.0, 0.5), matched_order(101.0, 0.5)])
+
+    # The order at 100 is still in the books, the order at 101 is gone
+    clock.now += 50
+    ledger.remaining_quantities(['Kraken'], ['Ask'], np.array([100.0]), np.array([1.0]))
+    clock.now += 20
+    assert ledger.evict() == 1
+    assert list(ledger.min_remaining) == [('Kraken', 'Ask', 100.0, 1.0)]
+    assert ledger.evicted == 1
+
+
+def test__record__evicts_when_due():
+    clock = FakeClock()
+    ledger = FilledOrdersLedger(max_age=60, clock=clock)
+    ledger.record([matched_order(100.0, 0.5)])
+    clock.now += 61
+    ledger.record([matched_order(101.0, 0.5)])
+    assert list(ledger.min_remaining) == [('Kraken', 'Ask', 101.0, 1.0)]
+
+
+def test__record__keeps_at_most_max_orders():
+    clock = FakeClock()
+    ledger = FilledOrdersLedger(max_orders=100, clock=clock)
+    for price in range(1000):
+        clock.now += 1
+        ledger.record([matched_order(float(price), 0.5)])
+        assert len(ledger) <= 100
+    # The orders seen last are kept
+    assert ('Kraken', 'Ask', 999.0, 1.0) in ledger.min_remaining
+    assert ledger.evicted == 1000 - len(ledger)
+    assert set(ledger.last_seen) == set(ledger.min_remaining)
+
+
+def test__limits_do_not_change_lookups():
+    limited = FilledOrdersLedger.from_dataframe(matched_orders_today, max_age=3600, max_orders=1000)
+    book = update_filled_orders(OrderBook.from_orders(orders), limited)
+    assert book.remaining.tolist() == [2.0, 1.926, 0.002, 0.005]
+    assert limited.min_remaining == FilledOrdersLedger.from_dataframe(matched_orders_today).min_remaining
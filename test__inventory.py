@@ -0,0 +1,104 @@
+# test__inventory.py
+
+import numpy as np
+import pytest
+from filled_orders_ledger import FilledOrdersLedger
+from inventory import Inventory
+from matching_engine import match_orders_by_venue
+from order_book import OrderBook
+from pipeline import ArbitragePipeline
+from test__matching_engine import random_book, without_timestamps
+
+
+def crossing_book(orders):
+    # Net prices equal to the prices, sorted like a combined book
+    book = OrderBook.from_orders(orders)
+    book.net_price[:] = book.price
+    return book.sort_by_net_price()
+
+
+def test__balances():
+    inventory = Inventory({'Kraken': (1.0, 1000.0)})
+    inventory.apply({'kraken': (-0.5, 600.0), 'Coinmetro': (0.5, -400.0)})
+
+    assert inventory.balance('KRAKEN') == (0.5, 1600.0)
+    assert inventory.balance('coinmetro') == (0.5, -400.0)
+    assert inventory.balance('bitstamp') == (0.0, 0.0)
+    assert inventory.balance_lists(['coinmetro', 'bitstamp', 'Kraken']) == ([0.5, 0.0, 0.5], [-400.0, 0.0, 1600.0])
+
+
+def test__btc_on_the_bid_exchange_limits_the_fill():
+    book = crossing_book([(100.0, 2.0, 'Ask', 'coinmetro'), (105.0, 2.0, 'Bid', 'kraken')])
+    inventory = Inventory({'coinmetro': (0.0, 1000.0), 'kraken': (0.3, 0.0)})
+
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book, inventory)
+
+    assert [trade['Matched Quantity'] for trade in matched_trades] == [0.3, 0.3]
+    assert matching_profit == pytest.approx(0.3 * 5.0)
+    assert venue_deltas == {'kraken': (-0.3, pytest.approx(31.5)), 'coinmetro': (0.3, pytest.approx(-30.0))}
+    # The matcher leaves the inventory to the caller
+    assert inventory.balance('kraken') == (0.3, 0.0)
+
+
+def test__eur_on_the_ask_exchange_limits_the_fill():
+    book = crossing_book([(100.0, 2.0, 'Ask', 'coinmetro'), (105.0, 2.0, 'Bid', 'kraken')])
+    inventory = Inventory({'coinmetro': (0.0, 50.0), 'kraken': (5.0, 0.0)})
+
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book, inventory)
+    inventory.apply(venue_deltas)
+
+    assert [trade['Matched Quantity'] for trade in matched_trades] == [0.5, 0.5]
+    assert [trade['Remaining Quantity'] for trade in matched_trades] == [1.5, 1.5]
+    assert inventory.balance('coinmetro') == (0.5, 0.0)
+
+
+def test__exchanges_without_balance_are_passed_over():
+    # Kraken has the best bid but no BTC, the Bitstamp bid is matched instead
+    book = crossing_book([(100.0, 1.0, 'Ask', 'coinmetro'), (107.0, 1.0, 'Bid', 'kraken'), (104.0, 1.0, 'Bid', 'bitstamp')])
+    inventory = Inventory({'coinmetro': (0.0, 1000.0), 'bitstamp': (2.0, 0.0)})
+
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book, inventory)
+
+    assert [(trade['Exchange'], trade['Matched Quantity']) for trade in matched_trades] == [('coinmetro', 1.0), ('bitstamp', 1.0)]
+    assert 'kraken' not in venue_deltas
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test__large_balances_match_like_no_balances(seed):
+    book = random_book(seed)
+    inventory = Inventory({'Kraken': (1e9, 1e15), 'Coinmetro': (1e9, 1e15)})
+
+    assert without_timestamps(match_orders_by_venue(book.copy(), inventory)[0]) == without_timestamps(match_orders_by_venue(book.copy())[0])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test__balances_never_go_negative(seed):
+    rng = np.random.default_rng(seed)
+    book = random_book(seed)
+    inventory = Inventory({exchange: (rng.uniform(0, 3), rng.uniform(0, 50000)) for exchange in ['Kraken', 'Coinmetro']})
+
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book, inventory)
+    inventory.apply(venue_deltas)
+
+    assert all(base_balance >= -1e-9 and quote_balance >= -1e-6 for base_balance, quote_balance in inventory.balances().values())
+    assert all(trade['Matched Quantity'] > 0 for trade in matched_trades)
+    # BTC only moves between the exchanges and every fill crosses
+    assert sum(base_quantity for base_quantity, quote_quantity in venue_deltas.values()) == pytest.approx(0.0, abs=1e-9)
+    assert matching_profit >= 0
+
+
+def test__pipeline__balances_carry_over_cycles():
+    fee_table = {'coinmetro': (0.0, 0.0), 'kraken': (0.0, 0.0)}
+    inventory = Inventory({'coinmetro': (0.0, 1000.0), 'kraken': (1.0, 0.0)})
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, inventory=inventory)
+
+    # The first cycle sells 0.6 BTC on Kraken, the second can only sell the 0.4 BTC left
+    pipeline.match([[(100.0, 0.6, 'Ask', 'coinmetro')], [(105.0, 2.0, 'Bid', 'kraken')]])
+    matched_trades, matching_profit, venue_deltas = pipeline.match([[(101.0, 2.0, 'Ask', 'coinmetro')], [(106.0, 2.0, 'Bid', 'kraken')]])
+
+    assert matched_trades[0]['Matched Quantity'] == pytest.approx(0.4)
+    assert inventory.balance('kraken') == (pytest.approx(0.0), pytest.approx(0.6 * 105.0 + 0.4 * 106.0))
+    assert inventory.balance('coinmetro') == (pytest.approx(1.0), pytest.approx(1000.0 - 0.6 * 100.0 - 0.4 * 101.0))
+    assert pipeline.metrics()['inventory'] == inventory.balances()
+    # Nothing is left to sell on Kraken
+    assert pipeline.match([[(101.0, 2.0, 'Ask', 'coinmetro')], [(106.0, 2.0, 'Bid', 'kraken')]])[0] == []
@@ -0,0 +1,124 @@
+# test__latency.py
+
+import asyncio
+import json
+
+import pytest
+from filled_orders_ledger import FilledOrdersLedger
+from latency import LatencyTracker, RollingHistogram
+from pipeline import ArbitragePipeline
+from test__venue_books import random_order_lists, fee_table
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test__rolling_histogram():
+    histogram = RollingHistogram(window=100)
+    for value in range(1, 201):
+        histogram.record(value / 1000)
+
+    # The quantiles only see the latest 100 values, the count and sum see all of them
+    p50, p99 = histogram.quantiles()
+    assert p50 == pytest.approx(0.1505)
+    assert p99 == pytest.approx(0.19901)
+    assert histogram.count == 200
+    assert histogram.total == pytest.approx(20.1)
+    assert histogram.summary() == {'count': 200, 'p50_ms': 150.5, 'p99_ms': 199.01, 'max_ms': 200.0}
+
+
+def test__spans():
+    clock = FakeClock()
+    latency = LatencyTracker(clock=clock)
+    for duration in (0.001, 0.002, 0.003):
+        with latency.span('matching'):
+            clock.now += duration
+
+    assert latency.metrics()['stages']['matching'] == {'count': 3, 'p50_ms': 2.0, 'p99_ms': 2.98, 'max_ms': 3.0}
+
+
+def test__disabled_tracker_records_nothing():
+    latency = LatencyTracker(enabled=False)
+    with latency.span('matching'):
+        pass
+    latency.record('fees', 1.0)
+    latency.mark_received('kraken')
+    latency.record_book_ages()
+    assert asyncio.run(latency.fetch('kraken', asyncio.sleep(0, result='book'))) == 'book'
+    assert latency.metrics() == {'stages': {}, 'fetch': {}, 'book_age': {}}
+
+
+def test__fetch_latency_and_book_age():
+    clock = FakeClock()
+    latency = LatencyTracker(clock=clock)
+
+    async def fetch(result, seconds):
+        clock.now += seconds
+        return result
+
+    asyncio.run(latency.fetch('kraken', fetch('book', 0.25)))
+    asyncio.run(latency.fetch('coinmetro', fetch(None, 0.5)))
+    clock.now += 1.0
+    latency.mark_received('bitstamp')
+    clock.now += 0.5
+    latency.record_book_ages()
+
+    metrics = latency.metrics()
+    assert metrics['fetch']['kraken']['p50_ms'] == 250.0
+    assert metrics['fetch']['coinmetro']['p50_ms'] == 500.0
+    # A failed fetch has no book to age
+    assert metrics['book_age'] == {'kraken': {'count': 1, 'p50_ms': 2000.0, 'p99_ms': 2000.0, 'max_ms': 2000.0},
+                                   'bitstamp': {'count': 1, 'p50_ms': 500.0, 'p99_ms': 500.0, 'max_ms': 500.0}}
+
+
+def test__prometheus_text_and_log_line():
+    latency = LatencyTracker()
+    latency.record('fees', 0.002)
+    latency.record('fees', 0.004)
+
+    text = latency.prometheus_text()
+    assert '# TYPE arbitrage_stage_seconds summary' in text
+    assert 'arbitrage_stage_seconds{stage="fees",quantile="0.5"} 0.003' in text
+    assert 'arbitrage_stage_seconds_count{stage="fees"} 2' in text
+    assert 'arbitrage_stage_seconds_sum{stage="fees"} 0.006' in text
+
+    line = json.loads(latency.log_line())
+    assert line['latency']['stages']['fees']['count'] == 2
+
+
+@pytest.mark.asyncio
+async def test__serve():
+    latency = LatencyTracker()
+    latency.record('matching', 0.001)
+    server = await latency.serve(0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = (await reader.read()).decode('utf-8')
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert 'arbitrage_stage_seconds_count{stage="matching"} 1' in response
+
+
+@pytest.mark.asyncio
+async def test__pipeline_stages():
+    latency = LatencyTracker()
+    latency.mark_received('kraken')
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, latency=latency)
+    for seed in range(5):
+        await pipeline.process(random_order_lists(seed))
+
+    stages = latency.metrics()['stages']
+    assert stages['precheck']['count'] == 5
+    assert set(stages) == {'precheck', 'fees', 'cleaning', 'ledger', 'matching'}
+    assert latency.metrics()['book_age']['kraken']['count'] == 5
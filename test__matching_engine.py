@@ -0,0 +1,149 @@
+# test__matching_engine.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from matching_engine import match_orders, match_orders_by_venue, match_orders_iterrows, sweep_sorted_sides
+from order_book import OrderBook
+
+
+def random_book(seed, levels=15):
+    # Bids and asks are drawn from overlapping price ranges so that the books cross
+    rng = np.random.default_rng(seed)
+    rows = []
+    for exchange in ['Kraken', 'Coinmetro']:
+        for side in ['Ask', 'Bid']:
+            low = 23380 if side == 'Ask' else 23420
+            prices = np.round(rng.uniform(low, low + 120, levels), 2)
+            quantities = np.round(rng.uniform(0.001, 2.0, levels), 8)
+            rows += [(price, quantity, side, exchange) for price, quantity in zip(prices, quantities)]
+    book = pd.DataFrame(rows, columns=['Price', 'Quantity', 'Ask/Bid', 'Exchange'])
+    book['Fee'] = np.where(book['Exchange'] == 'Kraken', 0.0024, 0.001) * book['Price']
+    book['Net Price'] = np.where(book['Ask/Bid'] == 'Bid', book['Price'] - book['Fee'], book['Price'] + book['Fee'])
+    book = book.sort_values(by='Net Price').reset_index(drop=True)
+    book['Remaining Quantity'] = book['Quantity'].copy()
+    # Some orders are partially filled already
+    partially_filled = rng.random(len(book)) < 0.2
+    book.loc[partially_filled, 'Remaining Quantity'] = book.loc[partially_filled, 'Quantity'] / 2
+    return book
+
+
+def without_timestamps(matched_trades):
+    return [{key: value for key, value in trade.items() if key != 'Timestamp'} for trade in matched_trades]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test__match_orders__parity_with_iterrows(seed):
+    expected_book = random_book(seed)
+    test_book = random_book(seed)
+
+    expected = match_orders_iterrows(expected_book)
+    result = match_orders(test_book)
+
+    assert expected[0], "Random book should contain arbitrage opportunities"
+    assert without_timestamps(result[0]) == without_timestamps(expected[0])
+    assert result[1:] == expected[1:]
+    assert test_book['Remaining Quantity'].equals(expected_book['Remaining Quantity'])
+
+
+def test__match_orders__no_cross():
+    book = pd.DataFrame({
+        'Price': [100.0, 101.0],
+        'Quantity': [1.0, 1.0],
+        'Ask/Bid': ['Bid', 'Ask'],
+        'Exchange': ['Kraken', 'Coinmetro'],
+        'Fee': [0.0, 0.0],
+        'Net Price': [100.0, 101.0],
+        'Remaining Quantity': [1.0, 1.0]
+    })
+    assert match_orders(book) == ([], 0, 0, 0, 0, 0)
+
+
+def test__sweep_sorted_sides__updates_remaining_in_place():
+    ask_net_prices = np.array([100.0, 101.0])
+    ask_remaining = np.array([1.0, 1.0])
+    bid_net_prices = np.array([100.5, 102.0])
+    bid_remaining = np.array([0.5, 0.75])
+
+    fills = sweep_sorted_sides(ask_net_prices, ask_remaining, bid_net_prices, bid_remaining)
+
+    assert fills == [(0, 1, 0.75, 0.25, 0.0), (0, 0, 0.25, 0.0, 0.25)]
+    assert ask_remaining.tolist() == [0.0, 1.0]
+    assert bid_remaining.tolist() == [0.25, 0.0]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test__match_orders_by_venue__pairs(seed):
+    all_pairs = [(ask_exchange, bid_exchange) for ask_exchange in ['Kraken', 'Coinmetro'] for bid_exchange in ['Kraken', 'Coinmetro']]
+    assert without_timestamps(match_orders_by_venue(random_book(seed), pairs=all_pairs)[0]) == without_timestamps(match_orders_by_venue(random_book(seed))[0])
+    assert match_orders_by_venue(random_book(seed), pairs=[])[0] == []
+
+    # Only Coinmetro asks against Kraken bids, the same on a DataFrame and an OrderBook
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(random_book(seed), pairs=[('Coinmetro', 'Kraken')])
+    assert matched_trades
+    assert {(ask['Exchange'], bid['Exchange']) for ask, bid in zip(matched_trades[::2], matched_trades[1::2])} == {('Coinmetro', 'Kraken')}
+    assert all(ask['Net Price'] < bid['Net Price'] for ask, bid in zip(matched_trades[::2], matched_trades[1::2]))
+    book_trades = match_orders_by_venue(OrderBook.from_dataframe(random_book(seed)), pairs=[('Coinmetro', 'Kraken')])[0]
+    assert [trade['Matched Quantity'] for trade in book_trades] == pytest.approx([trade['Matched Quantity'] for trade in matched_trades])
+
+
+def scanning_sweep(ask_net, ask_rem, bid_net, bid_rem, ask_venue, bid_venue, venue_pairs):
+    # The paired sweep that scans the other side from the shared pointer for every level
+    fills = []
+    bid_pos = len(bid_net) - 1
+    for ask_pos in range(len(ask_net)):
+        if ask_rem[ask_pos] <= 0:
+            break
+        while bid_pos >= 0 and bid_rem[bid_pos] <= 0:
+            bid_pos -= 1
+        if bid_pos < 0 or bid_net[bid_pos] <= ask_net[ask_pos]:
+            break
+        fill_pos = bid_pos
+        while fill_pos >= 0 and (bid_rem[fill_pos] <= 0 or (ask_venue[ask_pos], bid_venue[fill_pos]) not in venue_pairs):
+            fill_pos -= 1
+        if fill_pos < 0 or bid_net[fill_pos] <= ask_net[ask_pos]:
+            continue
+        quantity = min(ask_rem[ask_pos], bid_rem[fill_pos])
+        ask_rem[ask_pos] -= quantity
+        bid_rem[fill_pos] -= quantity
+        fills.append((ask_pos, fill_pos, quantity, ask_rem[ask_pos], bid_rem[fill_pos]))
+        if ask_rem[ask_pos] == 0:
+            break
+    ask_pos = 0
+    for bid_pos in range(len(bid_net)):
+        if bid_rem[bid_pos] <= 0:
+            break
+        while ask_pos < len(ask_net) and ask_rem[ask_pos] <= 0:
+            ask_pos += 1
+        if ask_pos == len(ask_net):
+            break
+        if ask_net[ask_pos] >= bid_net[bid_pos]:
+            continue
+        fill_pos = ask_pos
+        while fill_pos < len(ask_net) and (ask_rem[fill_pos] <= 0 or (ask_venue[fill_pos], bid_venue[bid_pos]) not in venue_pairs):
+            fill_pos += 1
+        if fill_pos == len(ask_net) or ask_net[fill_pos] >= bid_net[bid_pos]:
+            continue
+        quantity = min(ask_rem[fill_pos], bid_rem[bid_pos])
+        ask_rem[fill_pos] -= quantity
+        bid_rem[bid_pos] -= quantity
+        fills.append((fill_pos, bid_pos, quantity, ask_rem[fill_pos], bid_rem[bid_pos]))
+        if bid_rem[bid_pos] == 0:
+            break
+    return fills
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test__sweep_sorted_sides__venue_pairs_same_as_scanning(seed):
+    rng = np.random.default_rng(seed)
+    asks, bids = rng.integers(1, 40, 2)
+    ask_net = np.sort(rng.uniform(100, 110, asks))
+    bid_net = np.sort(rng.uniform(102, 112, bids))
+    ask_remaining = rng.uniform(0.1, 2.0, asks)
+    bid_remaining = rng.uniform(0.1, 2.0, bids)
+    ask_venues = rng.integers(0, 4, asks)
+    bid_venues = rng.integers(0, 4, bids)
+    venue_pairs = {(ask_venue, bid_venue) for ask_venue in range(4) for bid_venue in range(4) if rng.random() < 0.4}
+
+    expected = scanning_sweep(ask_net.tolist(), ask_remaining.tolist(), bid_net.tolist(), bid_remaining.tolist(), ask_venues.tolist(), bid_venues.tolist(), venue_pairs)
+    assert sweep_sorted_sides(ask_net, ask_remaining, bid_net, bid_remaining, ask_venues, bid_venues, venue_pairs=venue_pairs) == expected
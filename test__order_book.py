@@ -0,0 +1,100 @@
+# test__order_book.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from order_book import OrderBook, ASK, BID
+from orderbook_preparation import combine_and_sort_order_book, calculate_fees, calculate_spread, clean_order_book, update_filled_orders
+from matching_engine import match_orders
+
+coinmetro_orders = [
+    (23428.00, 0.30639636, 'Bid', 'Coinmetro'),
+    (23434.99, 0.01001201, 'Bid', 'Coinmetro'),
+    (23437.12, 5.02312301, 'Bid', 'Coinmetro'),
+    (23437.20, 0.21239833, 'Ask', 'Coinmetro'),
+]
+
+kraken_orders = [
+    (23423.09, 1.200, 'Bid', 'Kraken'),
+    (23424.02, 0.005, 'Bid', 'Kraken'),
+    (23425.01, 0.058, 'Ask', 'Kraken'),
+    (23426.12, 2.926, 'Ask', 'Kraken'),
+    (23431.58, 0.005, 'Ask', 'Kraken'),
+    (23433.49, 1.926, 'Ask', 'Kraken'),
+    (23436.32, 0.005, 'Ask', 'Kraken'),
+]
+
+matched_orders_today = pd.DataFrame({
+    'Price': [23426.12, 23433.49, 23436.32],
+    'Quantity': [2.926, 1.926, 0.005],
+    'Ask/Bid': ['Ask', 'Ask', 'Bid'],
+    'Exchange': ['Kraken', 'Kraken', 'Coinmetro'],
+    'Remaining Quantity': [2.0, 1.0, 0.002],
+})
+
+
+def test__from_orders():
+    book = OrderBook.from_orders(coinmetro_orders, kraken_orders)
+    assert len(book) == 11
+    assert book.venues == ('Coinmetro', 'Kraken')
+    assert book.price.dtype == np.float64
+    assert book.side.tolist()[:4] == [BID, BID, BID, ASK]
+    assert book.venue.tolist()[3:5] == [0, 1]
+    assert book.remaining.tolist() == book.quantity.tolist()
+
+
+def test__from_orders__empty_input():
+    book = OrderBook.from_orders([], [])
+    assert book.empty
+    assert list(book.to_dataframe().columns) == ['Price', 'Quantity', 'Ask/Bid', 'Exchange', 'Fee', 'Net Price', 'Remaining Quantity']
+
+
+def test__view_shares_arrays():
+    book = OrderBook.from_orders(coinmetro_orders, kraken_orders)
+    window = book.view(2, 5)
+    window.remaining[0] = 0
+    assert book.remaining[2] == 0
+    assert np.shares_memory(window.price, book.price)
+
+
+def test__concatenate__maps_exchange_codes():
+    coinmetro = OrderBook.from_orders(coinmetro_orders)
+    kraken = OrderBook.from_orders(kraken_orders)
+    book = OrderBook.concatenate([kraken.view(0, 2), coinmetro, kraken.view(2, 3)])
+    assert book.venues == ('Kraken', 'Coinmetro')
+    assert book.exchange_names().tolist() == ['Kraken'] * 2 + ['Coinmetro'] * 4 + ['Kraken']
+    assert book.price.tolist() == [order[0] for order in kraken_orders[:2] + coinmetro_orders + kraken_orders[2:3]]
+    assert OrderBook.concatenate([]).empty
+
+
+@pytest.mark.parametrize("coinmetro_fee, kraken_fee", [(0, 0), (0.1 / 100, 0.24 / 100)])
+def test__calculate_fees__same_as_dataframe(coinmetro_fee, kraken_fee):
+    expected = calculate_fees(combine_and_sort_order_book(coinmetro_orders, kraken_orders), coinmetro_fee, kraken_fee)
+    result = calculate_fees(OrderBook.from_orders(coinmetro_orders, kraken_orders), coinmetro_fee, kraken_fee).to_dataframe()
+    pd.testing.assert_frame_equal(result.drop(columns=['Remaining Quantity']), expected)
+
+
+def test__calculate_spread__same_as_dataframe():
+    expected = calculate_spread(calculate_fees(combine_and_sort_order_book(coinmetro_orders, kraken_orders), 0.1 / 100, 0.24 / 100))
+    result = calculate_spread(calculate_fees(OrderBook.from_orders(coinmetro_orders, kraken_orders), 0.1 / 100, 0.24 / 100))
+    assert result == expected
+
+
+def test__clean_order_book__no_opportunities():
+    book = calculate_fees(OrderBook.from_orders(coinmetro_orders, kraken_orders), 0.1 / 100, 0.24 / 100)
+    assert clean_order_book(book).empty
+
+
+def test__pipeline__same_as_dataframe():
+    expected = calculate_fees(combine_and_sort_order_book(coinmetro_orders, kraken_orders), 0, 0)
+    expected = update_filled_orders(clean_order_book(expected), matched_orders_today)
+
+    book = calculate_fees(OrderBook.from_orders(coinmetro_orders, kraken_orders), 0, 0)
+    book = update_filled_orders(clean_order_book(book), matched_orders_today)
+    assert book.remaining.tolist() == expected['Remaining Quantity'].tolist()
+
+    expected_trades = match_orders(expected)
+    trades = match_orders(book)
+    assert [{**trade, 'Timestamp': None} for trade in trades[0]] == [{**trade, 'Timestamp': None} for trade in expected_trades[0]]
+    assert trades[1:] == expected_trades[1:]
+    pd.testing.assert_frame_equal(book.to_dataframe(), expected.reset_index(drop=True))
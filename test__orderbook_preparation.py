@@ -2,7 +2,7 @@
 
 import pytest
 import pandas as pd
-from orderbook_preparation import combine_and_sort_order_book, calculate_fees, calculate_spread, clean_order_book, update_filled_orders
+from orderbook_preparation import combine_and_sort_order_book, build_fee_table, calculate_fees, calculate_spread, clean_order_book, update_filled_orders
 
 coinmetro_bids = [
     ('23428.00', 0.30639636),
@@ -80,6 +80,29 @@ def test__calculate_fees__normal_fees():
     assert test_book.equals(book_with_fees)
 
 
+def test__calculate_fees__fee_table_same_as_fee_rates():
+    fee_table = build_fee_table(coinmetro_fee, kraken_fee)
+    assert calculate_fees(book.copy(), fee_table=fee_table).equals(calculate_fees(book.copy(), coinmetro_fee, kraken_fee))
+
+
+def test__calculate_fees__three_exchanges():
+    three_exchange_book = pd.DataFrame({
+        'Price': [100.0, 200.0, 300.0],
+        'Quantity': [1.0, 1.0, 1.0],
+        'Ask/Bid': ['Bid', 'Ask', 'Ask'],
+        'Exchange': ['kraken', 'Coinmetro', 'Binance']
+    })
+    fee_table = {'Kraken': (0.0016, 0.0026), 'Coinmetro': (0.001, 0.001), 'binance': (0.001, 0.002)}
+    test_book = calculate_fees(three_exchange_book, fee_table=fee_table)
+    assert test_book['Fee'].round(6).tolist() == [0.26, 0.2, 0.6]
+    assert test_book['Net Price'].round(6).tolist() == [99.74, 200.2, 300.6]
+
+
+def test__calculate_fees__unknown_exchange():
+    with pytest.raises(ValueError):
+        calculate_fees(book.copy(), fee_table={'Kraken': (0.0016, 0.0026)})
+
+
 def test__calculate_spread__normal():
     test_book = calculate_fees (book, coinmetro_fee, kraken_fee)
     highest_bid_net_price, lowest_ask_net_price, price_difference, spread_percentage = calculate_spread(test_book)
@@ -0,0 +1,87 @@
+# test__persistence.py
+
+import asyncio
+import pytest
+from persistence import JournalWriter
+from trade_journal import TradeJournal, TRADES_COLUMNS
+
+
+def trade_row(profit):
+    return ['2023-12-12 12:00:00', profit, 2.5, 1000.0, 2.0, 600.0]
+
+
+@pytest.mark.asyncio
+async def test__close_flushes_pending_rows(tmp_path):
+    journal = TradeJournal(tmp_path / 'trades.csv', TRADES_COLUMNS)
+    writer = JournalWriter(max_batch_rows=100, flush_interval=60).start()
+
+    await writer.submit(journal, [trade_row(100.0)])
+    await writer.submit(journal, [trade_row(200.0)])
+    await writer.submit(journal, [])
+    await writer.close()
+
+    assert journal.read()['Profit'].tolist() == [100.0, 200.0]
+    metrics = writer.metrics()
+    assert metrics['enqueued_rows'] == 2
+    assert metrics['written_rows'] == 2
+    assert metrics['flushes'] == 1
+
+
+@pytest.mark.asyncio
+async def test__flush_waits_for_queued_rows(tmp_path):
+    journal = TradeJournal(tmp_path / 'trades.csv', TRADES_COLUMNS)
+    writer = JournalWriter(max_batch_rows=100, flush_interval=60).start()
+
+    await writer.submit(journal, [trade_row(100.0)])
+    await writer.flush()
+    assert journal.read()['Profit'].tolist() == [100.0]
+    # Nothing pending, the flush returns right away
+    await asyncio.wait_for(writer.flush(), 1)
+    await writer.close()
+    assert writer.metrics()['flushes'] == 1
+
+
+@pytest.mark.asyncio
+async def test__flushes_on_batch_size(tmp_path):
+    journal = TradeJournal(tmp_path / 'trades.csv', TRADES_COLUMNS)
+    writer = JournalWriter(max_batch_rows=2, flush_interval=60).start()
+
+    await writer.submit(journal, [trade_row(100.0), trade_row(200.0)])
+    for _ in range(100):
+        if writer.metrics()['written_rows'] == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert journal.read()['Profit'].tolist() == [100.0, 200.0]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test__flushes_on_interval(tmp_path):
+    journal = TradeJournal(tmp_path / 'trades.csv', TRADES_COLUMNS)
+    writer = JournalWriter(max_batch_rows=100, flush_interval=0.05).start()
+
+    await writer.submit(journal, [trade_row(100.0)])
+    await asyncio.sleep(0.5)
+    assert writer.metrics()['written_rows'] == 1
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test__backpressure(tmp_path):
+    journal = TradeJournal(tmp_path / 'trades.csv', TRADES_COLUMNS)
+    writer = JournalWriter(max_batch_rows=100, flush_interval=60, max_queue_size=1)
+
+    # The writer is not started yet, so the second submit waits until it is
+    await writer.submit(journal, [trade_row(100.0)])
+    blocked_submit = asyncio.create_task(writer.submit(journal, [trade_row(200.0)]))
+    await asyncio.sleep(0.01)
+    assert not blocked_submit.done()
+
+    writer.start()
+    await blocked_submit
+    await writer.close()
+
+    metrics = writer.metrics()
+    assert metrics['blocked_submits'] == 1
+    assert metrics['max_queue_depth'] == 1
+    assert journal.read()['Profit'].tolist() == [100.0, 200.0]
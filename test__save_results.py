@@ -1,6 +1,7 @@
 import pytest
 import pandas as pd
-from save_results import update_and_save_filled_orders, create_and_save_daily_profit_entry
+from save_results import update_and_save_filled_orders, create_and_save_daily_profit_entry, append_filled_orders, append_daily_profit_entry, export_journals_to_excel, venue_delta_entries
+from trade_journal import matched_orders_journal, trades_journal, venue_deltas_journal
 
 @pytest.fixture
 def sample_matched_orders_today():
@@ -66,4 +67,38 @@ def test_create_and_save_daily_profit_entry(sample_trades_today, tmp_path):
 
     # Check if the file is saved
     file_path = tmp_path / (pd.Timestamp.now().strftime("%Y-%m-%d") + ' trades.xlsx')
-    assert file_path.is_file()
\ No newline at end of file
+    assert file_path.is_file()
+
+
+def test_append_filled_orders(tmp_path):
+    journal = matched_orders_journal(tmp_path)
+    matched_trades = [{'Timestamp': '2023-12-12 12:00:00', 'Price': 23425.01, 'Quantity': 0.058, 'Ask/Bid': 'Ask', 'Exchange': 'kraken',
+                       'Fee': 0.0, 'Net Price': 23425.01, 'Matched Quantity': 0.058, 'Remaining Quantity': 0.0}]
+
+    assert append_filled_orders(journal, matched_trades) == 1
+    assert append_filled_orders(journal, pd.DataFrame(matched_trades)) == 1
+    assert append_filled_orders(journal, []) == 0
+    assert journal.read().shape[0] == 2
+
+
+def test_append_daily_profit_entry(tmp_path):
+    journal = trades_journal(tmp_path)
+    append_daily_profit_entry(journal, 200, 2.5, 1000, 2.0, 600)
+    append_daily_profit_entry(journal, 100, -2.5, 1000, 2.0, -600)
+
+    saved_trades = journal.read()
+    assert saved_trades['Profit'].tolist() == [200, 100]
+
+    export_journals_to_excel(journal, matched_orders_journal(tmp_path))
+    assert (tmp_path / (pd.Timestamp.now().strftime("%Y-%m-%d") + ' trades.xlsx')).is_file()
+    assert not (tmp_path / (pd.Timestamp.now().strftime("%Y-%m-%d") + ' matched_orders.xlsx')).is_file()
+
+
+def test_venue_delta_entries(tmp_path):
+    journal = venue_deltas_journal(tmp_path)
+    entries = venue_delta_entries({'kraken': (0.5, -11700.0), 'bitstamp': (-0.5, 11750.0)})
+    assert [entry['Exchange'] for entry in entries] == ['kraken', 'bitstamp']
+    assert entries[1]['EUR'] == 11750.0
+
+    journal.append(entries)
+    assert journal.read()['BTC'].tolist() == [0.5, -0.5]
@@ -0,0 +1,108 @@
+# test__scheduler.py
+
+import asyncio
+import pytest
+from scheduler import TokenBucket, RateLimitedFeed
+from streaming import StreamingOrderBooks, ccxt_snapshot_message
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test__token_bucket__refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2.0, clock=clock)
+
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+    clock.now = 0.5
+    assert bucket.try_acquire()
+    # Tokens never exceed the capacity
+    clock.now = 100.0
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test__token_bucket__rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+@pytest.mark.asyncio
+async def test__token_bucket__acquire_waits():
+    bucket = TokenBucket(rate=50.0)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for _ in range(4):
+        await bucket.acquire()
+    # The first token is available at once, the next three take 1/50 s each
+    assert loop.time() - started >= 0.05
+    assert bucket.throttled_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test__rate_limited_feed__counts_snapshots_and_errors():
+    results = [None, {'bids': [[100.0, 1.0, 0]], 'asks': [[101.0, 1.0, 0]]}]
+
+    async def fetch_snapshot():
+        if not results:
+            raise RuntimeError('connection reset')
+        return ccxt_snapshot_message(results.pop(0))
+
+    feed = RateLimitedFeed('kraken', fetch_snapshot, TokenBucket(rate=1000.0))
+    messages = feed.messages()
+    snapshot = await messages.__anext__()
+    assert snapshot == {'type': 'snapshot', 'sequence': None, 'timestamp': None, 'bids': [[100.0, 1.0]], 'asks': [[101.0, 1.0]]}
+
+    # The error is printed and counted, the next fetch waits for a full token
+    next_snapshot = asyncio.create_task(messages.__anext__())
+    await asyncio.sleep(0.05)
+    next_snapshot.cancel()
+    metrics = feed.metrics()
+    assert metrics['snapshots'] == 1
+    assert metrics['errors'] >= 2
+    assert metrics['snapshots_per_second'] > 0
+
+
+@pytest.mark.asyncio
+async def test__scheduled_fetch_runs_while_matching():
+    events = []
+    fetches = {'kraken': 0, 'coinmetro': 0}
+
+    def fetcher(exchange, price):
+        async def fetch_snapshot():
+            fetches[exchange] += 1
+            if fetches[exchange] > 3:
+                # Stop the scheduler
+                raise asyncio.CancelledError
+            events.append(('fetch', exchange))
+            await asyncio.sleep(0.01)
+            return {'type': 'snapshot', 'sequence': None, 'bids': [[price + fetches[exchange], 1.0]], 'asks': [[price + 10, 1.0]]}
+        return fetch_snapshot
+
+    async def on_top_change(order_lists):
+        events.append(('match_start', None))
+        await asyncio.sleep(0.02)
+        events.append(('match_end', None))
+
+    feeds = [
+        RateLimitedFeed('kraken', fetcher('kraken', 100.0), TokenBucket(rate=1000.0)),
+        RateLimitedFeed('coinmetro', fetcher('coinmetro', 200.0), TokenBucket(rate=1000.0)),
+    ]
+    scheduled_books = StreamingOrderBooks(feeds, on_top_change)
+    with pytest.raises(asyncio.CancelledError):
+        await scheduled_books.run()
+
+    first_match = events.index(('match_start', None))
+    assert ('fetch', 'kraken') in events[first_match:events.index(('match_end', None))]
+    metrics = scheduled_books.metrics()
+    assert metrics['venues']['kraken']['snapshots'] == 3
+    assert metrics['venues']['coinmetro']['snapshots'] == 3
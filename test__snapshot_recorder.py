@@ -0,0 +1,81 @@
+# test__snapshot_recorder.py
+
+import pytest
+from filled_orders_ledger import FilledOrdersLedger
+from pipeline import ArbitragePipeline
+from replay import replay
+from order_book import OrderBook
+from snapshot_recorder import SnapshotRecorder, read_snapshots, read_snapshot_levels, LEVEL_DTYPE
+from test__venue_books import random_order_lists, fee_table
+
+
+def test__round_trip(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    snapshots = [random_order_lists(seed, levels=5) for seed in range(3)]
+    with SnapshotRecorder(file_path) as recorder:
+        for timestamp, order_lists in enumerate(snapshots):
+            recorder.record(order_lists + [None], timestamp=1700000000.0 + timestamp)
+
+    assert list(read_snapshots(file_path)) == [(1700000000.0 + timestamp, order_lists) for timestamp, order_lists in enumerate(snapshots)]
+    # Every level takes one packed item of the file
+    assert file_path.stat().st_size == 8 + 3 * (13 + 50 * LEVEL_DTYPE.itemsize) + sum(5 + len(exchange) for exchange in ['coinmetro', 'kraken', 'bitstamp', 'bitvavo', 'binance'])
+
+
+def test__append_keeps_exchange_codes(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    with SnapshotRecorder(file_path) as recorder:
+        recorder.record([[(100.0, 1.0, 'Bid', 'kraken')]], timestamp=1.0)
+    with SnapshotRecorder(file_path) as recorder:
+        assert recorder.venue_codes == {'kraken': 0}
+        recorder.record([[(101.0, 2.0, 'Ask', 'coinmetro')], [(100.5, 1.0, 'Bid', 'kraken')]], timestamp=2.0)
+
+    assert list(read_snapshots(file_path)) == [
+        (1.0, [[(100.0, 1.0, 'Bid', 'kraken')]]),
+        (2.0, [[(101.0, 2.0, 'Ask', 'coinmetro')], [(100.5, 1.0, 'Bid', 'kraken')]]),
+    ]
+    timestamp, levels, venues = list(read_snapshot_levels(file_path))[-1]
+    assert levels['venue'].tolist() == [1, 0]
+    assert venues == ['kraken', 'coinmetro']
+
+
+def test__invalid_files(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    with SnapshotRecorder(file_path) as recorder:
+        recorder.record(random_order_lists(0, levels=5))
+    data = file_path.read_bytes()
+
+    file_path.write_bytes(data[:-1])
+    with pytest.raises(ValueError, match="cut off"):
+        list(read_snapshots(file_path))
+
+    file_path.write_bytes(b'not a recording')
+    with pytest.raises(ValueError, match="not an order book recording"):
+        list(read_snapshots(file_path))
+
+
+def test__replay_same_results_as_pipeline(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    snapshots = [random_order_lists(seed) for seed in range(10)]
+    with SnapshotRecorder(file_path) as recorder:
+        for order_lists in snapshots:
+            recorder.record(order_lists)
+
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False)
+    matches = sum(1 for order_lists in snapshots if (result := pipeline.match(order_lists)) is not None and result[0])
+
+    results = replay(file_path, fee_table)
+    assert results['snapshots'] == 10
+    assert results['skipped'] == pipeline.skipped
+    assert results['matches'] == matches > 0
+    assert results['total_profit'] == pytest.approx(pipeline.total_profit)
+    assert results['snapshots_per_second'] > 0
+    assert set(results['venue_deltas']) <= set(fee_table)
+
+
+def test__record_order_books(tmp_path):
+    file_path = tmp_path / 'snapshots.bin'
+    order_lists = random_order_lists(4, levels=5)
+    with SnapshotRecorder(file_path) as recorder:
+        recorder.record([OrderBook.from_orders(orders) for orders in order_lists] + [None], timestamp=1.0)
+
+    assert list(read_snapshots(file_path)) == [(1.0, order_lists)]
@@ -0,0 +1,143 @@
+# test__staleness.py
+
+import pytest
+from filled_orders_ledger import FilledOrdersLedger
+from order_book import OrderList
+from pipeline import ArbitragePipeline
+from staleness import StalenessGuard
+from streaming import L2Book
+from venue_books import VenueBooks
+
+fee_table = {'coinmetro': (0.0, 0.0), 'kraken': (0.0, 0.0), 'bitstamp': (0.0, 0.0)}
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def crossing_order_lists(coinmetro_time, kraken_time, bitstamp_time=None):
+    # Coinmetro asks 100, Kraken bids 101 and Bitstamp bids 100.5
+    order_lists = [
+        OrderList([(99.0, 1.0, 'Bid', 'coinmetro'), (100.0, 1.0, 'Ask', 'coinmetro')], coinmetro_time),
+        OrderList([(101.0, 1.0, 'Bid', 'kraken'), (102.0, 1.0, 'Ask', 'kraken')], kraken_time),
+    ]
+    if bitstamp_time is not None:
+        order_lists.append(OrderList([(100.5, 1.0, 'Bid', 'bitstamp'), (103.0, 1.0, 'Ask', 'bitstamp')], bitstamp_time))
+    return order_lists
+
+
+def test__fresh_order_lists():
+    guard = StalenessGuard(max_age=1.0, clock=FakeClock(1000.0))
+    order_lists = crossing_order_lists(999.5, 998.0) + [[(100.0, 1.0, 'Bid', 'replayed')]]
+    fresh = guard.fresh_order_lists(order_lists)
+
+    # Books without a time are never rejected
+    assert [orders[0][3] for orders in fresh] == ['coinmetro', 'replayed']
+    assert guard.metrics()['stale_books'] == {'kraken': 1}
+
+
+def test__filter_pairs__skew():
+    guard = StalenessGuard(max_skew=0.2)
+    venue_books = VenueBooks(fee_table, verbose=False)
+    venue_books.load(crossing_order_lists(1000.0, 1000.5, 1000.1))
+
+    assert sorted(venue_books.crossing_pairs()) == [('coinmetro', 'bitstamp'), ('coinmetro', 'kraken')]
+    assert guard.filter_pairs(venue_books.crossing_pairs(), venue_books) == [('coinmetro', 'bitstamp')]
+    assert guard.metrics()['skewed_pairs'] == 1
+    assert guard.metrics()['max_skew'] == pytest.approx(0.5)
+
+
+def test__filter_pairs__discount():
+    # 1% per second of skew: Kraken crosses by 1%, Bitstamp by 0.5%, both are 0.6 seconds from Coinmetro
+    guard = StalenessGuard(skew_margin=0.01)
+    venue_books = VenueBooks(fee_table, verbose=False)
+    venue_books.load(crossing_order_lists(1000.0, 1000.6, 1000.6))
+
+    assert guard.filter_pairs(venue_books.crossing_pairs(), venue_books) == [('coinmetro', 'kraken')]
+    assert guard.metrics()['discounted_pairs'] == 1
+
+
+def test__filter_pairs__exchange_time():
+    venue_books = VenueBooks(fee_table, verbose=False)
+    order_lists = crossing_order_lists(1000.0, 1000.0)
+    order_lists[1].exchange_timestamp = 998.0
+    venue_books.load(order_lists)
+
+    assert StalenessGuard(max_skew=1.0).filter_pairs(venue_books.crossing_pairs(), venue_books) == [('coinmetro', 'kraken')]
+    assert StalenessGuard(max_skew=1.0, use_exchange_time=True).filter_pairs(venue_books.crossing_pairs(), venue_books) == []
+
+
+def test__pipeline_rejects_skewed_books():
+    guard = StalenessGuard(max_age=2.0, max_skew=0.25, clock=FakeClock(1001.0))
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, staleness_guard=guard)
+
+    assert pipeline.match(crossing_order_lists(1000.0, 1000.5)) is None
+    matched_trades, matching_profit, venue_deltas = pipeline.match(crossing_order_lists(1000.4, 1000.5))
+    assert matching_profit == pytest.approx(1.0)
+    # The Kraken book is too old, Coinmetro alone cannot be matched
+    assert pipeline.match(crossing_order_lists(1000.5, 998.5)) is None
+
+    assert pipeline.metrics()['staleness'] == {'stale_books': {'kraken': 1}, 'skewed_pairs': 1, 'discounted_pairs': 0, 'max_skew': 0.5}
+
+
+def test__pipeline__rejected_pair_is_not_traded_through_the_other_pairs():
+    # Kraken is 0.3 s behind Coinmetro and Bitstamp 0.3 s behind Kraken, so only Coinmetro and Bitstamp are too far apart
+    order_lists = [
+        OrderList([(99.0, 1.0, 'Bid', 'coinmetro'), (100.0, 1.0, 'Ask', 'coinmetro')], 1000.0),
+        OrderList([(101.0, 1.0, 'Bid', 'kraken'), (102.0, 1.0, 'Ask', 'kraken')], 999.7),
+        OrderList([(103.0, 1.0, 'Bid', 'bitstamp'), (104.0, 1.0, 'Ask', 'bitstamp')], 999.4),
+    ]
+    guard = StalenessGuard(max_skew=0.5, clock=FakeClock(1000.0))
+    guarded = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, staleness_guard=guard)
+    unguarded = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False)
+
+    def fills(result):
+        return [(ask['Exchange'], ask['Price'], bid['Exchange'], bid['Price']) for ask, bid in zip(result[0][::2], result[0][1::2])]
+
+    # The Kraken levels stay in the book for the Kraken pairs, the Coinmetro ask is still not sold to the Bitstamp bid
+    assert ('coinmetro', 100.0, 'bitstamp', 103.0) in fills(unguarded.match(order_lists))
+    assert fills(guarded.match(order_lists)) == [('coinmetro', 100.0, 'kraken', 101.0)]
+    assert guard.metrics()['skewed_pairs'] == 1
+
+
+def test__l2_book_times():
+    clock = FakeClock(1000.0)
+    book = L2Book('kraken', clock=clock)
+    book.apply_snapshot([[100.0, 1.0]], [[101.0, 1.0]], timestamp=999.9)
+    clock.now = 1002.0
+    book.apply_update([[100.0, 2.0]], [])
+
+    orders = book.to_orders()
+    assert orders == [(100.0, 2.0, 'Bid', 'kraken'), (101.0, 1.0, 'Ask', 'kraken')]
+    # An update without a timestamp keeps the exchange time of the snapshot
+    assert (orders.received_at, orders.exchange_timestamp) == (1002.0, 999.9)
+
+
+def test__quiet_streamed_book_stays_fresh_on_heartbeats():
+    clock = FakeClock(1000.0)
+    kraken = L2Book('kraken', clock=clock)
+    kraken.apply_snapshot([[101.0, 1.0]], [[102.0, 1.0]])
+    orders = kraken.to_orders()
+    guard = StalenessGuard(max_age=2.0, max_skew=0.5, clock=clock)
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False, staleness_guard=guard)
+
+    assert pipeline.match([OrderList([(99.0, 1.0, 'Bid', 'coinmetro'), (100.0, 1.0, 'Ask', 'coinmetro')], 1000.0), orders]) is not None
+
+    # No message for three seconds, but the subscription sent heartbeats. The indexed book is reused with its new time,
+    # so the pair is not skewed either
+    clock.now = 1003.0
+    kraken.mark_alive()
+    coinmetro = OrderList([(99.0, 1.0, 'Bid', 'coinmetro'), (100.0, 1.0, 'Ask', 'coinmetro')], 1003.0)
+    matched_trades, matching_profit, venue_deltas = pipeline.match([coinmetro, kraken.to_orders()])
+    assert kraken.to_orders() is orders
+    assert matching_profit == pytest.approx(1.0)
+    assert guard.metrics()['skewed_pairs'] == 0
+
+    # Without heartbeats the book is stale
+    clock.now = 1005.5
+    assert pipeline.match([OrderList(coinmetro, 1005.5), kraken.to_orders()]) is None
+    assert guard.metrics()['stale_books'] == {'kraken': 1}
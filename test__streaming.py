@@ -0,0 +1,153 @@
+# test__streaming.py
+
+import random
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from streaming import L2Book, SequenceGapError, ReplayFeed, WebSocketFeed, StreamingOrderBooks, kraken_subscribe_message, parse_kraken_book_message
+
+
+def snapshot(sequence, bids, asks):
+    return {'type': 'snapshot', 'sequence': sequence, 'bids': bids, 'asks': asks}
+
+
+def update(sequence, bids=(), asks=()):
+    return {'type': 'update', 'sequence': sequence, 'bids': list(bids), 'asks': list(asks)}
+
+
+def test__l2book_applies_snapshot_and_updates():
+    book = L2Book('Kraken')
+    assert book.apply_snapshot([['100.0', '1.0'], ['99.0', '2.0']], [['101.0', '1.5']], sequence=1)
+
+    # A level below the top does not change the top of the book
+    assert not book.apply_update([['98.0', '1.0']], [], sequence=2)
+    # Removing the best bid does
+    assert book.apply_update([['100.0', '0']], [], sequence=3)
+    # Stale updates are ignored
+    assert not book.apply_update([['99.0', '0']], [], sequence=3)
+
+    assert book.to_orders() == [(99.0, 2.0, 'Bid', 'Kraken'), (98.0, 1.0, 'Bid', 'Kraken'), (101.0, 1.5, 'Ask', 'Kraken')]
+
+
+def test__l2book_gap_resets_book():
+    book = L2Book('Kraken')
+    book.apply_snapshot([[100.0, 1.0]], [[101.0, 1.0]], sequence=1)
+    with pytest.raises(SequenceGapError):
+        book.apply_update([[100.0, 2.0]], [], sequence=3)
+    assert not book.synced
+    with pytest.raises(SequenceGapError):
+        book.apply_update([[100.0, 2.0]], [], sequence=4)
+
+
+def test__l2book_update_without_sequence_keeps_gap_detection():
+    book = L2Book('Kraken')
+    book.apply_snapshot([[100.0, 1.0]], [[101.0, 1.0]], sequence=1)
+    assert book.apply_update([[100.5, 1.0]], [])
+    assert book.sequence == 1
+    book.apply_update([[100.0, 2.0]], [], sequence=2)
+    with pytest.raises(SequenceGapError):
+        book.apply_update([[100.0, 3.0]], [], sequence=4)
+
+
+def test__l2book_truncates_to_depth():
+    book = L2Book('Kraken', depth=2)
+    book.apply_snapshot([[100.0, 1.0], [99.0, 1.0], [98.0, 1.0]], [[101.0, 1.0], [102.0, 1.0], [103.0, 1.0]])
+    assert sorted(book.bids) == [99.0, 100.0]
+    assert sorted(book.asks) == [101.0, 102.0]
+
+
+def test__l2book_keeps_prices_sorted_through_updates():
+    rng = random.Random(0)
+    book = L2Book('Kraken', depth=15)
+    book.apply_snapshot([[100.0 - level, 1.0] for level in range(20)], [[101.0 + level, 1.0] for level in range(20)])
+    for _ in range(500):
+        # Random new, changed and removed levels on both sides
+        bids = [[round(rng.uniform(80, 100), 1), rng.choice([0, 0.5, 1.0])] for _ in range(3)]
+        asks = [[round(rng.uniform(101, 121), 1), rng.choice([0, 0.5, 1.0])] for _ in range(3)]
+        book.apply_update(bids, asks)
+        assert book.bid_prices == sorted(book.bids)
+        assert book.ask_prices == sorted(book.asks)
+        assert book.top[0] == max(book.bids, default=None)
+        assert book.top[2] == min(book.asks, default=None)
+    assert book.to_orders() == [(price, book.bids[price], 'Bid', 'Kraken') for price in sorted(book.bids, reverse=True)] + [(price, book.asks[price], 'Ask', 'Kraken') for price in sorted(book.asks)]
+
+
+def test__l2book_to_orders_same_list_until_next_message():
+    book = L2Book('Kraken')
+    book.apply_snapshot([[100.0, 1.0]], [[101.0, 1.0]])
+    orders = book.to_orders()
+    assert book.to_orders() is orders
+    book.apply_update([[100.0, 2.0]], [])
+    assert book.to_orders() is not orders
+    assert book.to_orders() == [(100.0, 2.0, 'Bid', 'Kraken'), (101.0, 1.0, 'Ask', 'Kraken')]
+
+
+@pytest.mark.asyncio
+async def test__streaming_order_books_resyncs_and_triggers():
+    kraken = ReplayFeed('Kraken', [
+        update(0, bids=[[100.0, 9.0]]),  # before the snapshot, ignored
+        snapshot(1, [[100.0, 1.0]], [[102.0, 1.0]]),
+        update(2, bids=[[100.5, 1.0]]),
+        update(5, bids=[[101.0, 1.0]]),  # gap
+        update(7, asks=[[101.5, 2.0]]),
+    ], resync_snapshots=[snapshot(6, [[100.2, 3.0]], [[102.0, 1.0]])])
+    coinmetro = ReplayFeed('Coinmetro', [snapshot(None, [[99.0, 1.0]], [[103.0, 1.0]])])
+
+    calls = []
+
+    async def on_top_change(order_lists):
+        calls.append(order_lists)
+
+    streaming_books = StreamingOrderBooks([kraken, coinmetro], on_top_change)
+    await streaming_books.run()
+
+    metrics = streaming_books.metrics()
+    assert metrics['messages'] == 6
+    assert metrics['gaps'] == 1
+    assert metrics['resyncs'] == 1
+    assert calls
+    assert metrics['triggers'] == len(calls)
+    kraken_orders, coinmetro_orders = calls[-1]
+    assert kraken_orders == [(100.2, 3.0, 'Bid', 'Kraken'), (101.5, 2.0, 'Ask', 'Kraken'), (102.0, 1.0, 'Ask', 'Kraken')]
+    assert coinmetro_orders == [(99.0, 1.0, 'Bid', 'Coinmetro'), (103.0, 1.0, 'Ask', 'Coinmetro')]
+
+
+def test__parse_kraken_book_message():
+    message = {'channel': 'book', 'type': 'update', 'data': [{'symbol': 'BTC/EUR', 'bids': [{'price': 23400.1, 'qty': 0.5}], 'asks': [], 'checksum': 1,
+                                                              'timestamp': '2023-12-12T10:00:00.250000Z'}]}
+    assert parse_kraken_book_message(message) == [{'type': 'update', 'sequence': None, 'timestamp': 1702375200.25, 'bids': [(23400.1, 0.5)], 'asks': []}]
+    assert parse_kraken_book_message({'channel': 'heartbeat'}) == [{'type': 'heartbeat'}]
+    assert parse_kraken_book_message({'channel': 'status', 'type': 'update'}) == []
+
+
+@pytest.mark.asyncio
+async def test__websocket_feed_subscribes_and_parses():
+    received = []
+
+    async def stream(request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        received.append(await websocket.receive_json())
+        await websocket.send_json({'channel': 'book', 'type': 'snapshot', 'data': [{'bids': [{'price': 100.0, 'qty': 1.0}], 'asks': [{'price': 101.0, 'qty': 1.0}]}]})
+        await websocket.send_json({'channel': 'book', 'type': 'update', 'data': [{'bids': [{'price': 100.0, 'qty': 0.0}], 'asks': []}]})
+        await websocket.close()
+        return websocket
+
+    app = web.Application()
+    app.router.add_get('/ws', stream)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        feed = WebSocketFeed('Kraken', str(server.make_url('/ws')), [kraken_subscribe_message('BTC/EUR', 10)], parse_kraken_book_message, reconnect_delay=0)
+        messages = []
+        async for message in feed.messages():
+            messages.append(message)
+            if message['type'] == 'reset':
+                break
+    finally:
+        await server.close()
+
+    assert received == [kraken_subscribe_message('BTC/EUR', 10)]
+    assert [message['type'] for message in messages] == ['snapshot', 'update', 'reset']
+    assert messages[1]['bids'] == [(100.0, 0.0)]
@@ -0,0 +1,62 @@
+# test__symbol_shards.py
+
+import queue
+import threading
+import pytest
+from filled_orders_ledger import FilledOrdersLedger
+from persistence import JournalWriter
+from symbol_shards import shard_symbols, run_shard, SymbolShardCoordinator
+
+fee_table = {'coinmetro': (0.001, 0.001), 'kraken': (0.0024, 0.0024)}
+
+
+async def fake_order_lists(symbol, ccxt_venues, coinmetro_client, registry):
+    # Kraken asks below the Coinmetro bids for every symbol but XRP/EUR
+    price = {'BTC/EUR': 23400.0, 'ETH/EUR': 2100.0, 'XRP/EUR': 0.5}[symbol]
+    kraken_price = price * 0.99 if symbol != 'XRP/EUR' else price
+    return [
+        [(price * 0.999, 1.0, 'Bid', 'coinmetro'), (price * 1.001, 1.0, 'Ask', 'coinmetro')],
+        [(kraken_price * 0.999, 1.0, 'Bid', 'kraken'), (kraken_price * 1.001, 0.5, 'Ask', 'kraken')],
+    ]
+
+
+def test__shard_symbols():
+    assert shard_symbols(['a', 'b', 'c', 'd', 'e'], 2) == [['a', 'c', 'e'], ['b', 'd']]
+    assert shard_symbols(['a'], 8) == [['a']]
+
+
+def test__run_shard__puts_results_and_stop_marker():
+    results = queue.Queue()
+    ledgers = {'BTC/EUR': FilledOrdersLedger()}
+    run_shard(3, ['BTC/EUR', 'XRP/EUR'], ['kraken'], fee_table, ledgers, 0, results, threading.Event(), max_cycles=2, fetch_order_lists=fake_order_lists)
+
+    items = [results.get_nowait() for _ in range(results.qsize())]
+    # A fully filled order is treated as a new order when it shows up again, like in the single symbol loop
+    assert [item[0] for item in items] == ['BTC/EUR', 'BTC/EUR', None]
+    symbol, matched_trades, matching_profit, venue_deltas = items[0]
+    assert matching_profit > 0
+    assert venue_deltas['kraken'][0] == pytest.approx(0.5)
+    assert items[-1] == (None, 3, 4, 2)
+
+
+@pytest.mark.asyncio
+async def test__coordinator__saves_every_symbol(tmp_path):
+    writer = JournalWriter().start()
+    coordinator = SymbolShardCoordinator(['BTC/EUR', 'ETH/EUR', 'XRP/EUR'], ['kraken'], fee_table, 0, shard_count=2, writer=writer,
+                                         path=tmp_path, verbose=False, max_cycles=1, fetch_order_lists=fake_order_lists)
+    await coordinator.run()
+    await writer.close()
+
+    metrics = coordinator.metrics()
+    assert metrics['shards'] == 2
+    assert metrics['snapshots'] == 3
+    assert metrics['matches'] == 2
+    assert metrics['skipped'] == 1
+    assert metrics['total_profit']['XRP/EUR'] == 0
+
+    filled_orders, trades, venue_deltas = coordinator.journals['ETH/EUR']
+    assert filled_orders.file_path.name.endswith(' ETH-EUR matched_orders.csv')
+    assert trades.read()['Profit'].tolist() == [pytest.approx(metrics['total_profit']['ETH/EUR'])]
+    assert set(venue_deltas.read()['Exchange']) == {'kraken', 'coinmetro'}
+    assert coordinator.journals['BTC/EUR'][0].file_path.name.endswith(' matched_orders.csv')
+    assert not coordinator.journals['XRP/EUR'][0].exists()
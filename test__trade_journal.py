@@ -0,0 +1,92 @@
+# test__trade_journal.py
+
+import pandas as pd
+from trade_journal import TradeJournal, MATCHED_ORDERS_COLUMNS, TRADES_COLUMNS, matched_orders_journal, trades_journal, journal_file_name
+from day_state import RollingDayState
+from read_starting_info import initialize_matched_orders_today, initialize_trades_today
+
+matched_trades = [
+    {'Timestamp': '2023-12-12 12:00:00', 'Price': 23425.01, 'Quantity': 0.058, 'Ask/Bid': 'Ask', 'Exchange': 'kraken',
+     'Fee': 56.220024, 'Net Price': 23481.230024, 'Matched Quantity': 0.058, 'Remaining Quantity': 0.0},
+    {'Timestamp': '2023-12-12 12:00:00', 'Price': 23537.12, 'Quantity': 5.02312301, 'Ask/Bid': 'Bid', 'Exchange': 'coinmetro',
+     'Fee': 23.53712, 'Net Price': 23513.58288, 'Matched Quantity': 0.058, 'Remaining Quantity': 4.96512301},
+]
+
+
+def test__append__writes_header_once(tmp_path):
+    journal = TradeJournal(tmp_path / 'journal.csv', MATCHED_ORDERS_COLUMNS)
+    assert journal.append(matched_trades[:1]) == 1
+    assert journal.append(matched_trades[1:]) == 1
+    assert journal.append([]) == 0
+
+    lines = journal.file_path.read_text().splitlines()
+    assert lines[0] == ','.join(MATCHED_ORDERS_COLUMNS)
+    assert len(lines) == 3
+
+
+def test__read__round_trips_floats(tmp_path):
+    journal = TradeJournal(tmp_path / 'journal.csv', MATCHED_ORDERS_COLUMNS)
+    journal.append(matched_trades)
+    pd.testing.assert_frame_equal(journal.read(), pd.DataFrame(matched_trades, columns=MATCHED_ORDERS_COLUMNS))
+
+
+def test__read__no_journal(tmp_path):
+    result = TradeJournal(tmp_path / 'journal.csv', TRADES_COLUMNS).read()
+    assert result.empty
+    assert result.columns.tolist() == TRADES_COLUMNS
+
+
+def test__export_excel(tmp_path):
+    journal = TradeJournal(tmp_path / 'journal.csv', TRADES_COLUMNS)
+    journal.append([['2023-12-12 12:00:00', 200.0, 2.5, 1000.0, 2.0, 600.0]])
+    excel_path = journal.export_excel()
+    assert excel_path == tmp_path / 'journal.xlsx'
+    assert pd.read_excel(excel_path)['Profit'].tolist() == [200.0]
+
+
+def test__initialize_from_journals(tmp_path):
+    matched_orders_journal(tmp_path).append(matched_trades)
+    trades_journal(tmp_path).append([['2023-12-12 12:00:00', 200.0, 2.5, 1000.0, 2.0, 600.0]])
+
+    assert initialize_matched_orders_today(str(tmp_path)).equals(pd.DataFrame(matched_trades, columns=MATCHED_ORDERS_COLUMNS))
+    assert initialize_trades_today(str(tmp_path))['Profit'].tolist() == [200.0]
+
+
+def test__import_excel(tmp_path):
+    journal = TradeJournal(tmp_path / 'journal.csv', TRADES_COLUMNS)
+    pd.DataFrame([['2023-12-12 12:00:00', 200.0, 2.5, 1000.0, 2.0, 600.0]], columns=TRADES_COLUMNS).to_excel(tmp_path / 'journal.xlsx', index=False)
+
+    assert journal.import_excel() == 1
+    # The journal exists now, the rows are not copied twice
+    assert journal.import_excel() == 0
+    journal.append([['2023-12-12 13:00:00', 50.0, 0.5, 200.0, 0.4, 120.0]])
+    assert pd.read_excel(journal.export_excel())['Profit'].tolist() == [200.0, 50.0]
+    assert TradeJournal(tmp_path / 'other.csv', TRADES_COLUMNS).import_excel() == 0
+
+
+def test__day_state__takes_over_excel_files_of_the_day(tmp_path):
+    # Excel files of the day saved before the journals
+    pd.DataFrame(matched_trades[:1], columns=MATCHED_ORDERS_COLUMNS).to_excel(matched_orders_journal(tmp_path).file_path.with_suffix('.xlsx'), index=False)
+    pd.DataFrame([['2023-12-12 12:00:00', 200.0, 2.5, 1000.0, 2.0, 600.0]], columns=TRADES_COLUMNS).to_excel(trades_journal(tmp_path).file_path.with_suffix('.xlsx'), index=False)
+
+    filled_orders, trades, venue_deltas = RollingDayState(tmp_path).journals
+
+    assert filled_orders.read()['Price'].tolist() == [23425.01]
+    assert trades.read()['Profit'].tolist() == [200.0]
+    assert not venue_deltas.exists()
+    assert initialize_matched_orders_today(str(tmp_path))['Price'].tolist() == [23425.01]
+    # Exporting at the end of the day overwrites the Excel files, the earlier rows are still in them
+    filled_orders.append(matched_trades[1:])
+    assert pd.read_excel(filled_orders.export_excel())['Price'].tolist() == [23425.01, 23537.12]
+    assert pd.read_excel(trades.export_excel())['Profit'].tolist() == [200.0]
+
+
+def test__journal_file_name__per_symbol(tmp_path):
+    assert journal_file_name('2023-12-12', None, 'trades.csv') == '2023-12-12 trades.csv'
+    assert journal_file_name('2023-12-12', 'BTC/EUR', 'trades.csv') == '2023-12-12 trades.csv'
+    assert journal_file_name('2023-12-12', 'ETH/EUR', 'trades.csv') == '2023-12-12 ETH-EUR trades.csv'
+
+    matched_orders_journal(tmp_path, symbol='ETH/EUR').append(matched_trades)
+    assert len(initialize_matched_orders_today(tmp_path, 'ETH/EUR')) == len(matched_trades)
+    assert initialize_matched_orders_today(tmp_path).empty
+    assert initialize_matched_orders_today(tmp_path, 'XRP/EUR').empty
@@ -13,6 +13,19 @@ def test_valid_input():
     assert result == (0.001, 0.0024, 3)
 
 
+def test_fetched_fee():
+    with patch('builtins.input', side_effect=['3']):
+        result = get_user_input(0.16)
+    assert result == (0.001, 0.0016, 3)
+
+
+def test_interval_not_asked():
+    # The scheduled mode does not use the interval, so nothing is prompted
+    with patch('builtins.input', side_effect=AssertionError("input() called")):
+        result = get_user_input(0.16, ask_interval=False)
+    assert result == (0.001, 0.0016, None)
+
+
 def test_invalid_input():
     # Use itertools.cycle to create an infinite iterator that repeats the input values
     input_values = itertools.cycle(['invalid', 'invalid', 'invalid'])
@@ -0,0 +1,163 @@
+# test__venue_books.py
+
+import numpy as np
+import pytest
+from order_book import OrderBook
+from orderbook_preparation import calculate_fees, clean_order_book
+from matching_engine import match_orders, match_orders_by_venue, kraken_coinmetro_quantities
+from filled_orders_ledger import FilledOrdersLedger
+from pipeline import ArbitragePipeline
+from venue_books import VenueBooks, taker_fee_lookup, best_net_prices, tops_cross, sorted_side
+
+fee_table = {'coinmetro': (0.001, 0.001), 'kraken': (0.0024, 0.0024), 'bitstamp': (0.003, 0.003), 'bitvavo': (0.0025, 0.0025), 'binance': (0.001, 0.001)}
+
+
+def random_order_lists(seed, levels=20, venues=('coinmetro', 'kraken', 'bitstamp', 'bitvavo', 'binance')):
+    # Every exchange has its own mid price, so only some exchange pairs cross
+    rng = np.random.default_rng(seed)
+    order_lists = []
+    for exchange in venues:
+        mid = rng.uniform(23350, 23550)
+        bids = [(round(mid - rng.uniform(1, 60), 2), round(rng.uniform(0.001, 2.0), 8), 'Bid', exchange) for _ in range(levels)]
+        asks = [(round(mid + rng.uniform(1, 60), 2), round(rng.uniform(0.001, 2.0), 8), 'Ask', exchange) for _ in range(levels)]
+        order_lists.append(sorted(bids, reverse=True) + sorted(asks))
+    return order_lists
+
+
+def without_timestamps(matched_trades):
+    return [{key: value for key, value in trade.items() if key != 'Timestamp'} for trade in matched_trades]
+
+
+def test__crossing_pairs():
+    venue_books = VenueBooks({'a': (0, 0), 'b': (0, 0), 'c': (0, 0)})
+    venue_books.load([
+        [(100.0, 1.0, 'Bid', 'a'), (101.0, 1.0, 'Ask', 'a')],
+        [(102.0, 1.0, 'Bid', 'b'), (103.0, 1.0, 'Ask', 'b')],
+        [(99.0, 1.0, 'Bid', 'c'), (100.5, 1.0, 'Ask', 'c')],
+    ])
+    assert sorted(venue_books.crossing_pairs()) == [('a', 'b'), ('c', 'b')]
+
+    book = venue_books.crossing_book()
+    # Only the best bid of 'b' and the asks of 'a' and 'c' below it can be matched
+    assert sorted(zip(book.exchange_names().tolist(), book.price.tolist())) == [('a', 101.0), ('b', 102.0), ('c', 100.5)]
+
+
+@pytest.mark.parametrize("levels", [
+    [(100.0, 1.0, 'Bid', 'a'), (99.0, 2.0, 'Bid', 'a'), (98.0, 3.0, 'Bid', 'a')],
+    [(98.0, 3.0, 'Bid', 'a'), (99.0, 2.0, 'Bid', 'a'), (100.0, 1.0, 'Bid', 'a')],
+    [(99.0, 2.0, 'Bid', 'a'), (100.0, 1.0, 'Bid', 'a'), (99.0, 4.0, 'Bid', 'a'), (98.0, 3.0, 'Bid', 'a')],
+    [(100.0, 1.0, 'Bid', 'a')],
+    [],
+])
+def test__sorted_side__same_as_sorting(levels):
+    book = calculate_fees(OrderBook.from_orders(levels + [(101.0, 1.0, 'Ask', 'a')]), fee_table={'a': (0.001, 0.001)}, sort=False)
+    side = sorted_side(book, 1)
+    expected = calculate_fees(OrderBook.from_orders(levels + [(101.0, 1.0, 'Ask', 'a')]), fee_table={'a': (0.001, 0.001)})
+    expected = expected.take((expected.side == 1).nonzero()[0])
+    assert side.net_price.tolist() == expected.net_price.tolist()
+    assert side.quantity.tolist() == expected.quantity.tolist()
+
+
+def test__load__indexes_only_new_order_lists():
+    order_lists = random_order_lists(0, venues=('coinmetro', 'kraken', 'bitstamp'))
+    venue_books = VenueBooks(fee_table)
+    venue_books.load(order_lists)
+    kraken_asks = venue_books.asks['kraken']
+
+    # The same Kraken list is not indexed again, a new Coinmetro list is, and Bitstamp is gone
+    coinmetro_orders = list(order_lists[0])
+    venue_books.load([coinmetro_orders, order_lists[1]])
+    assert venue_books.asks['kraken'] is kraken_asks
+    assert venue_books.sources['coinmetro'] is coinmetro_orders
+    assert sorted(venue_books.asks) == ['coinmetro', 'kraken']
+    assert 'bitstamp' not in venue_books.best_bid
+
+
+def test__no_crossing_pairs(capsys):
+    venue_books = VenueBooks(fee_table)
+    venue_books.load([[(100.0, 1.0, 'Bid', 'kraken'), (101.0, 1.0, 'Ask', 'kraken')], [(100.5, 1.0, 'Bid', 'bitstamp')], []])
+    assert venue_books.crossing_pairs() == []
+    assert venue_books.crossing_book().empty
+    assert "No arbitrage opportunities" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test__crossing_book__same_matches_as_combined_book(seed):
+    order_lists = random_order_lists(seed)
+
+    combined_book = clean_order_book(calculate_fees(OrderBook.from_orders(*order_lists), fee_table=fee_table))
+    expected = match_orders_by_venue(combined_book)
+
+    venue_books = VenueBooks(fee_table)
+    venue_books.load(order_lists)
+    book = venue_books.crossing_book()
+    result = match_orders_by_venue(book)
+
+    assert len(book) <= len(combined_book)
+    assert without_timestamps(result[0]) == without_timestamps(expected[0])
+    assert result[1] == pytest.approx(expected[1])
+    assert result[2].keys() == expected[2].keys()
+    for exchange, quantities in expected[2].items():
+        assert result[2][exchange] == pytest.approx(quantities)
+
+
+def test__venue_deltas():
+    order_lists = random_order_lists(3)
+    venue_books = VenueBooks(fee_table)
+    venue_books.load(order_lists)
+    book = venue_books.crossing_book()
+    matched_trades, matching_profit, venue_deltas = match_orders_by_venue(book)
+
+    assert matched_trades
+    # BTC bought and sold cancel out, the EUR left over is the profit
+    assert sum(btc for btc, eur in venue_deltas.values()) == pytest.approx(0, abs=1e-9)
+    assert sum(eur for btc, eur in venue_deltas.values()) == pytest.approx(matching_profit)
+
+    book = venue_books.crossing_book()
+    assert match_orders(book)[2:] == kraken_coinmetro_quantities(venue_deltas)
+
+
+def test__tops_cross__same_as_crossing_pairs():
+    taker_fees = taker_fee_lookup(fee_table)
+    for seed in range(40):
+        order_lists = random_order_lists(seed, venues=('coinmetro', 'kraken', 'bitstamp')[:2 + seed % 2])
+        venue_books = VenueBooks(fee_table)
+        venue_books.load(order_lists)
+        best_bids, best_asks = best_net_prices(order_lists, taker_fees)
+
+        assert best_bids == venue_books.best_bid
+        assert best_asks == venue_books.best_ask
+        assert tops_cross(best_bids, best_asks) == bool(venue_books.crossing_pairs())
+
+
+def test__tops_cross__best_bid_and_ask_on_one_exchange():
+    # Kraken has both the best bid and the best ask, only the second best prices can cross
+    assert not tops_cross({'kraken': 105.0, 'bitstamp': 99.0}, {'kraken': 100.0, 'bitstamp': 106.0})
+    assert tops_cross({'kraken': 105.0, 'bitstamp': 101.0}, {'kraken': 100.0, 'bitstamp': 106.0})
+    assert tops_cross({'kraken': 105.0, 'bitstamp': 99.0}, {'kraken': 100.0, 'bitstamp': 104.0})
+    assert not tops_cross({'kraken': 105.0}, {'kraken': 100.0})
+
+
+def test__pipeline__skips_books_that_do_not_cross(capsys):
+    pipeline = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False)
+    crossing = 0
+    for seed in range(20):
+        crossing += pipeline.match(random_order_lists(seed)) is not None
+    assert pipeline.metrics()['snapshots'] == 20
+    assert pipeline.metrics()['skipped'] == 20 - crossing
+    assert capsys.readouterr().out == ""
+
+    with pytest.raises(ValueError):
+        pipeline.match([[(100.0, 1.0, 'Bid', 'unknown')]])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test__pipeline__order_books_same_result_as_order_lists(seed):
+    order_lists = random_order_lists(seed)
+    expected = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False).match(order_lists)
+    result = ArbitragePipeline(fee_table, FilledOrdersLedger(), verbose=False).match([OrderBook.from_orders(orders) for orders in order_lists])
+
+    assert (result is None) == (expected is None)
+    if expected is not None:
+        assert without_timestamps(result[0]) == without_timestamps(expected[0])
+        assert result[1] == pytest.approx(expected[1])
@@ -0,0 +1,161 @@
+"""
+trade_journal.py
+
+This module contains the append-only CSV journal where matched orders and trades of the day are saved.
+"""
+import csv
+from pathlib import Path
+
+import pandas as pd
+
+MATCHED_ORDERS_COLUMNS = ['Timestamp', 'Price', 'Quantity', 'Ask/Bid', 'Exchange', 'Fee', 'Net Price', 'Matched Quantity', 'Remaining Quantity']
+TRADES_COLUMNS = ['Timestamp', 'Profit', 'Kraken BTC', 'Kraken EUR', 'Coinmetro BTC', 'Coinmetro EUR']
+VENUE_DELTAS_COLUMNS = ['Timestamp', 'Exchange', 'BTC', 'EUR']
+
+# Journals of the default symbol keep their file names without the symbol
+DEFAULT_SYMBOL = 'BTC/EUR'
+
+
+class TradeJournal:
+    """
+    CSV file that only grows at the end. Saving a row costs the same however many rows the day already has.
+    """
+
+    def __init__(self, file_path, columns):
+        """
+        Parameters:
+        - file_path (str or Path): Path of the CSV file.
+        - columns (list): Column names, written as the header of a new file.
+        """
+        self.file_path = Path(file_path)
+        self.columns = list(columns)
+
+    def exists(self):
+        """
+        Returns:
+        - bool: True if the journal file has been created.
+        """
+        return self.file_path.is_file()
+
+    def append(self, rows):
+        """
+        Appends rows to the end of the journal, creating the file with a header if needed.
+
+        Parameters:
+        - rows (list): Rows as dictionaries keyed by column name or as lists in column order.
+
+        Returns:
+        - int: Number of rows written.
+        """
+        if not rows:
+            return 0
+        write_header = not self.exists() or self.file_path.stat().st_size == 0
+        with open(self.file_path, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if write_header:
+                writer.writerow(self.columns)
+            for row in rows:
+                writer.writerow([row.get(column) for column in self.columns] if isinstance(row, dict) else row)
+        return len(rows)
+
+    def read(self):
+        """
+        Reads the whole journal.
+
+        Returns:
+        - pd.DataFrame: Journal rows, an empty DataFrame with the journal columns if there is no journal yet.
+        """
+        if not self.exists() or self.file_path.stat().st_size == 0:
+            return pd.DataFrame(columns=self.columns)
+        return pd.read_csv(self.file_path)
+
+    def import_excel(self, excel_path=None):
+        """
+        Copies the rows of an Excel file saved before the journal into the journal, so that exporting the journal to
+        the same file keeps them. Nothing is copied once the journal file exists.
+
+        Parameters:
+        - excel_path (str or Path): Path of the Excel file. Defaults to the journal path with an .xlsx extension.
+
+        Returns:
+        - int: Number of rows copied.
+        """
+        excel_path = self.file_path.with_suffix('.xlsx') if excel_path is None else Path(excel_path)
+        if self.exists() or not excel_path.is_file():
+            return 0
+        rows = pd.read_excel(excel_path).to_dict('records')
+        # An empty Excel file still gets a journal, so it is not read again
+        with open(self.file_path, 'a', newline='') as file:
+            csv.writer(file).writerow(self.columns)
+        return self.append(rows)
+
+    def export_excel(self, excel_path=None):
+        """
+        Exports the journal to an Excel file, e.g. at the end of the day.
+
+        Parameters:
+        - excel_path (str or Path): Path of the Excel file. Defaults to the journal path with an .xlsx extension.
+
+        Returns:
+        - Path: Path of the Excel file.
+        """
+        excel_path = self.file_path.with_suffix('.xlsx') if excel_path is None else Path(excel_path)
+        self.read().to_excel(excel_path, index=False, float_format='%.16f')
+        return excel_path
+
+
+def journal_file_name(day, symbol, name):
+    """
+    Parameters:
+    - day (str): Day of the journal as YYYY-MM-DD.
+    - symbol (str): Trading symbol of the journal, None for the default symbol.
+    - name (str): File name of the journal after the day (e.g., 'trades.csv').
+
+    Returns:
+    - str: File name, e.g. '2023-12-12 trades.csv' or '2023-12-12 ETH-EUR trades.csv'.
+    """
+    if symbol is None or symbol == DEFAULT_SYMBOL:
+        return f"{day} {name}"
+    return f"{day} {symbol.replace('/', '-')} {name}"
+
+
+def matched_orders_journal(path="", day=None, symbol=None):
+    """
+    Parameters:
+    - path (str or Path): Directory of the journal.
+    - day (str): Day of the journal as YYYY-MM-DD. Defaults to today.
+    - symbol (str): Trading symbol of the journal (e.g., 'ETH/EUR'). Defaults to DEFAULT_SYMBOL.
+
+    Returns:
+    - TradeJournal: Journal of the matched orders of the day.
+    """
+    day = pd.Timestamp.now().strftime("%Y-%m-%d") if day is None else day
+    return TradeJournal(Path(path) / journal_file_name(day, symbol, 'matched_orders.csv'), MATCHED_ORDERS_COLUMNS)
+
+
+def trades_journal(path="", day=None, symbol=None):
+    """
+    Parameters:
+    - path (str or Path): Directory of the journal.
+    - day (str): Day of the journal as YYYY-MM-DD. Defaults to today.
+    - symbol (str): Trading symbol of the journal (e.g., 'ETH/EUR'). Defaults to DEFAULT_SYMBOL.
+
+    Returns:
+    - TradeJournal: Journal of the trades and profits of the day.
+    """
+    day = pd.Timestamp.now().strftime("%Y-%m-%d") if day is None else day
+    return TradeJournal(Path(path) / journal_file_name(day, symbol, 'trades.csv'), TRADES_COLUMNS)
+
+
+def venue_deltas_journal(path="", day=None, symbol=None):
+    """
+    Parameters:
+    - path (str or Path): Directory of the journal.
+    - day (str): Day of the journal as YYYY-MM-DD. Defaults to today.
+    - symbol (str): Trading symbol of the journal (e.g., 'ETH/EUR'). Defaults to DEFAULT_SYMBOL.
+
+    Returns:
+    - TradeJournal: Journal of the BTC and EUR quantities traded on every exchange, one row per exchange and match.
+    """
+    day = pd.Timestamp.now().strftime("%Y-%m-%d") if day is None else day
+    return TradeJournal(Path(path) / journal_file_name(day, symbol, 'venue_deltas.csv'), VENUE_DELTAS_COLUMNS)
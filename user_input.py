@@ -5,23 +5,32 @@ This is the file to ask user their input. Namely fee rates and the API speed lim
 """
 
 import time
-from read_starting_info import fetch_kraken_taker_fee
 
 MAX_ATTEMPTS = 3  # Set a maximum number of attempts
+DEFAULT_KRAKEN_TAKER_FEE = 0.24  # Kraken taker fee percentage used when it cannot be fetched
 
-def get_user_input():
+def get_user_input(kraken_taker_fee=None, ask_interval=True):
+    # kraken_taker_fee is the Kraken taker fee percentage fetched through the exchange registry, None if the fetch failed
+    # ask_interval is False when the run mode does not use the interval (scheduled), sleep_duration is then None
     attempts = 0
     while attempts < MAX_ATTEMPTS:
         try:
             #coinmetro_fee = float(input("Enter Coinmetro fee percentage (e.g., 0.1 for 0.1%): ")) / 100
             #kraken_fee = float(input("Enter Kraken fee percentage (e.g., 0.24 for 0.24%): ")) / 100
-            kraken_fee = fetch_kraken_taker_fee()
-            sleep_duration = int(input("Enter interval duration in seconds (recommended 3): "))
+            if kraken_taker_fee is None:
+                # The fetch failed, e.g. on a network error
+                print(f"Kraken taker fee unavailable, using the default of {DEFAULT_KRAKEN_TAKER_FEE} %")
+                kraken_taker_fee = DEFAULT_KRAKEN_TAKER_FEE
+            kraken_fee = kraken_taker_fee / 100  # Percentage to rate
+            sleep_duration = None
+            if ask_interval:
+                sleep_duration = int(input("Enter interval duration in seconds (recommended 3): "))
 
             coinmetro_fee = 0.1 / 100
             print(f"coinmetro_fee: {coinmetro_fee * 100} %")
             print(f"kraken_fee: {kraken_fee * 100} %")
-            print(f"sleep interval: {sleep_duration} s")
+            if sleep_duration is not None:
+                print(f"sleep interval: {sleep_duration} s")
             print("User input - OK\n")
 
             time.sleep(1)
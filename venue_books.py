@@ -0,0 +1,303 @@
+"""
+venue_books.py
+
+This module keeps the order book of every exchange apart, with an index of the best bid and ask net price of each
+exchange. Only exchange pairs whose tops cross are matched, and only with the levels that can cross.
+"""
+import numpy as np
+import pandas as pd
+
+from book_depth import aggregate_side
+from order_book import OrderBook, ASK, BID, order_list_exchange
+from orderbook_preparation import calculate_fees
+
+
+def taker_fee_lookup(fee_table):
+    """
+    Parameters:
+    - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+
+    Returns:
+    - dict: Taker fee rate by lowercase exchange name.
+    """
+    return {venue.lower(): taker_fee for venue, (maker_fee, taker_fee) in fee_table.items()}
+
+
+def sorted_positions(book, side):
+    """
+    Finds the levels of one side of an exchange order book in net price order.
+
+    Exchanges send their bids from the highest and their asks from the lowest price, and the net prices of one
+    exchange follow its prices, so a side is only reversed or taken as it is. Other sides are sorted.
+
+    Parameters:
+    - book (OrderBook): Order book of one exchange.
+    - side (int): Side code (ASK or BID).
+
+    Returns:
+    - np.ndarray: Positions of the levels of the side in ascending net price order.
+    """
+    positions = (book.side == side).nonzero()[0]
+    net_prices = book.net_price[positions]
+    falls = net_prices[1:] < net_prices[:-1]
+    if falls.all():
+        return positions[::-1]
+    if falls.any():
+        return positions[np.argsort(net_prices, kind='stable')]
+    return positions
+
+
+def sorted_side(book, side):
+    """
+    Parameters:
+    - book (OrderBook): Order book of one exchange with net prices, see calculate_fees.
+    - side (int): Side code (ASK or BID).
+
+    Returns:
+    - OrderBook: Copy of the levels of the side in ascending net price order, see sorted_positions.
+    """
+    return book.take(sorted_positions(book, side))
+
+
+def best_net_prices(order_lists, taker_fees):
+    """
+    Finds the fee-adjusted best bid and ask of every exchange straight from the fetched order lists, without
+    building an order book.
+
+    Parameters:
+    - order_lists (list): Order lists of the exchanges, tuples (price, quantity, ask/bid, exchange), or the OrderBook
+      of every exchange.
+    - taker_fees (dict): Taker fee rate by lowercase exchange name, see taker_fee_lookup.
+
+    Returns:
+    - tuple: Best bid net price and best ask net price by exchange, exchanges without bids or asks are left out.
+
+    Raises:
+    - ValueError: If an exchange is not in the fee table.
+    """
+    best_bids = {}
+    best_asks = {}
+    for orders in order_lists:
+        if not orders:
+            continue
+        exchange = order_list_exchange(orders)
+        if isinstance(orders, OrderBook):
+            # Only the extremes are turned into Python floats, deep books are not copied into lists
+            bid_prices = orders.price[orders.side == BID]
+            ask_prices = orders.price[orders.side == ASK]
+            bid_prices = [float(bid_prices.max())] if len(bid_prices) else []
+            ask_prices = [float(ask_prices.min())] if len(ask_prices) else []
+        else:
+            bid_prices = [float(price) for price, quantity, ask_bid, _ in orders if ask_bid == 'Bid']
+            ask_prices = [float(price) for price, quantity, ask_bid, _ in orders if ask_bid != 'Bid']
+        taker_fee = taker_fees.get(exchange.lower())
+        if taker_fee is None:
+            raise ValueError(f"No fees for exchanges {[exchange]}. Fee table has: {list(taker_fees)}")
+        # Same arithmetic as calculate_fees, so both agree on every net price
+        if bid_prices:
+            best_bid = max(bid_prices)
+            best_bids[exchange] = best_bid - taker_fee * best_bid
+        if ask_prices:
+            best_ask = min(ask_prices)
+            best_asks[exchange] = best_ask + taker_fee * best_ask
+    return best_bids, best_asks
+
+
+def tops_cross(best_bids, best_asks):
+    """
+    Parameters:
+    - best_bids (dict): Best bid net price by exchange.
+    - best_asks (dict): Best ask net price by exchange.
+
+    Returns:
+    - bool: True if the best bid of an exchange is above the best ask of another exchange.
+    """
+    if not best_bids or not best_asks:
+        return False
+    bid_exchange = max(best_bids, key=best_bids.get)
+    ask_exchange = min(best_asks, key=best_asks.get)
+    if bid_exchange != ask_exchange:
+        return best_bids[bid_exchange] > best_asks[ask_exchange]
+    # The best bid and ask are on the same exchange, compare each with the best of the other exchanges
+    other_asks = [net_price for exchange, net_price in best_asks.items() if exchange != bid_exchange]
+    other_bids = [net_price for exchange, net_price in best_bids.items() if exchange != ask_exchange]
+    return (bool(other_asks) and best_bids[bid_exchange] > min(other_asks)) or (bool(other_bids) and max(other_bids) > best_asks[ask_exchange])
+
+
+def print_no_opportunity(best_bids, best_asks):
+    """
+    Prints the spread between the best bid and the best ask of all exchanges.
+
+    Parameters:
+    - best_bids (dict): Best bid net price by exchange.
+    - best_asks (dict): Best ask net price by exchange.
+    """
+    highest_bid_net_price = max(best_bids.values(), default=np.nan)
+    lowest_ask_net_price = min(best_asks.values(), default=np.nan)
+    price_difference = round(highest_bid_net_price - lowest_ask_net_price, 3)
+    spread_percentage = round((price_difference/lowest_ask_net_price) * 100, 4)
+    timestamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"No arbitrage opportunities. Highest bid: {highest_bid_net_price}, lowest ask: {lowest_ask_net_price}, spread: {price_difference} EUR/BTC ({spread_percentage} %), {timestamp}")
+
+
+class VenueBooks:
+    """
+    Order books of any number of exchanges, each side sorted by net price, with the best bid and ask of every exchange.
+
+    The sides are kept in the order the exchanges send them, and the crossing book only merges the sorted sides.
+    """
+
+    def __init__(self, fee_table, verbose=True, price_buckets=None):
+        """
+        Parameters:
+        - fee_table (dict): Fee table mapping the exchange name to a (maker fee, taker fee) tuple.
+        - verbose (bool): Print the spread when there are no arbitrage opportunities.
+        - price_buckets (dict): Bucket size by exchange name. The sides of these exchanges are added up in price
+          buckets, see book_depth.aggregate_side.
+        """
+        self.fee_table = fee_table
+        self.verbose = verbose
+        self.price_buckets = price_buckets or {}
+        self.asks = {}
+        self.bids = {}
+        self.best_ask = {}
+        self.best_bid = {}
+        self.received_at = {}
+        self.exchange_timestamps = {}
+        self.sources = {}
+        # Asks and bids of the bucketed exchanges as they were sent, in ascending price order with net prices
+        self.bucketed_levels = {}
+
+    def __len__(self):
+        return len(self.asks)
+
+    def load(self, order_lists):
+        """
+        Replaces all order books. Order lists that are the very objects loaded last time, e.g. the unchanged books
+        of StreamingOrderBooks, are not indexed again, and exchanges without orders are removed.
+
+        Parameters:
+        - order_lists (list): Order lists of the exchanges, tuples (price, quantity, ask/bid, exchange), or the
+          OrderBook of every exchange.
+        """
+        loaded = set()
+        for orders in order_lists:
+            if orders:
+                exchange = order_list_exchange(orders)
+                loaded.add(exchange)
+                if self.sources.get(exchange) is not orders:
+                    self.update(exchange, orders)
+                else:
+                    # The book is unchanged, its time can be refreshed, see L2Book.mark_alive
+                    self.received_at[exchange] = getattr(orders, 'received_at', None)
+        for exchange in [exchange for exchange in self.sources if exchange not in loaded]:
+            self.remove(exchange)
+
+    def update(self, exchange, orders):
+        """
+        Replaces the order book of one exchange and its best bid and ask.
+
+        Parameters:
+        - exchange (str): Name of the exchange.
+        - orders (list or OrderBook): Orders of the exchange as tuples (price, quantity, ask/bid, exchange), or its
+          order book. The times of the book are kept.
+        """
+        self.sources[exchange] = orders
+        self.received_at[exchange] = getattr(orders, 'received_at', None)
+        self.exchange_timestamps[exchange] = getattr(orders, 'exchange_timestamp', None)
+        book = orders if isinstance(orders, OrderBook) else OrderBook.from_orders(orders)
+        bucket_size = self.price_buckets.get(exchange)
+        if bucket_size is None:
+            book = calculate_fees(book, fee_table=self.fee_table, sort=False)
+            asks = sorted_side(book, ASK)
+            bids = sorted_side(book, BID)
+            self.bucketed_levels.pop(exchange, None)
+        else:
+            # The net prices of one exchange follow its prices, so the sides are sorted before the fees are known
+            ask_positions = sorted_positions(book, ASK)
+            bid_positions = sorted_positions(book, BID)
+            asks = calculate_fees(aggregate_side(book, ask_positions, bucket_size), fee_table=self.fee_table, sort=False)
+            bids = calculate_fees(aggregate_side(book, bid_positions, bucket_size), fee_table=self.fee_table, sort=False)
+            # The fills of a bucket are split over these levels, see book_depth.unbucket_trades
+            self.bucketed_levels[exchange] = (calculate_fees(book.take(ask_positions), fee_table=self.fee_table, sort=False),
+                                              calculate_fees(book.take(bid_positions), fee_table=self.fee_table, sort=False))
+        self.asks[exchange] = asks
+        self.bids[exchange] = bids
+
+        # Sides are sorted by net price, the best ask is the first and the best bid the last level
+        if len(asks):
+            self.best_ask[exchange] = asks.net_price[0]
+        else:
+            self.best_ask.pop(exchange, None)
+        if len(bids):
+            self.best_bid[exchange] = bids.net_price[-1]
+        else:
+            self.best_bid.pop(exchange, None)
+
+    def remove(self, exchange):
+        """
+        Removes the order book of an exchange, e.g. when it is out of sync.
+        """
+        for index in (self.asks, self.bids, self.best_ask, self.best_bid, self.received_at, self.exchange_timestamps, self.sources, self.bucketed_levels):
+            index.pop(exchange, None)
+
+    def crossing_pairs(self):
+        """
+        Finds the exchange pairs where the best bid of one exchange is above the best ask of another.
+
+        Returns:
+        - list: Pairs as tuples (ask exchange, bid exchange).
+        """
+        if not self.best_ask or not self.best_bid:
+            return []
+        ask_exchanges = list(self.best_ask)
+        ask_tops = np.fromiter(self.best_ask.values(), dtype=np.float64, count=len(ask_exchanges))
+        order = np.argsort(ask_tops, kind='stable')
+        sorted_ask_tops = ask_tops[order]
+
+        pairs = []
+        for bid_exchange, bid_top in self.best_bid.items():
+            # The exchanges with a best ask below this best bid are a prefix of the sorted best asks
+            for position in order[:np.searchsorted(sorted_ask_tops, bid_top, side='left')]:
+                ask_exchange = ask_exchanges[position]
+                if ask_exchange != bid_exchange:
+                    pairs.append((ask_exchange, bid_exchange))
+        return pairs
+
+    def crossing_book(self, pairs=None):
+        """
+        Combines the levels of the crossing exchange pairs that can be matched into one order book.
+
+        An ask can only be matched below the best bid of its partner exchanges and a bid only above their best ask,
+        the other levels are left out. If no pair crosses, the spread is printed when verbose.
+
+        Parameters:
+        - pairs (list): Pairs to combine as tuples (ask exchange, bid exchange). Defaults to all crossing pairs.
+
+        Returns:
+        - OrderBook: Order book sorted by net price, empty if there are no arbitrage opportunities.
+        """
+        if pairs is None:
+            pairs = self.crossing_pairs()
+        if not pairs:
+            if self.verbose:
+                print_no_opportunity(self.best_bid, self.best_ask)
+            return OrderBook.concatenate([])
+
+        ask_limits = {}
+        bid_limits = {}
+        for ask_exchange, bid_exchange in pairs:
+            ask_limits[ask_exchange] = max(ask_limits.get(ask_exchange, -np.inf), self.best_bid[bid_exchange])
+            bid_limits[bid_exchange] = min(bid_limits.get(bid_exchange, np.inf), self.best_ask[ask_exchange])
+
+        # Views of the crossing levels in exchange order, bids before asks like the fetched order lists
+        parts = []
+        for exchange in self.asks:
+            if exchange in bid_limits:
+                bids = self.bids[exchange]
+                parts.append(bids.view(np.searchsorted(bids.net_price, bid_limits[exchange], side='right'), len(bids)))
+            if exchange in ask_limits:
+                asks = self.asks[exchange]
+                parts.append(asks.view(0, np.searchsorted(asks.net_price, ask_limits[exchange], side='left')))
+        # The parts are sorted runs, the stable sort of NumPy (a timsort) finds them and merges them in linear passes
+        return OrderBook.concatenate(parts).sort_by_net_price()